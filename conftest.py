@@ -0,0 +1,18 @@
+import pytest
+from django.core.cache import cache
+
+
+@pytest.fixture(autouse=True)
+def inline_background_work(settings):
+    """Фоновые пулы в тестах выключены: их потоки писали бы в тестовую
+    базу параллельно с самим тестом."""
+    settings.THUMBNAIL_WORKERS = 0
+    settings.DELETION_IN_BACKGROUND = False
+    settings.WRITE_QUEUE_BATCH = 0
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    """База откатывается после каждого теста, кэш лент - тоже: без
+    коммита on_commit не поменяет их поколения."""
+    cache.clear()
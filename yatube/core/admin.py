@@ -0,0 +1,91 @@
+from django import forms
+from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+
+# Больше любого символа в строке: term <= значение < term + PREFIX_END
+# - это все строки, начинающиеся с term.
+PREFIX_END = '\U0010ffff'
+
+
+def prefix_filter(field, term):
+    """Префиксный поиск диапазоном, который SQLite ведёт по индексу.
+
+    startswith в SQLite - это LIKE без учёта регистра, а такой LIKE
+    по обычному индексу не идёт, и таблица читается целиком.
+    """
+    return Q(**{f'{field}__gte': term, f'{field}__lt': term + PREFIX_END})
+
+
+class PrefixSearchMixin:
+    """search_fields вида '^поле' или '^связь__поле' ищутся по индексу.
+
+    Для связи сначала подбираются id связанных объектов, и условие
+    становится связь_id IN (...) - его SQLite тоже ведёт по индексу.
+    """
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        query = Q()
+        for field in self.get_search_fields(request):
+            path, __, name = field.lstrip('^').rpartition('__')
+            if not path:
+                query |= prefix_filter(name, term)
+                continue
+            related = queryset.model._meta.get_field(path).related_model
+            query |= Q(**{f'{path}__in': related._default_manager.filter(
+                prefix_filter(name, term)
+            ).values('pk')})
+        return queryset.filter(query), False
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """Фильтр по связи: поле с автокомплитом вместо списка всех
+    связанных объектов в боковой панели.
+
+    Подсказки отдаёт autocomplete_view админки связанной модели,
+    у неё должны быть search_fields.
+    """
+
+    template = 'admin/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin,
+                 field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        self.lookup_val = params.get(self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin,
+                         field_path)
+        self.form_field = forms.ModelChoiceField(
+            field.remote_field.model._default_manager.all(),
+            required=False,
+            widget=AutocompleteSelect(
+                field.remote_field, model_admin.admin_site
+            ),
+        )
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def widget(self):
+        return self.form_field.widget.render(
+            self.lookup_kwarg, self.lookup_val,
+            attrs={'id': f'filter_{self.lookup_kwarg}'},
+        )
+
+    def media(self):
+        return self.form_field.widget.media
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.lookup_val is None,
+            'query_string': changelist.get_query_string(
+                remove=[self.lookup_kwarg]
+            ),
+            'display': _('All'),
+        }
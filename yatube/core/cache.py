@@ -0,0 +1,438 @@
+"""Двухуровневый кэш: L1 в памяти процесса перед общим L2.
+
+L2 - любой кэш из CACHES с атомарным incr: memcached, файл или
+SQLiteCache ниже. Запись идёт в L2 и публикуется в журнал инвалидаций
+в том же L2; остальные процессы читают журнал не чаще
+INVALIDATION_INTERVAL секунд и выбрасывают из своего L1 изменённые
+ключи.
+"""
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import timing
+
+LOG_PREFIX = 'tiered-log:'
+# Счётчик журнала: incr выдаёт номер новой записи
+HEAD_KEY = 'tiered-log-head'
+# Номер выдан, а записи нет дольше этого - писатель упал, номер
+# пропускается
+LOG_GAP_TIMEOUT = 5
+# Столько записей журнала читается одним get_many
+LOG_WINDOW = 50
+LOG_TIMEOUT = 10 * 60
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class _Store:
+    """L1 одного процесса: общий для потоков, у каждого из которых
+    Django создаёт свой объект кэша."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.origin = uuid.uuid4().hex
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+        self.position = None
+        self.polled = 0
+        self.gap = None
+        self.stats = {'l1_hits': 0, 'l1_misses': 0, 'l2_hits': 0,
+                      'l2_misses': 0, 'invalidations': 0}
+
+
+def _store(name):
+    with _stores_lock:
+        store = _stores.get(name)
+        # После fork у дочернего процесса свой L1
+        if store is None or store.pid != os.getpid():
+            store = _stores[name] = _Store()
+        return store
+
+
+class TieredCache(BaseCache):
+    """OPTIONS: L2 - имя общего кэша в CACHES, MAX_ENTRIES - размер
+    LRU в процессе, L1_TIMEOUT - сколько L1 верит записи без L2,
+    INVALIDATION_INTERVAL - как часто читать журнал инвалидаций."""
+
+    def __init__(self, name, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._name = name
+        self._l2_alias = options['L2']
+        self._l1_timeout = options.get('L1_TIMEOUT', 300)
+        self._interval = options.get('INVALIDATION_INTERVAL', 1)
+
+    @property
+    def _l1(self):
+        return _store(self._name)
+
+    @property
+    def _l2(self):
+        return caches[self._l2_alias]
+
+    # L1
+
+    def _l1_get(self, store, key):
+        entry = store.entries.get(key)
+        if entry is None or entry[1] <= time.time():
+            store.entries.pop(key, None)
+            return None
+        store.entries.move_to_end(key)
+        return entry
+
+    def _l1_set(self, store, key, value, timeout):
+        expires = time.time() + self._l1_timeout
+        if timeout is not None:
+            expires = min(expires, timeout)
+        store.entries[key] = (pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                              expires)
+        store.entries.move_to_end(key)
+        while len(store.entries) > self._max_entries:
+            store.entries.popitem(last=False)
+
+    # Журнал инвалидаций
+
+    def _publish(self, store, keys):
+        l2 = self._l2
+        # incr атомарен и в memcached, и в SQLiteCache: номер достаётся
+        # одному писателю, запись - два обращения к L2.
+        try:
+            position = l2.incr(HEAD_KEY)
+        except ValueError:
+            l2.add(HEAD_KEY, 0, None)
+            position = l2.incr(HEAD_KEY)
+        l2.set(f'{LOG_PREFIX}{position}', (store.origin, list(keys)),
+               LOG_TIMEOUT)
+
+    def _read_log(self, store, position, now):
+        """Ключи из чужих записей журнала после position и новая позиция.
+
+        None вместо ключей - журнал потерян, L1 надо очистить.
+        """
+        l2 = self._l2
+        keys = []
+        while True:
+            numbers = range(position + 1, position + 1 + LOG_WINDOW)
+            found = l2.get_many([HEAD_KEY, *(f'{LOG_PREFIX}{n}'
+                                             for n in numbers)])
+            head = found.get(HEAD_KEY) or 0
+            if head < position:
+                # Счётчик журнала вытеснен или сброшен
+                return None, head
+            for number in numbers:
+                entry = found.get(f'{LOG_PREFIX}{number}')
+                if entry is None:
+                    if number > head:
+                        return keys, position
+                    # Номер выдан, запись вот-вот появится
+                    if store.gap is None or store.gap[0] != number:
+                        store.gap = (number, now)
+                    if now - store.gap[1] < LOG_GAP_TIMEOUT:
+                        return keys, position
+                else:
+                    origin, written = entry
+                    if origin != store.origin:
+                        keys.extend(written)
+                position = number
+
+    def _poll(self, store):
+        """Читает журнал вне store.lock: медленный L2 не задерживает
+        чтения L1 в других потоках."""
+        now = time.time()
+        with store.lock:
+            if now - store.polled < self._interval:
+                return
+            stale = now - store.polled > LOG_TIMEOUT / 2
+            store.polled = now
+            position = None if stale else store.position
+        if position is None:
+            # Журнал мог истечь: с L1 неизвестно что, начинаем заново
+            keys, position = None, self._l2.get(HEAD_KEY) or 0
+        else:
+            keys, position = self._read_log(store, position, now)
+        with store.lock:
+            if keys is None:
+                store.entries.clear()
+            else:
+                for key in keys:
+                    store.entries.pop(key, None)
+                store.stats['invalidations'] += len(keys)
+            store.position = position
+
+    # API кэша
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        made = {self.make_key(key, version): key for key in keys}
+        for key in made:
+            self.validate_key(key)
+        store = self._l1
+        found = {}
+        self._poll(store)
+        with store.lock:
+            for key, original in made.items():
+                entry = self._l1_get(store, key)
+                if entry is not None:
+                    found[original] = pickle.loads(entry[0])
+        store.stats['l1_hits'] += len(found)
+        store.stats['l1_misses'] += len(made) - len(found)
+        missing = [key for key, original in made.items()
+                   if original not in found]
+        if not missing:
+            timing.add(cache_hits=len(found))
+            return found
+        from_l2 = self._l2_get_many(missing)
+        store.stats['l2_hits'] += len(from_l2)
+        store.stats['l2_misses'] += len(missing) - len(from_l2)
+        timing.add(cache_hits=len(found) + len(from_l2),
+                   cache_misses=len(missing) - len(from_l2))
+        with store.lock:
+            for key, (value, expires) in from_l2.items():
+                self._l1_set(store, key, value, expires)
+                found[made[key]] = value
+        return found
+
+    def _l2_get_many(self, keys):
+        """{ключ: (значение, срок)}: L1 не держит запись дольше L2."""
+        l2 = self._l2
+        if hasattr(l2, 'get_many_expiring'):
+            return l2.get_many_expiring(keys)
+        # Срок не узнать (memcached): L1 держит не дольше L1_TIMEOUT
+        return {key: (value, None) for key, value in l2.get_many(keys).items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        made = {self.make_key(key, version): value
+                for key, value in data.items()}
+        for key in made:
+            self.validate_key(key)
+        self._l2.set_many(made, self._l2_timeout(timeout))
+        self._written(made, self.get_backend_timeout(timeout))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        made = self.make_key(key, version)
+        self.validate_key(made)
+        if not self._l2.add(made, value, self._l2_timeout(timeout)):
+            return False
+        self._written({made: value}, self.get_backend_timeout(timeout))
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        made = self.make_key(key, version)
+        self.validate_key(made)
+        value = self._l2.incr(made, delta)
+        # incr не меняет срок в L2, и L1 его не знает: следующее
+        # чтение возьмёт значение вместе со сроком из L2
+        self._dropped([made])
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        made = self.make_key(key, version)
+        self.validate_key(made)
+        touched = self._l2.touch(made, self._l2_timeout(timeout))
+        self._dropped([made])
+        return touched
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        made = [self.make_key(key, version) for key in keys]
+        for key in made:
+            self.validate_key(key)
+        self._l2.delete_many(made)
+        self._dropped(made)
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version) is not self
+
+    def clear(self):
+        self._l2.clear()
+        store = self._l1
+        with store.lock:
+            store.entries.clear()
+            store.position = None
+
+    def stats(self):
+        """Попадания и промахи по уровням в этом процессе."""
+        return dict(self._l1.stats)
+
+    def reset_stats(self):
+        stats = self._l1.stats
+        for name in stats:
+            stats[name] = 0
+
+    def _l2_timeout(self, timeout):
+        if timeout == DEFAULT_TIMEOUT:
+            return self.default_timeout
+        return timeout
+
+    def _written(self, made, expires):
+        store = self._l1
+        with store.lock:
+            for key, value in made.items():
+                self._l1_set(store, key, value, expires)
+        self._publish(store, made)
+
+    def _dropped(self, made):
+        store = self._l1
+        with store.lock:
+            for key in made:
+                store.entries.pop(key, None)
+        self._publish(store, made)
+
+
+class SQLiteCache(BaseCache):
+    """Общий кэш в файле SQLite - замена серверу для нескольких процессов
+    на одной машине. add и incr атомарны между процессами.
+
+    OPTIONS: CULL_EVERY - размер таблицы проверяется в среднем раз
+    на столько записей, а не COUNT(*) на каждой."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._cull_every = params.get('OPTIONS', {}).get('CULL_EVERY', 100)
+        self._path = location
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self._path, timeout=5,
+                                 isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, '
+                'value BLOB NOT NULL, expires REAL)'
+            )
+            self._local.db = db
+        return db
+
+    def _key(self, key, version):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        return key
+
+    def _alive(self):
+        return '(expires IS NULL OR expires > ?)', time.time()
+
+    def get(self, key, default=None, version=None):
+        alive, now = self._alive()
+        row = self._db.execute(
+            f'SELECT value FROM cache WHERE key = ? AND {alive}',
+            (self._key(key, version), now),
+        ).fetchone()
+        return default if row is None else pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        return {key: value for key, (value, _) in
+                self.get_many_expiring(keys, version).items()}
+
+    def get_many_expiring(self, keys, version=None):
+        """{ключ: (значение, срок)}, срок - time.time() или None."""
+        made = {self._key(key, version): key for key in keys}
+        if not made:
+            return {}
+        alive, now = self._alive()
+        rows = self._db.execute(
+            f'SELECT key, value, expires FROM cache WHERE key IN '
+            f'({", ".join("?" * len(made))}) AND {alive}',
+            (*made, now),
+        )
+        return {made[key]: (pickle.loads(value), expires)
+                for key, value, expires in rows}
+
+    def _write(self, verb, key, value, timeout, version):
+        return self._db.execute(
+            f'{verb} INTO cache (key, value, expires) VALUES (?, ?, ?)',
+            (self._key(key, version),
+             pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+             self.get_backend_timeout(timeout)),
+        ).rowcount
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._write('INSERT OR REPLACE', key, value, timeout, version)
+        self._cull()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        alive, now = self._alive()
+        self._db.execute(
+            f'DELETE FROM cache WHERE key = ? AND NOT {alive}',
+            (self._key(key, version), now),
+        )
+        return bool(self._write('INSERT OR IGNORE', key, value, timeout,
+                                version))
+
+    def incr(self, key, delta=1, version=None):
+        db = self._db
+        # BEGIN IMMEDIATE берёт блокировку записи до чтения значения
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            value = self.get(key, version=version)
+            if value is None:
+                raise ValueError(f"Key '{key}' not found")
+            value += delta
+            db.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                 self._key(key, version)),
+            )
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        alive, now = self._alive()
+        return bool(self._db.execute(
+            f'UPDATE cache SET expires = ? WHERE key = ? AND {alive}',
+            (self.get_backend_timeout(timeout),
+             self._key(key, version), now),
+        ).rowcount)
+
+    def delete(self, key, version=None):
+        self._db.execute('DELETE FROM cache WHERE key = ?',
+                         (self._key(key, version),))
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version) is not self
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединение живёт вместе с потоком, а не с запросом
+        pass
+
+    def _cull(self):
+        if random.random() * self._cull_every >= 1:
+            return
+        db = self._db
+        count, = db.execute('SELECT count(*) FROM cache').fetchone()
+        if count <= self._max_entries:
+            return
+        alive, now = self._alive()
+        db.execute(f'DELETE FROM cache WHERE NOT {alive}', (now,))
+        db.execute(
+            'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+            'ORDER BY expires IS NULL, expires LIMIT ?)',
+            (count // self._cull_frequency,),
+        )
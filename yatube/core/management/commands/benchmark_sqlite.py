@@ -0,0 +1,104 @@
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.sqlite import apply_pragmas
+
+ROWS = 10000
+
+
+def _connect(path, pragmas):
+    db = sqlite3.connect(path, timeout=5)
+    apply_pragmas(db, pragmas)
+    return db
+
+
+def _read(db):
+    db.execute(
+        'SELECT id, text FROM post ORDER BY id DESC LIMIT 10'
+    ).fetchall()
+
+
+def _write(db):
+    with db:
+        db.execute('INSERT INTO post (text) VALUES (?)', ('Комментарий',))
+
+
+def _worker(path, pragmas, persistent, write, deadline, results):
+    operation = _write if write else _read
+    done = locked = 0
+    db = _connect(path, pragmas) if persistent else None
+    while time.monotonic() < deadline:
+        # Без постоянного соединения - новое на каждый «запрос»
+        connection = db or _connect(path, pragmas)
+        try:
+            operation(connection)
+            done += 1
+        except sqlite3.OperationalError:
+            locked += 1
+        if db is None:
+            connection.close()
+    results.put((write, done, locked))
+
+
+def run(path, pragmas, persistent, readers, writers, seconds):
+    """{'reads': в секунду, 'writes': в секунду, 'locked': ошибок}."""
+    db = _connect(path, pragmas)
+    db.execute('DROP TABLE IF EXISTS post')
+    db.execute('CREATE TABLE post (id INTEGER PRIMARY KEY, text TEXT)')
+    with db:
+        db.executemany('INSERT INTO post (text) VALUES (?)',
+                       [('Пост',)] * ROWS)
+    db.close()
+    results = multiprocessing.Queue()
+    deadline = time.monotonic() + seconds
+    workers = [
+        multiprocessing.Process(target=_worker, args=(
+            path, pragmas, persistent, write, deadline, results,
+        ))
+        for write in [False] * readers + [True] * writers
+    ]
+    for process in workers:
+        process.start()
+    totals = {'reads': 0, 'writes': 0, 'locked': 0}
+    for _ in workers:
+        write, done, locked = results.get()
+        totals['writes' if write else 'reads'] += done
+        totals['locked'] += locked
+    for process in workers:
+        process.join()
+    totals['reads'] //= seconds
+    totals['writes'] //= seconds
+    return totals
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает чтение и запись в SQLite из нескольких процессов '
+            'с настройками по умолчанию и с SQLITE_PRAGMAS.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=int, default=3)
+
+    def handle(self, *args, **options):
+        configs = (
+            ('по умолчанию, соединение на запрос', {}, False),
+            ('SQLITE_PRAGMAS, постоянное соединение',
+             settings.SQLITE_PRAGMAS, True),
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for number, (title, pragmas, persistent) in enumerate(configs):
+                path = os.path.join(directory, f'bench{number}.sqlite3')
+                totals = run(path, pragmas, persistent, options['readers'],
+                             options['writers'], options['seconds'])
+                self.stdout.write(
+                    f'{title}: чтений {totals["reads"]}/с, '
+                    f'записей {totals["writes"]}/с, '
+                    f'«database is locked» {totals["locked"]}'
+                )
@@ -0,0 +1,153 @@
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+# Картинки постов и миниатюры sorl называются хэшем: по такому имени
+# содержимое не меняется никогда.
+HASHED_NAME = re.compile(r'^[0-9a-f]{32,}$')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def is_hashed(path):
+    stem = os.path.splitext(posixpath.basename(path))[0]
+    return bool(HASHED_NAME.match(stem))
+
+
+def _etag(path, stat):
+    if is_hashed(path):
+        return quote_etag(os.path.splitext(posixpath.basename(path))[0])
+    return quote_etag(f'{int(stat.st_mtime):x}-{stat.st_size:x}')
+
+
+def _cache_control(path):
+    if is_hashed(path):
+        return f'public, max-age={settings.MEDIA_MAX_AGE}, immutable'
+    return 'public, no-cache'
+
+
+def parse_range(header, size):
+    """(начало, конец включительно) из заголовка Range.
+
+    None - отдать файл целиком, ValueError - диапазон вне файла.
+    Несколько диапазонов сразу не поддерживаются: по RFC 7233 сервер
+    вправе отдать на такой запрос весь файл.
+    """
+    match = RANGE.match(header.replace(' ', ''))
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # bytes=-N - последние N байт
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _offload(path, name):
+    # Файл отдаёт фронтовой сервер, рабочий процесс WSGI сразу свободен
+    response = HttpResponse()
+    if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = (
+            settings.MEDIA_ACCEL_REDIRECT_PREFIX + name
+        )
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def _range_response(request, path, size, etag):
+    header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not header or (if_range and if_range != etag):
+        return None
+    try:
+        byte_range = parse_range(header, size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range is None:
+        return None
+    start, end = byte_range
+    response = StreamingHttpResponse(
+        _read_range(path, start, end - start + 1), status=206
+    )
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = end - start + 1
+    return response
+
+
+def _file_response(request, path, name, size, etag):
+    if settings.MEDIA_SENDFILE:
+        return _offload(path, name)
+    response = _range_response(request, path, size, etag)
+    if response is None:
+        # FileResponse отдаётся через wsgi.file_wrapper, то есть sendfile()
+        response = FileResponse(open(path, 'rb'))
+        response['Content-Length'] = size
+    return response
+
+
+@require_safe
+def serve(request, path):
+    """Отдаёт файл из MEDIA_ROOT с условными запросами и диапазонами.
+
+    Замена django.views.static.serve для боевой работы: при
+    MEDIA_SENDFILE саму передачу делает фронтовой сервер.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Файл вне MEDIA_ROOT')
+    if not os.path.isfile(full_path):
+        raise Http404('Нет такого файла')
+    stat = os.stat(full_path)
+    etag = _etag(path, stat)
+    headers = HttpResponse()
+    headers['ETag'] = etag
+    headers['Last-Modified'] = http_date(stat.st_mtime)
+    headers['Cache-Control'] = _cache_control(path)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime),
+        response=headers,
+    )
+    if response is headers:
+        response = _file_response(
+            request, full_path, path, stat.st_size, etag
+        )
+        content_type, encoding = mimetypes.guess_type(full_path)
+        response['Content-Type'] = content_type or 'application/octet-stream'
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Accept-Ranges'] = 'bytes'
+    for header in ('ETag', 'Last-Modified', 'Cache-Control'):
+        response[header] = headers[header]
+    return response
@@ -0,0 +1,88 @@
+"""Чтение с реплик, запись в основную базу.
+
+Реплики читаются только внутри запроса, который это разрешил, - см.
+ReplicaMiddleware. Фоновые потоки, команды и shell, а также запросы
+сразу после записи пользователя читают основную базу: реплика может
+ещё не получить только что записанное.
+"""
+import random
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Кука «читать с основной базы»: живёт REPLICA_STICKY_SECONDS после записи
+STICKY_COOKIE = 'use_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = threading.local()
+
+
+@contextmanager
+def replica_reads(allowed):
+    previous = getattr(_state, 'replicas', False)
+    _state.replicas = allowed
+    try:
+        yield
+    finally:
+        _state.replicas = previous
+
+
+def reading_replicas():
+    """Читает ли текущий запрос реплики, которые могут отставать."""
+    return bool(settings.DATABASE_REPLICAS) and getattr(
+        _state, 'replicas', False
+    )
+
+
+def note_write():
+    """Запрос записал в базу: до конца запроса и ещё
+    REPLICA_STICKY_SECONDS пользователь читает основную базу."""
+    _state.wrote = True
+    _state.replicas = False
+
+
+def writes_primary(view):
+    """view может писать в базу: читает основную, чтобы писать по
+    свежим данным. Куку ставит только сама запись, см. note_write."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        _state.replicas = False
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if (not replicas or not getattr(_state, 'replicas', False)
+                or model._meta.app_label not in settings.REPLICA_READ_APPS):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной базы, объекты из них совместимы
+        return True
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        read_only = (request.method in SAFE_METHODS
+                     and STICKY_COOKIE not in request.COOKIES)
+        _state.wrote = False
+        with replica_reads(read_only):
+            response = self.get_response(request)
+        if request.method not in SAFE_METHODS or _state.wrote:
+            response.set_cookie(
+                STICKY_COOKIE, '1',
+                max_age=settings.REPLICA_STICKY_SECONDS, httponly=True,
+            )
+        return response
@@ -0,0 +1,36 @@
+import re
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+
+
+def pragma_statements(pragmas):
+    """PRAGMA для словаря {имя: значение}, journal_mode - первым:
+    от режима журнала зависит, как применятся остальные."""
+    statements = []
+    for name, value in sorted(
+        pragmas.items(), key=lambda item: item[0] != 'journal_mode'
+    ):
+        if not PRAGMA_NAME.match(name):
+            raise ValueError(f'Недопустимое имя PRAGMA: {name}')
+        if not isinstance(value, int) and not PRAGMA_NAME.match(str(value)):
+            raise ValueError(f'Недопустимое значение PRAGMA {name}: {value}')
+        statements.append(f'PRAGMA {name} = {value}')
+    return statements
+
+
+def apply_pragmas(cursor, pragmas):
+    for statement in pragma_statements(pragmas):
+        cursor.execute(statement)
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    """Настраивает каждое новое соединение с SQLite по SQLITE_PRAGMAS."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, settings.SQLITE_PRAGMAS)
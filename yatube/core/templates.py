@@ -0,0 +1,19 @@
+from django.template.backends import django
+
+from . import timing
+
+
+class Template(django.Template):
+    def render(self, context=None, request=None):
+        with timing.measure('template_time'):
+            return super().render(context, request)
+
+
+class DjangoTemplates(django.DjangoTemplates):
+    """Шаблоны Django с замером отрисовки для core.timing."""
+
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
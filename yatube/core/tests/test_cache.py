@@ -0,0 +1,175 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from ..cache import HEAD_KEY, SQLiteCache, TieredCache
+
+TEMP_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SHARED = os.path.join(TEMP_DIR, 'cache.sqlite3')
+
+
+def worker(name, **options):
+    """Кэш отдельного рабочего процесса: свой L1, общий L2."""
+    return TieredCache(name, {'OPTIONS': {
+        'L2': 'shared_file', 'INVALIDATION_INTERVAL': 0, **options,
+    }})
+
+
+@override_settings(CACHES={
+    **settings.CACHES,
+    'shared_file': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': SHARED,
+    },
+})
+class TieredCacheTests(SimpleTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+    def setUp(self):
+        self.first = worker(f'first-{self.id()}')
+        self.second = worker(f'second-{self.id()}')
+        self.first.clear()
+
+    def test_writes_invalidate_other_workers(self):
+        """Запись в одном процессе выбрасывает ключ из L1 других."""
+        self.first.set('page', 'v1')
+        self.assertEqual(self.second.get('page'), 'v1')
+        self.first.set('page', 'v2')
+        self.assertEqual(self.second.get('page'), 'v2')
+        self.first.delete('page')
+        self.assertIsNone(self.second.get('page'))
+        self.first.set('counter', 1)
+        self.assertEqual(self.second.get('counter'), 1)
+        self.assertEqual(self.first.incr('counter'), 2)
+        self.assertEqual(self.second.get('counter'), 2)
+        self.assertGreater(self.second.stats()['invalidations'], 0)
+
+    def test_log_gap_is_skipped(self):
+        """Выданный номер без записи ждут, но недолго."""
+        self.first.set('page', 'v1')
+        self.assertEqual(self.second.get('page'), 'v1')
+        # Писатель получил номер и упал, не записав журнал
+        self.second._l2.incr(HEAD_KEY)
+        self.first.set('page', 'v2')
+        self.assertEqual(self.second.get('page'), 'v1')
+        with mock.patch('core.cache.LOG_GAP_TIMEOUT', 0):
+            self.assertEqual(self.second.get('page'), 'v2')
+
+    def test_log_is_read_outside_l1_lock(self):
+        """Пока журнал читается из L2, L1 доступен другим потокам."""
+        self.first.set('page', 'v1')
+        self.second.get('page')
+        store = self.second._l1
+        free = []
+        get_many = SQLiteCache.get_many
+
+        def probe(cache, keys, version=None):
+            thread = threading.Thread(target=lambda: free.append(
+                store.lock.acquire(timeout=1) and not store.lock.release()
+            ))
+            thread.start()
+            thread.join()
+            return get_many(cache, keys, version)
+
+        with mock.patch.object(SQLiteCache, 'get_many', probe):
+            self.second.get('page')
+        self.assertTrue(free)
+        self.assertTrue(all(free))
+
+    def test_stats_per_tier(self):
+        """Повторное чтение обслуживает L1, не трогая L2."""
+        self.first.set_many({'a': 1, 'b': 2})
+        self.second.reset_stats()
+        self.assertEqual(self.second.get_many(['a', 'b', 'c']),
+                         {'a': 1, 'b': 2})
+        self.assertEqual(self.second.get('a'), 1)
+        self.assertEqual(self.second.stats(), {
+            'l1_hits': 1, 'l1_misses': 3,
+            'l2_hits': 2, 'l2_misses': 1,
+            'invalidations': 0,
+        })
+
+    def test_l1_is_lru(self):
+        """L1 держит MAX_ENTRIES последних ключей."""
+        cache = worker(f'lru-{self.id()}', MAX_ENTRIES=2)
+        cache.set_many({'a': 1, 'b': 2})
+        cache.get('a')
+        cache.set('c', 3)
+        cache.reset_stats()
+        cache.get_many(['a', 'b', 'c'])
+        self.assertEqual(cache.stats()['l1_hits'], 2)
+        self.assertEqual(cache.stats()['l2_hits'], 1)
+
+    def test_values_are_copied(self):
+        """Изменение полученного объекта не меняет кэш."""
+        self.first.set('list', [1])
+        self.first.get('list').append(2)
+        self.assertEqual(self.first.get('list'), [1])
+
+    def test_add_and_expiry(self):
+        """add видит записи других процессов, истёкшее не отдаётся."""
+        self.assertTrue(self.first.add('key', 1))
+        self.assertFalse(self.second.add('key', 2))
+        self.first.set('gone', 1, timeout=0)
+        self.assertIsNone(self.second.get('gone'))
+        self.assertIsNone(self.first.get('gone'))
+
+    def test_l1_keeps_l2_expiry(self):
+        """Прочитанное из L2 живёт в L1 не дольше, чем в L2."""
+        self.first.set('short', 1, timeout=10)
+        self.assertEqual(self.second.get('short'), 1)
+        later = time.time() + 11
+        with mock.patch('core.cache.time.time', return_value=later):
+            self.assertIsNone(self.second.get('short'))
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(dir=settings.BASE_DIR),
+                                 'cache.sqlite3')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.path))
+        self.cache = SQLiteCache(self.path, {'OPTIONS': {
+            'MAX_ENTRIES': 10, 'CULL_EVERY': 1,
+        }})
+
+    def test_basic_operations(self):
+        """Файловый кэш ведёт себя как остальные бэкенды Django."""
+        cache = self.cache
+        cache.set('key', {'value': 1})
+        self.assertEqual(cache.get('key'), {'value': 1})
+        self.assertTrue(cache.add('new', 1))
+        self.assertFalse(cache.add('new', 2))
+        self.assertEqual(cache.incr('new', 5), 6)
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+        self.assertEqual(cache.get_many(['key', 'new', 'missing']),
+                         {'key': {'value': 1}, 'new': 6})
+        cache.set('short', 1, timeout=0)
+        self.assertFalse(cache.has_key('short'))
+        self.assertTrue(cache.add('short', 2))
+        cache.delete('key')
+        self.assertIsNone(cache.get('key'))
+
+    def test_shared_between_connections(self):
+        """Второе подключение к файлу видит те же данные."""
+        self.cache.set('key', 'value')
+        other = SQLiteCache(self.path, {})
+        self.assertEqual(other.get('key'), 'value')
+
+    def test_cull(self):
+        """Сверх MAX_ENTRIES старые записи вытесняются."""
+        for i in range(20):
+            self.cache.set(f'key{i}', i)
+        count, = self.cache._db.execute(
+            'SELECT count(*) FROM cache'
+        ).fetchone()
+        self.assertLessEqual(count, 11)
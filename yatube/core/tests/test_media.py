@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import Client, TestCase, override_settings
+from django.utils.http import http_date
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+HASHED = 'posts/' + 'ab' * 32 + '.jpg'
+LEGACY = 'posts/meme.jpg'
+CONTENT = bytes(range(256)) * 4
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'posts'), exist_ok=True)
+        for name in (HASHED, LEGACY):
+            with open(os.path.join(TEMP_MEDIA_ROOT, name), 'wb') as file:
+                file.write(CONTENT)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+
+    def get(self, name, **headers):
+        return self.client.get(settings.MEDIA_URL + name, **headers)
+
+    def test_hashed_file_is_cached_forever(self):
+        """Файл с хэшем в имени отдаётся с долгим Cache-Control."""
+        response = self.get(HASHED)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Content-Length'], str(len(CONTENT)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['ETag'], '"' + 'ab' * 32 + '"')
+        response.close()
+
+    def test_legacy_file_is_revalidated(self):
+        """Старое имя кэшируется только с перепроверкой."""
+        response = self.get(LEGACY)
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+        response.close()
+
+    def test_conditional_requests(self):
+        """If-None-Match и If-Modified-Since дают 304 с заголовками."""
+        etag = self.get(LEGACY)['ETag']
+        response = self.get(LEGACY, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('Cache-Control', response)
+        mtime = os.path.getmtime(os.path.join(TEMP_MEDIA_ROOT, LEGACY))
+        response = self.get(LEGACY, HTTP_IF_MODIFIED_SINCE=http_date(mtime))
+        self.assertEqual(response.status_code, 304)
+
+    def test_byte_ranges(self):
+        """Range отдаёт часть файла, вне файла - 416."""
+        cases = (
+            ('bytes=0-9', 0, 9),
+            ('bytes=1000-', 1000, 1023),
+            ('bytes=-4', 1020, 1023),
+            ('bytes=10-5000', 10, 1023),
+        )
+        for header, start, end in cases:
+            with self.subTest(header=header):
+                response = self.get(HASHED, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(
+                    b''.join(response.streaming_content),
+                    CONTENT[start:end + 1],
+                )
+                self.assertEqual(
+                    response['Content-Range'], f'bytes {start}-{end}/1024'
+                )
+        response = self.get(HASHED, HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_stale_if_range_returns_whole_file(self):
+        """Устаревший If-Range - файл целиком."""
+        response = self.get(HASHED, HTTP_RANGE='bytes=0-9',
+                            HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect')
+    def test_accel_redirect(self):
+        """С MEDIA_SENDFILE файл передаёт фронтовой сервер."""
+        response = self.get(HASHED)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         settings.MEDIA_ACCEL_REDIRECT_PREFIX + HASHED)
+        self.assertEqual(response.content, b'')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    @override_settings(MEDIA_SENDFILE='x-sendfile')
+    def test_sendfile(self):
+        """X-Sendfile получает полный путь к файлу."""
+        response = self.get(LEGACY)
+        self.assertEqual(response['X-Sendfile'],
+                         os.path.join(TEMP_MEDIA_ROOT, LEGACY))
+
+    def test_outside_media_root(self):
+        """Путь за пределы MEDIA_ROOT и каталоги не отдаются."""
+        for name in ('../manage.py', 'posts', 'posts/nope.jpg'):
+            with self.subTest(name=name):
+                self.assertEqual(self.get(name).status_code, 404)
@@ -0,0 +1,117 @@
+import copy
+import os
+import tempfile
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from posts import feed_cache
+from posts.models import Comment, Post, User
+
+from ..routers import STICKY_COOKIE
+
+REPLICA = 'replica'
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], REPLICA_STICKY_SECONDS=7)
+class PrimaryReplicaRouterTests(TransactionTestCase):
+    """Вторая база SQLite в файле - реплика, отстающая от основной."""
+
+    databases = {'default', REPLICA}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.databases[REPLICA] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(cls.directory.name, 'replica.sqlite3'),
+        }
+        call_command('migrate', database=REPLICA, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections.databases[REPLICA]
+        delattr(connections._connections, REPLICA)
+        cls.directory.cleanup()
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.post = Post.objects.create(author=self.user, text='С основной')
+        # Реплика ещё не получила последнюю правку текста
+        stale = copy.copy(self.post)
+        stale.text = 'С реплики'
+        User.objects.using(REPLICA).bulk_create([self.user])
+        Post.objects.using(REPLICA).bulk_create([stale])
+        self.url = reverse('posts:post_detail',
+                           kwargs={'post_id': self.post.id})
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_page_reads_replica(self):
+        """Страница поста читается с реплики."""
+        self.assertContains(Client().get(self.url), 'С реплики')
+        self.assertContains(self.client.get(self.url), 'С реплики')
+
+    def test_code_outside_requests_reads_primary(self):
+        """Вне запросов (фон, команды) - только основная база."""
+        self.assertEqual(Post.objects.get(pk=self.post.pk).text,
+                         'С основной')
+
+    def test_reads_stick_to_primary_after_write(self):
+        """После записи пользователь какое-то время читает основную
+        базу и видит своё."""
+        response = self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+            {'text': 'Свой комментарий'},
+        )
+        self.assertEqual(response.cookies[STICKY_COOKIE]['max-age'], 7)
+        self.assertTrue(Comment.objects.using('default').exists())
+        self.assertFalse(Comment.objects.using(REPLICA).exists())
+        response = self.client.get(self.url)
+        self.assertContains(response, 'С основной')
+        self.assertContains(response, 'Свой комментарий')
+        # Кука истекла - снова реплика
+        del self.client.cookies[STICKY_COOKIE]
+        self.assertContains(self.client.get(self.url), 'С реплики')
+
+    def test_follow_sticks_to_primary(self):
+        """Подписка - запрос GET, но тоже запись."""
+        author = User.objects.create_user(username='author')
+        response = self.client.get(reverse(
+            'posts:profile_follow', kwargs={'username': author.username}
+        ))
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertNotIn(STICKY_COOKIE, self.client.get(self.url).cookies)
+
+    def test_opening_a_form_does_not_stick(self):
+        """Кука ставится только записью, а не открытием формы."""
+        response = self.client.get(reverse('posts:post_create'))
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+        author = User.objects.create_user(username='author')
+        response = self.client.get(reverse(
+            'posts:profile_follow', kwargs={'username': author.username}
+        ))
+        self.assertEqual(response.cookies[STICKY_COOKIE]['max-age'], 7)
+
+    def test_lagging_replica_is_not_cached(self):
+        """Лента, прочитанная с отстающей реплики, не остаётся в кэше,
+        пока реплика не догонит основную базу."""
+        index = reverse('posts:index')
+        post = Post.objects.create(author=self.user, text='Новый пост')
+        self.assertNotContains(Client().get(index), 'Новый пост')
+        Post.objects.using(REPLICA).bulk_create([post])
+        self.assertContains(Client().get(index), 'Новый пост')
+        # Отставание позади: страница снова кэшируется
+        cache.delete_many([
+            feed_cache.BUMPED_PREFIX + namespace
+            for namespace in ('index', feed_cache.EVERYTHING)
+        ])
+        Client().get(index)
+        Post.objects.using(REPLICA).filter(pk=post.pk).update(text='Правка')
+        self.assertContains(Client().get(index), 'Новый пост')
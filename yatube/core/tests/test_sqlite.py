@@ -0,0 +1,46 @@
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from ..sqlite import pragma_statements
+
+
+class PragmaStatementsTests(SimpleTestCase):
+    def test_journal_mode_goes_first(self):
+        """Режим журнала ставится раньше остальных PRAGMA."""
+        self.assertEqual(
+            pragma_statements({'synchronous': 'normal',
+                               'journal_mode': 'wal', 'cache_size': -64}),
+            ['PRAGMA journal_mode = wal', 'PRAGMA synchronous = normal',
+             'PRAGMA cache_size = -64'],
+        )
+
+    def test_rejects_injection(self):
+        """В PRAGMA попадают только имена и числа."""
+        for pragmas in ({'journal_mode; DROP TABLE x': 'wal'},
+                        {'journal_mode': 'wal; DROP TABLE x'}):
+            with self.subTest(pragmas=pragmas):
+                with self.assertRaises(ValueError):
+                    pragma_statements(pragmas)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'PRAGMA из SQLite')
+class ConnectionTuningTests(TestCase):
+    def test_connection_is_tuned(self):
+        """Соединение Django получает SQLITE_PRAGMAS."""
+        with connection.cursor() as cursor:
+            for pragma, expected in (('synchronous', 1),
+                                     ('busy_timeout', 5000),
+                                     ('temp_store', 2)):
+                cursor.execute(f'PRAGMA {pragma}')
+                self.assertEqual(cursor.fetchone()[0], expected)
+
+    def test_benchmark_command(self):
+        """Бенчмарк печатает обе конфигурации."""
+        out = StringIO()
+        call_command('benchmark_sqlite', readers=1, writers=1, seconds=1,
+                     stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
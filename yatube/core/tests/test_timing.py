@@ -0,0 +1,99 @@
+import re
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts.models import Post, User
+
+from .. import timing
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def metrics(response):
+    """{метрика: (dur, desc)} из заголовка Server-Timing."""
+    found = {}
+    for part in response['Server-Timing'].split(', '):
+        name, *params = part.split(';')
+        params = dict(param.split('=', 1) for param in params)
+        found[name] = (params.get('dur'), params.get('desc', '').strip('"'))
+    return found
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class TimingMiddlewareTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        buffer = BytesIO()
+        Image.new('RGB', (200, 100), 'blue').save(buffer, 'JPEG')
+        cls.post = Post.objects.create(
+            author=cls.user, text='Тестовый пост',
+            image=SimpleUploadedFile('photo.jpg', buffer.getvalue(),
+                                     'image/jpeg'),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_server_timing_header(self):
+        """Server-Timing считает запросы, кэш, шаблоны и миниатюры."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        found = metrics(Client().get(url))
+        self.assertEqual(set(found), {'db', 'tpl', 'thumb', 'cache',
+                                      'total'})
+        self.assertRegex(found['db'][1], r'^[1-9]\d* queries$')
+        self.assertEqual(found['thumb'][1], '6 lookups')
+        self.assertGreater(float(found['tpl'][0]), 0)
+        self.assertGreaterEqual(float(found['total'][0]),
+                                float(found['tpl'][0]))
+        hits, misses = map(int, re.findall(r'\d+', found['cache'][1]))
+        self.assertGreater(misses, 0)
+        # Второй раз карточка поста берётся из кэша
+        hits_again, _ = map(int, re.findall(
+            r'\d+', metrics(Client().get(url))['cache'][1]
+        ))
+        self.assertGreater(hits_again, hits)
+
+    def test_log_line_names_view(self):
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            Client().get(reverse('posts:profile',
+                                 args=[self.user.username]))
+        record, = logs.records
+        self.assertEqual(record.view, 'posts:profile')
+        self.assertGreater(record.timing['sql_count'], 0)
+        self.assertIn('view=posts:profile method=GET status=200',
+                      record.getMessage())
+
+    @override_settings(SERVER_TIMING_HEADER=False)
+    def test_header_can_be_disabled(self):
+        response = Client().get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_measure_outside_request(self):
+        """Вне запроса замеры ничего не делают, вложенные не
+        считаются дважды."""
+        with timing.measure('template_time', thumbnail_lookups=1):
+            timing.add(sql_count=1)
+        self.assertIsNone(timing.current())
+        with timing.collect() as collected:
+            with timing.measure('template_time'):
+                with timing.measure('template_time', thumbnail_lookups=1):
+                    pass
+            User.objects.count()
+        self.assertEqual(collected['thumbnail_lookups'], 0)
+        self.assertEqual(collected['sql_count'], 1)
+        self.assertGreater(collected['template_time'], 0)
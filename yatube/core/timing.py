@@ -0,0 +1,131 @@
+"""Замеры запроса: SQL, кэш, шаблоны, миниатюры, общее время.
+
+Счётчики живут в thread-local на время запроса; вне запроса measure()
+и add() ничего не делают, так что код, который они размечают, можно
+звать откуда угодно. Итог уходит в заголовок Server-Timing и одной
+строкой в лог core.timing с именем view, например posts:profile.
+"""
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Метрика заголовка Server-Timing: (имя, поле времени, поле счётчика,
+# подпись счётчика)
+SERVER_TIMING = (
+    ('db', 'sql_time', 'sql_count', 'queries'),
+    ('tpl', 'template_time', None, None),
+    ('thumb', 'thumbnail_time', 'thumbnail_lookups', 'lookups'),
+)
+FIELDS = ('sql_count', 'sql_time', 'cache_hits', 'cache_misses',
+          'template_time', 'thumbnail_lookups', 'thumbnail_time')
+
+_state = threading.local()
+
+
+def current():
+    """Счётчики текущего запроса или None вне его."""
+    return getattr(_state, 'metrics', None)
+
+
+def add(**values):
+    metrics = current()
+    if metrics is not None:
+        for name, value in values.items():
+            metrics[name] += value
+
+
+@contextmanager
+def measure(field, **values):
+    """Добавляет к полю field время блока, к остальным - values.
+
+    Вложенный замер того же поля не считается второй раз: шаблон,
+    отрисованный внутри другого, уже входит в его время.
+    """
+    metrics = current()
+    if metrics is None or field in _state.active:
+        yield
+        return
+    _state.active.add(field)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _state.active.discard(field)
+        metrics[field] += time.perf_counter() - start
+        for name, value in values.items():
+            metrics[name] += value
+
+
+def _record_sql(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        add(sql_count=1, sql_time=time.perf_counter() - start)
+
+
+@contextmanager
+def collect():
+    """Собирает счётчики блока в thread-local, отдаёт их словарь."""
+    previous = current(), getattr(_state, 'active', set())
+    _state.metrics = metrics = dict.fromkeys(FIELDS, 0)
+    _state.active = set()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(_record_sql))
+            yield metrics
+    finally:
+        _state.metrics, _state.active = previous
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+def server_timing(metrics, total):
+    parts = []
+    for name, time_field, count_field, label in SERVER_TIMING:
+        part = f'{name};dur={_ms(metrics[time_field])}'
+        if count_field:
+            part += f';desc="{metrics[count_field]} {label}"'
+        parts.append(part)
+    parts.append(f'cache;desc="{metrics["cache_hits"]} hits/'
+                 f'{metrics["cache_misses"]} misses"')
+    parts.append(f'total;dur={_ms(total)}')
+    return ', '.join(parts)
+
+
+class TimingMiddleware:
+    """Замеряет запрос целиком, поэтому стоит первым в MIDDLEWARE."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with collect() as metrics:
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else '-'
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = server_timing(metrics, total)
+        logger.info(
+            'view=%s method=%s status=%s total_ms=%s sql=%s sql_ms=%s '
+            'cache_hits=%s cache_misses=%s template_ms=%s thumbnails=%s '
+            'thumbnail_ms=%s',
+            view, request.method, response.status_code, _ms(total),
+            metrics['sql_count'], _ms(metrics['sql_time']),
+            metrics['cache_hits'], metrics['cache_misses'],
+            _ms(metrics['template_time']), metrics['thumbnail_lookups'],
+            _ms(metrics['thumbnail_time']),
+            extra={'view': view, 'timing': {**metrics, 'total': total}},
+        )
+        return response
@@ -7,8 +7,9 @@ def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
 
 
-def csrf_failure(request, reason=''):
-    return render(request, 'core/403csrf.html')
+def csrf_failure(request, reason='', exception=None):
+    # Служит и handler403: тогда Django передаёт exception
+    return render(request, 'core/403csrf.html', status=403)
 
 
 def server_error(request):
@@ -1,9 +1,192 @@
-from django.contrib import admin
+import datetime
 
-from .models import Comment, Follow, Group, Post
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.db.models import Min, QuerySet
+from django.forms import BaseModelFormSet
+from django.utils import timezone
 
+from core.admin import AutocompleteFilter, PrefixSearchMixin
 
-class PostAdmin(admin.ModelAdmin):
+from . import deletion, search
+from .models import Comment, DeletionJob, Follow, Group, Post
+from .paginators import EstimatedCountPaginator
+
+DATE_KINDS = ('year', 'month', 'day')
+
+
+def _period_start(moment, kind):
+    day = timezone.localtime(moment).date()
+    if kind == 'year':
+        return day.replace(month=1, day=1)
+    if kind == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _next_period(day, kind):
+    if kind == 'year':
+        day = day.replace(year=day.year + 1)
+    elif kind == 'month':
+        day = (day.replace(day=28) + datetime.timedelta(days=4)).replace(
+            day=1
+        )
+    else:
+        day += datetime.timedelta(days=1)
+    moment = datetime.datetime.combine(day, datetime.time.min)
+    return timezone.make_aware(moment) if settings.USE_TZ else moment
+
+
+class IndexedDatesQuerySet(QuerySet):
+    """dates() для date_hierarchy прыжками по индексу поля.
+
+    Вместо DISTINCT по всей таблице - по одному MIN(поле) с условием
+    «не раньше начала следующего периода» на каждый найденный период.
+    """
+
+    def dates(self, field_name, kind, order='ASC'):
+        if kind not in DATE_KINDS:
+            return super().dates(field_name, kind, order)
+        queryset = self.order_by()
+        found = []
+        first = queryset.aggregate(first=Min(field_name))['first']
+        while first is not None:
+            found.append(_period_start(first, kind))
+            first = queryset.filter(**{
+                f'{field_name}__gte': _next_period(found[-1], kind)
+            }).aggregate(first=Min(field_name))['first']
+        return found[::-1] if order == 'DESC' else found
+
+
+class IndexedDatesChangeList(ChangeList):
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return IndexedDatesQuerySet(
+            queryset.model, query=queryset.query, using=queryset.db
+        )
+
+
+class LoadedAutocompleteSelect(AutocompleteSelect):
+    """Автокомплит, подписывающий выбранный вариант уже загруженным
+    объектом, а не запросом на каждую строку списка."""
+
+    loaded = ()
+
+    def optgroups(self, name, value, attr=None):
+        selected = {str(v) for v in value
+                    if str(v) not in self.choices.field.empty_values}
+        objects = [obj for obj in self.loaded if str(obj.pk) in selected]
+        if len(objects) != len(selected):
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        for obj in objects:
+            options.append(self.create_option(
+                name, obj.pk, self.choices.field.label_from_instance(obj),
+                selected, len(options),
+            ))
+        return [(None, options, 0)]
+
+
+class LoadedRelationsFormSet(BaseModelFormSet):
+    """Формы list_editable отдают виджетам связанные объекты,
+    загруженные list_select_related."""
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        for name, field in form.fields.items():
+            widget = getattr(field.widget, 'widget', field.widget)
+            if (isinstance(widget, LoadedAutocompleteSelect)
+                    and form.instance._meta.get_field(name).is_cached(
+                        form.instance)):
+                related = getattr(form.instance, name)
+                widget.loaded = () if related is None else (related,)
+        return form
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Список большой таблицы: без полного COUNT(*), с навигацией
+    по датам через индекс и без запросов на каждую строку."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return IndexedDatesChangeList
+
+    def get_changelist_formset(self, request, **kwargs):
+        kwargs.setdefault('formset', LoadedRelationsFormSet)
+        return super().get_changelist_formset(request, **kwargs)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.get_autocomplete_fields(request):
+            kwargs.setdefault('widget', LoadedAutocompleteSelect(
+                db_field.remote_field, self.admin_site,
+                using=kwargs.get('using'),
+            ))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class BackgroundDeletionMixin:
+    """Удаление из админки уходит в posts.deletion: в фоне, порциями.
+
+    Страница подтверждения не обходит все связанные строки, а вместо
+    delete_selected - действие «Удалить в фоне».
+    """
+
+    actions = ['delete_in_background']
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def delete_in_background(self, request, queryset):
+        objs = list(queryset)
+        perms_needed = self.get_deleted_objects(objs, request)[2]
+        if perms_needed:
+            self.message_user(
+                request,
+                'Нет прав на удаление: ' + ', '.join(sorted(perms_needed)),
+                messages.ERROR,
+            )
+            return
+        jobs = [deletion.schedule(obj) for obj in objs]
+        self.message_user(
+            request,
+            f'Поставлено на удаление: {len(jobs)}. '
+            'Ход удаления - в разделе «Удаления».',
+        )
+    delete_in_background.short_description = 'Удалить в фоне'
+    delete_in_background.allowed_permissions = ('delete',)
+
+    def get_deleted_objects(self, objs, request):
+        # Вместо списка всех связанных строк - только права на модели,
+        # из которых будет удалять фоновое удаление. Объекты одной
+        # модели, шаги у них одинаковые.
+        objs = list(objs)
+        perms_needed = set()
+        models = deletion.deleted_models(objs[0]) if objs else ()
+        for model in models:
+            model_admin = self.admin_site._registry.get(model)
+            if (model_admin is not None
+                    and not model_admin.has_delete_permission(request)):
+                perms_needed.add(model._meta.verbose_name)
+        return (
+            [str(obj) for obj in objs],
+            {self.opts.verbose_name_plural: len(objs)},
+            perms_needed,
+            [],
+        )
+
+    def delete_model(self, request, obj):
+        deletion.schedule(obj)
+
+
+class PostAdmin(BackgroundDeletionMixin, LargeTableAdmin):
     list_display = (
         'pk',
         'text',
@@ -12,12 +195,22 @@ class PostAdmin(admin.ModelAdmin):
         'group',
     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
+    raw_id_fields = ('author',)
+    autocomplete_fields = ('group',)
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # LIKE '%...%' по тексту читал бы всю таблицу, ищем по FTS5
+        if not search_term:
+            return queryset, False
+        return search.filter_posts(queryset, search_term), False
+
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdmin):
     list_display = (
         'pk',
         'text',
@@ -25,23 +218,59 @@ class CommentAdmin(admin.ModelAdmin):
         'author',
         'post',
     )
+    list_select_related = ('author', 'post')
+    raw_id_fields = ('author', 'post')
     search_fields = ('text',)
     list_filter = ('created',)
+    date_hierarchy = 'created'
+    ordering = ('-created', '-id')
     empty_value_display = '-пусто-'
 
 
-class FollowAdmin(admin.ModelAdmin):
+class GroupAdmin(BackgroundDeletionMixin, admin.ModelAdmin):
+    search_fields = ('title', 'slug')
+
+
+class FollowAdmin(PrefixSearchMixin, LargeTableAdmin):
     list_display = (
         'pk',
         'author',
         'user',
     )
-    search_fields = ('user',)
-    list_filter = ('user',)
+    list_select_related = ('author', 'user')
+    raw_id_fields = ('author', 'user')
+    search_fields = ('^user__username', '^author__username')
+    list_filter = (
+        ('user', AutocompleteFilter),
+        ('author', AutocompleteFilter),
+    )
     empty_value_display = '-пусто-'
 
 
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'description',
+        'state',
+        'progress_display',
+        'created',
+        'finished',
+    )
+    list_filter = ('state',)
+    readonly_fields = [field.name for field in DeletionJob._meta.fields]
+
+    def progress_display(self, job):
+        return f'{job.progress}% ({job.processed} из {job.total})'
+    progress_display.short_description = 'Ход'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 admin.site.register(Post, PostAdmin)
-admin.site.register(Group)
+admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
+admin.site.register(DeletionJob, DeletionJobAdmin)
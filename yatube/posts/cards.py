@@ -0,0 +1,49 @@
+from django.core.cache import cache
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import shards, thumbnails
+from .models import Post
+
+CARD_TEMPLATE = 'includes/div_post.html'
+CARD_TIMEOUT = 24 * 60 * 60
+
+
+def card_key(post, show_author, show_group):
+    # pub_date отличает пост от более позднего с тем же id,
+    # например после пересоздания базы при живом кэше.
+    return 'post_card:{}{}:{}:{}:{}'.format(
+        int(show_author), int(show_group),
+        post.pk, post.version, post.pub_date.timestamp(),
+    )
+
+
+def post_cards(posts, show_author=True, show_group=True):
+    """HTML карточек постов: все ключи одним get_many, дорисовываются
+    только отсутствующие в кэше."""
+    keys = [card_key(post, show_author, show_group) for post in posts]
+    cached = cache.get_many(keys)
+    thumbnails.attach_variants([
+        post for key, post in zip(keys, posts) if key not in cached
+    ])
+    rendered = {}
+    cards = []
+    for key, post in zip(keys, posts):
+        card = cached.get(key)
+        if card is None:
+            card = rendered[key] = render_to_string(CARD_TEMPLATE, {
+                'post': post,
+                'show_author': show_author,
+                'show_group': show_group,
+            })
+        cards.append(mark_safe(card))
+    if rendered:
+        cache.set_many(rendered, CARD_TIMEOUT)
+    return cards
+
+
+def bump_versions(**filters):
+    """Сбрасывает карточки постов, чьи связанные данные изменились."""
+    for posts in shards.each(Post.objects.filter(**filters)):
+        posts.update(version=F('version') + 1)
@@ -0,0 +1,41 @@
+from django.db.models import Q
+
+from . import shards
+from .models import Comment
+from .paginators import decode_key, encode_key
+
+COMMENTS_PER_PAGE = 20
+
+
+def comments_page(post_id, cursor=None, per_page=COMMENTS_PER_PAGE):
+    """Комментарии по порядку после курсора и курсор следующей порции."""
+    comments = Comment.objects.using(shards.for_post(post_id)).for_post(
+        post_id
+    )
+    key = decode_key(cursor) if cursor else None
+    if key is not None:
+        created, pk = key
+        comments = comments.filter(created__gte=created).filter(
+            Q(created__gt=created) | Q(pk__gt=pk)
+        )
+    comments = list(comments[:per_page + 1])
+    next_cursor = None
+    if len(comments) > per_page:
+        comments = comments[:per_page]
+        next_cursor = encode_key(comments[-1].created, comments[-1].pk)
+    return comments, next_cursor
+
+
+def page_cursor(comment, per_page=COMMENTS_PER_PAGE):
+    """Курсор порции, которая заканчивается этим комментарием."""
+    before = Comment.objects.using(
+        shards.for_post(comment.post_id)
+    ).filter(
+        post_id=comment.post_id, created__lte=comment.created
+    ).filter(
+        Q(created__lt=comment.created) | Q(pk__lt=comment.pk)
+    ).order_by('-created', '-id').values_list('created', 'pk')
+    found = before[per_page - 1:per_page]
+    if not found:
+        return None
+    return encode_key(*found[0])
@@ -0,0 +1,148 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from . import shards
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def _shift(queryset, **deltas):
+    return queryset.update(**{
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+    })
+
+
+def exact_user_counts(user_id):
+    return {
+        'posts_count': Post.objects.using(
+            shards.for_author(user_id)
+        ).filter(author_id=user_id).count(),
+        'followers_count': Follow.objects.filter(author_id=user_id).count(),
+        'following_count': Follow.objects.filter(user_id=user_id).count(),
+    }
+
+
+def user_stats(user):
+    """Счётчики пользователя; недостающая строка создаётся по данным."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        stats, _ = UserStats.objects.get_or_create(
+            user=user, defaults=exact_user_counts(user.pk)
+        )
+        return stats
+
+
+def shift_user(user_id, **deltas):
+    updated = _shift(UserStats.objects.filter(user_id=user_id), **deltas)
+    # Уменьшение без строки счётчиков пропускаем: пользователь
+    # может удаляться прямо сейчас, расхождение исправит reconcile.
+    if not updated and min(deltas.values()) > 0:
+        UserStats.objects.get_or_create(
+            user_id=user_id, defaults=exact_user_counts(user_id)
+        )
+
+
+def shift_group(group_id, delta):
+    if group_id is not None:
+        _shift(Group.objects.filter(pk=group_id), posts_count=delta)
+
+
+def shift_comments(post_id, delta):
+    _shift(Post.objects.using(shards.for_post(post_id)).filter(pk=post_id),
+           comments_count=delta)
+
+
+def _counts(source, fk, keys):
+    """{значение fk: число строк source} по всем шардам source."""
+    totals = Counter()
+    for queryset in shards.each(source.objects.filter(**{f'{fk}__in': keys})):
+        totals.update(dict(
+            queryset.order_by().values(fk).annotate(total=Count('pk'))
+            .values_list(fk, 'total')
+        ))
+    return totals
+
+
+def _reconcile(queryset, key, counters, chunk_size):
+    """Сверяет счётчики пачками по chunk_size строк в короткой транзакции.
+
+    counters: {поле счётчика: (модель-источник, имя FK в ней)}.
+    Возвращает число исправленных строк.
+    """
+    fixed = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic(using=queryset.db):
+            rows = list(
+                queryset.filter(pk__gt=last_pk).order_by('pk')[:chunk_size]
+            )
+            if not rows:
+                return fixed
+            last_pk = rows[-1].pk
+            keys = [getattr(row, key) for row in rows]
+            actual = {
+                field: _counts(source, fk, keys)
+                for field, (source, fk) in counters.items()
+            }
+            drifted = []
+            for row in rows:
+                expected = {
+                    field: actual[field].get(getattr(row, key), 0)
+                    for field in counters
+                }
+                if any(getattr(row, field) != value
+                       for field, value in expected.items()):
+                    for field, value in expected.items():
+                        setattr(row, field, value)
+                    drifted.append(row)
+            queryset.model.objects.db_manager(queryset.db).bulk_update(
+                drifted, list(counters)
+            )
+            fixed += len(drifted)
+
+
+def create_missing_stats(chunk_size):
+    created = 0
+    while True:
+        ids = list(User.objects.filter(stats__isnull=True).values_list(
+            'pk', flat=True
+        )[:chunk_size])
+        if not ids:
+            return created
+        UserStats.objects.bulk_create(
+            [UserStats(user_id=pk) for pk in ids], ignore_conflicts=True
+        )
+        created += len(ids)
+
+
+def reconcile_users(chunk_size, user_ids=None):
+    stats = UserStats.objects.all()
+    if user_ids is not None:
+        stats = stats.filter(user_id__in=user_ids)
+    return _reconcile(stats, 'user_id', {
+        'posts_count': (Post, 'author'),
+        'followers_count': (Follow, 'author'),
+        'following_count': (Follow, 'user'),
+    }, chunk_size)
+
+
+def reconcile_groups(chunk_size, group_ids=None):
+    groups = Group.objects.only('posts_count')
+    if group_ids is not None:
+        groups = groups.filter(pk__in=group_ids)
+    return _reconcile(groups, 'pk', {
+        'posts_count': (Post, 'group'),
+    }, chunk_size)
+
+
+def reconcile_posts(chunk_size):
+    return sum(
+        _reconcile(posts, 'pk', {
+            'comments_count': (Comment, 'post'),
+        }, chunk_size)
+        for posts in shards.each(Post.objects.only('comments_count'))
+    )
@@ -0,0 +1,182 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import shards
+from .models import (Comment, DeletionJob, FeedEntry, Follow, Group, Post,
+                     PostKey, User)
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _post_steps(pk):
+    shard = shards.for_post(pk)
+    return [
+        (Comment.objects.using(shard).filter(post_id=pk), None),
+        (FeedEntry.objects.filter(post_id=pk), None),
+        (Post.objects.using(shard).filter(pk=pk), None),
+        (PostKey.objects.filter(pk=pk), None),
+    ]
+
+
+def _user_steps(pk):
+    shard = shards.for_author(pk)
+    return [
+        (Comment.objects.using(shard).filter(post__author_id=pk), None),
+        (FeedEntry.objects.filter(author_id=pk), None),
+        (Post.objects.using(shard).filter(author_id=pk), None),
+        # Иначе ключи постов удалит CASCADE от автора одним запросом
+        (PostKey.objects.filter(author_id=pk), None),
+        # Комментарии к чужим постам - в шардах их авторов
+        *((comments, None) for comments in shards.each(
+            Comment.objects.filter(author_id=pk)
+        )),
+        (Follow.objects.filter(user_id=pk), None),
+        (Follow.objects.filter(author_id=pk), None),
+        (FeedEntry.objects.filter(user_id=pk), None),
+        (User.objects.filter(pk=pk), None),
+    ]
+
+
+def _group_steps(pk):
+    return [
+        # Версия поста - чтобы карточки перерисовались без группы
+        *((posts, {'group': None, 'version': F('version') + 1})
+          for posts in shards.each(Post.objects.filter(group_id=pk))),
+        (Group.objects.filter(pk=pk), None),
+    ]
+
+
+# Порядок шагов: сначала строки, на которые ссылаются другие строки
+# удаляемого, последним - сам объект. Его CASCADE к этому моменту
+# задевает только единичные строки вроде UserStats.
+STEPS = {
+    Post._meta.label_lower: _post_steps,
+    User._meta.label_lower: _user_steps,
+    Group._meta.label_lower: _group_steps,
+}
+
+
+def steps(target, object_id):
+    """[(queryset, изменения)]: None - удалить строки, словарь -
+    записать в них эти значения."""
+    return STEPS[target](object_id)
+
+
+def deleted_models(obj):
+    """Модели, строки которых удалит фоновое удаление obj."""
+    return {queryset.model for queryset, changes
+            in steps(obj._meta.label_lower, obj.pk) if changes is None}
+
+
+def _run_step(job_id, queryset, changes, batch_size):
+    model = queryset.model
+    queryset = queryset.order_by().values_list('pk', flat=True)
+    using = queryset.db
+    while True:
+        with transaction.atomic(using=using):
+            pks = list(queryset[:batch_size])
+            if not pks:
+                return
+            batch = model._default_manager.db_manager(using).filter(
+                pk__in=pks
+            )
+            if changes is None:
+                batch.delete()
+            else:
+                batch.update(**changes)
+            DeletionJob.objects.filter(pk=job_id).update(
+                processed=F('processed') + len(pks)
+            )
+
+
+def run(job_id):
+    """Выполняет удаление целиком, шаг за шагом, порциями.
+
+    Шаги заново выбирают оставшиеся строки, так что прерванное
+    удаление можно просто запустить ещё раз.
+    """
+    job = DeletionJob.objects.get(pk=job_id)
+    if job.state == DeletionJob.DONE:
+        return job
+    try:
+        job_steps = steps(job.target, job.object_id)
+        # Считается здесь, а не в запросе админки: COUNT по шагам -
+        # те же проходы по большим таблицам, что и само удаление
+        remaining = sum(queryset.count() for queryset, _ in job_steps)
+        DeletionJob.objects.filter(pk=job_id).update(
+            state=DeletionJob.RUNNING, error='',
+            total=F('processed') + remaining,
+        )
+        for queryset, changes in job_steps:
+            _run_step(job_id, queryset, changes,
+                      settings.DELETION_BATCH_SIZE)
+    except Exception as error:
+        logger.exception('Не удалось удалить %s', job.description)
+        DeletionJob.objects.filter(pk=job_id).update(
+            state=DeletionJob.FAILED, error=repr(error)
+        )
+    else:
+        DeletionJob.objects.filter(pk=job_id).update(
+            state=DeletionJob.DONE, finished=timezone.now()
+        )
+    job.refresh_from_db()
+    return job
+
+
+def _run(job_id):
+    try:
+        run(job_id)
+    finally:
+        connections.close_all()
+
+
+def _submit(job_id):
+    global _executor
+    if not settings.DELETION_IN_BACKGROUND:
+        run(job_id)
+        return
+    with _lock:
+        if _executor is None:
+            # Один поток: порции разных удалений не спорят за запись
+            _executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='deletion'
+            )
+    _executor.submit(_run, job_id)
+
+
+def schedule(obj):
+    """Ставит пользователя, пост или группу в очередь на удаление.
+
+    Сразу после коммита удаление начинается в фоновом потоке
+    (при DELETION_IN_BACKGROUND = False - в том же); ход виден
+    в DeletionJob, число строк фоновый поток считает первым делом.
+    """
+    target = obj._meta.label_lower
+    if target not in STEPS:
+        raise ValueError(f'Фоновое удаление {target} не поддерживается')
+    job = DeletionJob.objects.filter(
+        target=target, object_id=obj.pk,
+        state__in=(DeletionJob.QUEUED, DeletionJob.RUNNING),
+    ).first()
+    if job is not None:
+        return job
+    if isinstance(obj, User):
+        # Пока удаляется, войти под ним уже нельзя
+        User.objects.filter(pk=obj.pk).update(is_active=False)
+    job = DeletionJob.objects.create(
+        target=target,
+        object_id=obj.pk,
+        description=f'{obj._meta.verbose_name}: {obj}'[:200],
+    )
+    transaction.on_commit(partial(_submit, job.pk))
+    return job
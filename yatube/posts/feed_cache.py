@@ -0,0 +1,133 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.routers import reading_replicas
+
+from . import shards
+from .models import Group
+
+GENERATION_PREFIX = 'feed_gen:'
+PAGE_PREFIX = 'feed_page:'
+COUNT_PREFIX = 'feed_count:'
+# Лента недавно менялась: пока реплики могут отставать,
+# прочитанное с них не кэшируется.
+BUMPED_PREFIX = 'feed_bumped:'
+# Общее поколение для изменений, задевающих все ленты сразу:
+# переименование группы или автора.
+EVERYTHING = 'all'
+
+
+def _fresh_generation():
+    # После вытеснения счётчика из кэша поколение не должно
+    # начаться заново с уже использованного значения.
+    return int(time.time() * 1000)
+
+
+def generations(namespaces):
+    keys = [GENERATION_PREFIX + namespace for namespace in namespaces]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _fresh_generation(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def bump(*namespaces):
+    """Делает устаревшими закэшированные страницы этих лент."""
+    for namespace in namespaces:
+        key = GENERATION_PREFIX + namespace
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _fresh_generation(), None)
+    if settings.DATABASE_REPLICAS:
+        # Отставание реплик считаем не больше REPLICA_STICKY_SECONDS
+        cache.set_many(
+            {BUMPED_PREFIX + namespace: True for namespace in namespaces},
+            settings.REPLICA_STICKY_SECONDS,
+        )
+
+
+def cacheable(namespaces):
+    """Можно ли кэшировать ленты, прочитанные этим запросом.
+
+    Проверять до чтения ленты: реплика могла ещё не получить запись,
+    с которой началось уже прочитанное поколение.
+    """
+    return not reading_replicas() or not cache.get_many(
+        [BUMPED_PREFIX + namespace for namespace in namespaces]
+    )
+
+
+def post_namespaces(post, *group_ids):
+    """Ленты, в которых показан пост."""
+    namespaces = ['index', f'profile:{post.author.username}']
+    group_ids = [group_id for group_id in group_ids if group_id is not None]
+    if group_ids:
+        namespaces += [
+            f'group:{slug}' for slug in Group.objects.filter(
+                pk__in=group_ids
+            ).values_list('slug', flat=True)
+        ]
+    return namespaces
+
+
+def refresh_post(post, *group_ids):
+    """Сбрасывает ленты, в которых показан пост."""
+    bump(*post_namespaces(post, *group_ids))
+
+
+def cached_count(namespace, queryset, timeout=None):
+    """Число постов ленты, сбрасывается вместе с поколением ленты."""
+    generation, = generations([namespace])
+    key = f'{COUNT_PREFIX}{namespace}:{generation}'
+    count = cache.get(key)
+    if count is None:
+        store = cacheable([namespace])
+        count = shards.count(queryset)
+        if store:
+            cache.set(key, count, timeout or settings.FEED_CACHE_TIMEOUT)
+    return count
+
+
+def page_key(request, namespaces):
+    viewer = (f'user{request.user.pk}' if request.user.is_authenticated
+              else 'anon')
+    raw = '|'.join([
+        request.path,
+        request.GET.urlencode(),
+        viewer,
+        *(f'{namespace}={generation}' for namespace, generation in zip(
+            namespaces, generations(namespaces)
+        )),
+    ])
+    return PAGE_PREFIX + hashlib.md5(raw.encode()).hexdigest()
+
+
+def cache_feed(*namespaces):
+    """Кэширует страницу ленты до следующей записи в неё.
+
+    namespaces - шаблоны вида 'group:{slug}', подставляются
+    именованные аргументы вьюхи.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            feeds = [EVERYTHING] + [
+                namespace.format(**kwargs) for namespace in namespaces
+            ]
+            key = page_key(request, feeds)
+            response = cache.get(key)
+            if response is None:
+                store = cacheable(feeds)
+                response = view(request, *args, **kwargs)
+                if store and response.status_code == 200:
+                    cache.set(key, response, settings.FEED_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
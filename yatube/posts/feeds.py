@@ -0,0 +1,145 @@
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import FEED_FIELDS, FeedEntry, Follow, Post, UserStats
+from . import feed_cache, shards
+from .paginators import KeysetSource, MergedSource
+
+HEAVY_AUTHORS_KEY = 'feed:heavy_authors'
+HEAVY_AUTHORS_TIMEOUT = 5 * 60
+BATCH_SIZE = 500
+
+
+def heavy_authors():
+    """Авторы, чьи посты не раздаются подписчикам, а читаются при показе.
+
+    Для них запись в ленты всех подписчиков стоила бы слишком дорого.
+    """
+    authors = cache.get(HEAVY_AUTHORS_KEY)
+    if authors is None:
+        authors = frozenset(UserStats.objects.filter(
+            followers_count__gt=settings.FEED_FANOUT_LIMIT
+        ).values_list('user_id', flat=True))
+        cache.set(HEAVY_AUTHORS_KEY, authors, HEAVY_AUTHORS_TIMEOUT)
+    return authors
+
+
+def push_post(post):
+    """Раздаёт новый пост в ленты подписчиков автора."""
+    if post.author_id in heavy_authors():
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, post_id=post.pk,
+                   author_id=post.author_id, pub_date=post.pub_date)
+         for user_id in followers.iterator()),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту читателя последние посты автора."""
+    if author_id in heavy_authors():
+        return
+    posts = Post.objects.using(shards.for_author(author_id)).filter(
+        author_id=author_id
+    ).order_by('-pub_date', '-id').values_list(
+        'id', 'pub_date'
+    )[:settings.FEED_BACKFILL_SIZE]
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, post_id=post_id, author_id=author_id,
+                   pub_date=pub_date)
+         for post_id, pub_date in posts),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_followers(author_id):
+    """Заново раздаёт подписчикам последние посты автора."""
+    followers = Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True)
+    for user_id in followers.iterator():
+        backfill(user_id, author_id)
+
+
+def refresh_fanout(author_id):
+    """Автор пересёк FEED_FANOUT_LIMIT: список тяжёлых авторов
+    пересчитывается, ленты подписчиков дозаполняются его постами."""
+    cache.delete(HEAVY_AUTHORS_KEY)
+    backfill_followers(author_id)
+    followers = Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True)
+    feed_cache.bump(*(f'follow:{user_id}' for user_id in followers))
+
+
+def drop_post(post_id):
+    """Убирает пост из всех лент."""
+    FeedEntry.objects.filter(post_id=post_id).delete()
+
+
+def drop_author(user_id, author_id):
+    """Убирает из ленты читателя все посты автора."""
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild(user_id):
+    FeedEntry.objects.filter(user_id=user_id).delete()
+    authors = Follow.objects.filter(user_id=user_id).values_list(
+        'author_id', flat=True
+    )
+    for author_id in authors:
+        backfill(user_id, author_id)
+
+
+def entry_posts(entries):
+    """Посты записей ленты из их шардов, в порядке записей."""
+    posts = shards.in_bulk(
+        Post.objects.for_feed(), [entry.post_id for entry in entries]
+    )
+    return [posts[entry.post_id] for entry in entries
+            if entry.post_id in posts]
+
+
+def follow_feed(user):
+    """Лента подписок: материализованные записи плюс тяжёлые авторы.
+
+    Записи листаются по индексу (user, pub_date, post) самой таблицы
+    записей, посты тяжёлых авторов подмешиваются слиянием. При
+    шардировании посты записей дочитываются из шардов порцией.
+    """
+    entries = FeedEntry.objects.filter(user=user)
+    if shards.enabled():
+        entries = KeysetSource(
+            entries.only('pub_date', 'post_id'),
+            fields=('pub_date', 'post_id'),
+            load=entry_posts,
+        )
+    else:
+        entries = KeysetSource(
+            entries.select_related('post__author', 'post__group').only(
+                'pub_date', 'post',
+                *(f'post__{field}' for field in FEED_FIELDS)
+            ),
+            fields=('pub_date', 'post_id'),
+            item=attrgetter('post'),
+        )
+    heavy = heavy_authors()
+    if heavy:
+        pulled = list(Follow.objects.filter(
+            user=user, author_id__in=heavy
+        ).values_list('author_id', flat=True))
+        if pulled:
+            return MergedSource(entries, *(
+                KeysetSource(posts) for posts in shards.by_author(
+                    Post.objects.for_feed(), pulled
+                )
+            ))
+    return entries
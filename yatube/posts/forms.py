@@ -1,6 +1,7 @@
 from django import forms
 
-from .models import Post, Comment
+from .images import check_pixels
+from .models import Comment, Group, Post
 
 
 class PostForm(forms.ModelForm):
@@ -11,8 +12,26 @@ class PostForm(forms.ModelForm):
         labels = {'text': 'Текст поста', 'group': 'Группа'}
         fields = ['text', 'group', 'image']
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if image:
+            check_pixels(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
         fields = ['text']
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(label='Что искать', max_length=200)
+    group = forms.ModelChoiceField(
+        Group.objects.only('slug', 'title'), label='Группа',
+        to_field_name='slug', required=False, empty_label='Все группы',
+    )
+    author = forms.CharField(
+        label='Автор', max_length=150, required=False,
+        help_text='Имя пользователя',
+    )
@@ -0,0 +1,141 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.db import connections
+from PIL import Image, ImageOps
+
+from . import cards, feed_cache, media, shards, thumbnails
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+EXIF_ORIENTATION = 0x0112
+JPEG_QUALITY = 85
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def check_pixels(image):
+    """Отклоняет картинку, чей размер по заголовку больше лимита.
+
+    image - загруженный файл после forms.ImageField: Pillow к этому
+    моменту прочитал только заголовки, пиксели ещё не декодированы.
+    """
+    probe = getattr(image, 'image', None)
+    if probe is None:
+        return
+    width, height = probe.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка слишком большая: %(width)s×%(height)s пикселей.',
+            code='too_many_pixels',
+            params={'width': width, 'height': height},
+        )
+
+
+def _needs_work(image, max_side):
+    if getattr(image, 'is_animated', False):
+        return False
+    orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+    return orientation != 1 or max(image.size) > max_side
+
+
+def normalize_image(post_id):
+    """Поворачивает картинку поста по EXIF и уменьшает до
+    POST_IMAGE_MAX_SIDE по большей стороне.
+
+    Вызывается в фоне: результат пишется новым файлом, ссылка
+    на старый снимается.
+    True - если картинка поменялась.
+    """
+    posts = Post.objects.using(shards.for_post(post_id))
+    post = posts.only('id', 'image').filter(pk=post_id).first()
+    if post is None or not post.image:
+        return False
+    storage, name = post.image.storage, post.image.name
+    if not storage.exists(name):
+        return False
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    with storage.open(name) as source, Image.open(source) as image:
+        if not _needs_work(image, max_side):
+            return False
+        image_format = image.format
+        # JPEG умеет декодироваться сразу в уменьшенном виде,
+        # полноразмерный кадр в память не попадает.
+        image.draft('RGB', (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    options = {'quality': JPEG_QUALITY} if image_format == 'JPEG' else {}
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    new_name = storage.save(name, ContentFile(buffer.getvalue()))
+    if not posts.filter(pk=post_id, image=name).update(
+        image=new_name
+    ):
+        # Пока считали, картинку у поста уже заменили
+        media.discard(new_name)
+        return False
+    media.retain(new_name)
+    media.release(name)
+    return True
+
+
+def process_image(post_id):
+    """Нормализует новую картинку поста и делает её миниатюры."""
+    normalize_image(post_id)
+    made = thumbnails.make_thumbnails(post_id)
+    if made:
+        # Карточки и страницы с заглушкой пора перерисовать
+        cards.bump_versions(pk=post_id)
+        post = Post.objects.using(
+            shards.for_post(post_id)
+        ).select_related('author').only(
+            'group_id', 'author__username'
+        ).get(pk=post_id)
+        feed_cache.refresh_post(post, post.group_id)
+    return made
+
+
+def _process(post_id):
+    try:
+        process_image(post_id)
+    except Exception:
+        logger.exception('Не удалось обработать картинку поста %s', post_id)
+
+
+def _run(post_id):
+    with _lock:
+        _pending.discard(post_id)
+    try:
+        _process(post_id)
+    finally:
+        # Поток мог открыть соединения и с шардами
+        connections.close_all()
+
+
+def schedule(post_id):
+    """Ставит картинку поста в очередь пула THUMBNAIL_WORKERS потоков.
+
+    При THUMBNAIL_WORKERS = 0 она обрабатывается сразу.
+    """
+    global _executor
+    workers = settings.THUMBNAIL_WORKERS
+    if not workers:
+        _process(post_id)
+        return
+    with _lock:
+        if post_id in _pending:
+            return
+        _pending.add(post_id)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix='thumbnails'
+            )
+    _executor.submit(_run, post_id)
@@ -0,0 +1,79 @@
+from collections import Counter
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from sorl.thumbnail.images import ImageFile
+
+from posts import cards, feed_cache, media, shards, thumbnails
+from posts.models import Post, StoredFile
+from posts.storage import content_name, hashed_storage
+
+
+class Command(BaseCommand):
+    help = ('Переводит картинки постов на имена по хэшу содержимого, '
+            'склеивает дубликаты и считает освобождённое место.')
+
+    def handle(self, *args, **options):
+        storage = hashed_storage
+        # Старые имена вида posts/photo.jpg, новые - posts/<sha256>.jpg
+        names = {name for part in shards.each(
+            Post.objects.exclude(image='').order_by().values_list(
+                'image', flat=True
+            ).distinct()
+        ) for name in part}
+        freed = moved = merged = 0
+        for name in names:
+            try:
+                if not storage.exists(name):
+                    continue
+            except SuspiciousFileOperation:
+                continue
+            with storage.open(name) as content:
+                hashed = content_name(name, content)
+                if hashed == name:
+                    continue
+                duplicate = storage.exists(hashed)
+                if not duplicate:
+                    storage.save(hashed, content)
+            if duplicate:
+                merged += 1
+            else:
+                moved += 1
+                thumbnails.create_thumbnails(ImageFile(hashed, storage))
+                freed -= media.footprint(hashed)
+            # Миниатюры старых файлов могли быть сделаны ещё под
+            # хранилищем по умолчанию: у них другие ключи у sorl.
+            freed += media.footprint(name, default_storage)
+            freed += media.footprint(name, with_file=False)
+            for posts in shards.each(Post.objects.filter(image=name)):
+                with transaction.atomic(using=posts.db):
+                    post_ids = list(posts.values_list('pk', flat=True))
+                    posts.filter(pk__in=post_ids).update(image=hashed)
+                    cards.bump_versions(pk__in=post_ids)
+            media.delete_file(name, default_storage)
+            media.delete_file(name)
+        self.count_references()
+        feed_cache.bump(feed_cache.EVERYTHING)
+        self.stdout.write(
+            f'Перенесено файлов: {moved}, склеено дубликатов: {merged}, '
+            f'освобождено {freed} байт'
+        )
+
+    @transaction.atomic
+    def count_references(self):
+        references = Counter()
+        for posts in shards.each(Post.objects.exclude(image='')):
+            references.update(dict(
+                posts.order_by().values('image').annotate(
+                    total=Count('pk')
+                ).values_list('image', 'total').iterator()
+            ))
+        StoredFile.objects.all().delete()
+        StoredFile.objects.bulk_create(
+            (StoredFile(name=name, references=total)
+             for name, total in references.items()),
+            batch_size=500,
+        )
@@ -0,0 +1,107 @@
+import os
+from collections import Counter
+from contextlib import ExitStack
+from multiprocessing import Pool
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import cards, feed_cache, shards, thumbnails
+from posts.models import Post
+
+
+def _init_worker():
+    # Процессу, запущенному через spawn, Django нужно настроить заново
+    django.setup()
+
+
+def _generate(post_id):
+    made = thumbnails.make_thumbnails(post_id)
+    return post_id, {
+        name: thumbnail.storage.size(thumbnail.name)
+        for name, thumbnail in made.items()
+    }
+
+
+class Command(BaseCommand):
+    help = ('Генерирует варианты картинок постов на всех ядрах '
+            'и считает, сколько байт они экономят.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов, 1 - без пула.',
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перегенерировать и уже готовые варианты.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов читать и проверять за раз.',
+        )
+
+    def handle(self, *args, **options):
+        totals = Counter()
+        done = checked = 0
+        with ExitStack() as stack:
+            pool = None
+            if options['workers'] > 1:
+                # Соединения с базой не должны достаться дочерним процессам
+                connections.close_all()
+                pool = stack.enter_context(
+                    Pool(options['workers'], _init_worker)
+                )
+            for posts in self.batches(options['batch_size']):
+                if not options['all']:
+                    posts = [post for post in thumbnails.attach_variants(posts)
+                             if not post.variants]
+                post_ids = [post.pk for post in posts]
+                if pool is not None and len(post_ids) > 1:
+                    results = list(pool.imap_unordered(_generate, post_ids))
+                else:
+                    results = [_generate(post_id) for post_id in post_ids]
+                made = [post_id for post_id, sizes in results if sizes]
+                if made:
+                    cards.bump_versions(pk__in=made)
+                for _, sizes in results:
+                    totals.update(sizes)
+                done += len(made)
+                checked += len(post_ids)
+        if done:
+            feed_cache.bump(feed_cache.EVERYTHING)
+        self.stdout.write(
+            f'Миниатюры сделаны для {done} постов из {checked}'
+        )
+        self.report(totals)
+
+    def batches(self, batch_size):
+        """Посты с картинками порциями по batch_size из каждого шарда.
+
+        Порции - по возрастанию id от последнего прочитанного: курсор
+        не держится открытым, пока варианты пишутся в базу.
+        """
+        for part in shards.each(
+            Post.objects.exclude(image='').only('id', 'image')
+        ):
+            last_pk = 0
+            while True:
+                batch = list(
+                    part.filter(pk__gt=last_pk).order_by('pk')[:batch_size]
+                )
+                if not batch:
+                    break
+                yield batch
+                last_pk = batch[-1].pk
+
+    def report(self, totals):
+        baseline = totals[thumbnails.BASELINE]
+        if not baseline:
+            return
+        for name in thumbnails.THUMBNAILS:
+            saved = baseline - totals[name]
+            self.stdout.write(
+                f'{name}: {totals[name]} байт, экономия {saved} байт '
+                f'({saved * 100 // baseline}%) против {thumbnails.BASELINE}'
+            )
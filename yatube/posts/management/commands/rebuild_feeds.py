@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import feeds
+from posts.models import Follow, User
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Чьи ленты пересобрать; по умолчанию все.',
+        )
+
+    def handle(self, *args, **options):
+        if options['usernames']:
+            users = User.objects.filter(username__in=options['usernames'])
+            missing = set(options['usernames']) - set(
+                users.values_list('username', flat=True)
+            )
+            if missing:
+                raise CommandError(
+                    'Нет пользователей: ' + ', '.join(sorted(missing))
+                )
+            user_ids = users.values_list('id', flat=True)
+        else:
+            user_ids = Follow.objects.values_list(
+                'user_id', flat=True
+            ).distinct()
+        rebuilt = 0
+        for user_id in user_ids.iterator():
+            feeds.rebuild(user_id)
+            rebuilt += 1
+        self.stdout.write(f'Пересобрано лент: {rebuilt}')
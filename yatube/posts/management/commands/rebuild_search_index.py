@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search, shards
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает полнотекстовый индекс постов по их текстам.'
+
+    def handle(self, *args, **options):
+        count = 0
+        for alias in shards.aliases():
+            with transaction.atomic(using=alias):
+                count += search.rebuild(alias)
+        self.stdout.write(f'В индексе постов: {count}')
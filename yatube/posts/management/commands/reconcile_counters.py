@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Сверяет денормализованные счётчики с данными и чинит расхождения.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Сколько строк сверять в одной транзакции.',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        created = counters.create_missing_stats(chunk_size)
+        self.stdout.write(f'Создано строк счётчиков: {created}')
+        for name, reconcile in (
+            ('пользователей', counters.reconcile_users),
+            ('групп', counters.reconcile_groups),
+            ('постов', counters.reconcile_posts),
+        ):
+            fixed = reconcile(chunk_size)
+            self.stdout.write(f'Исправлено счётчиков {name}: {fixed}')
@@ -0,0 +1,111 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+
+from posts import counters, feed_cache, feeds, shards
+from posts.models import (Comment, CommentKey, Follow, Group, Post, PostKey,
+                          User)
+
+
+class Command(BaseCommand):
+    help = ('Раскладывает посты и комментарии по шардам из POST_SHARDS: '
+            'копирует в шарды пользователей и группы и переносит посты '
+            'авторов, чей шард сменился. Повторный запуск безопасен.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from', dest='sources', nargs='+', metavar='ALIAS',
+            help='Базы, где искать посты не на своём месте; по умолчанию '
+                 'default и все шарды. Нужно для шарда, убранного из '
+                 'POST_SHARDS.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов переносить одной транзакцией.',
+        )
+
+    def handle(self, *args, **options):
+        if not shards.enabled():
+            raise CommandError('POST_SHARDS пуст: раскладывать некуда.')
+        batch_size = options['batch_size']
+        for model in shards.MIRRORED_FIELDS:
+            self.mirror(model, batch_size)
+        posts = comments = 0
+        for source in options['sources'] or shards.databases():
+            authors = Post.objects.using(source).order_by().values_list(
+                'author_id', flat=True
+            ).distinct()
+            for author_id in list(authors):
+                target = shards.for_author(author_id)
+                if target == source:
+                    self.register(author_id, source, batch_size)
+                    continue
+                group_ids = set(Post.objects.using(source).filter(
+                    author_id=author_id, group__isnull=False
+                ).values_list('group_id', flat=True))
+                moved = shards.move_posts(
+                    author_id, source, target, batch_size
+                )
+                self.refresh(author_id, group_ids, batch_size)
+                posts += moved[0]
+                comments += moved[1]
+        self.continue_comment_ids()
+        feed_cache.bump(feed_cache.EVERYTHING, 'index')
+        self.stdout.write(
+            f'Перенесено постов: {posts}, комментариев: {comments}'
+        )
+
+    def mirror(self, model, batch_size):
+        last_pk = 0
+        while True:
+            rows = list(model.objects.filter(
+                pk__gt=last_pk
+            ).order_by('pk')[:batch_size])
+            if not rows:
+                return
+            shards.mirror(model, rows)
+            last_pk = rows[-1].pk
+
+    def refresh(self, author_id, group_ids, batch_size):
+        # Перенос идёт мимо сигналов: счётчики, записи лент и поколения
+        # лент автора освежаются здесь.
+        counters.reconcile_users(batch_size, [author_id])
+        counters.reconcile_groups(batch_size, group_ids)
+        feeds.backfill_followers(author_id)
+        followers = Follow.objects.filter(
+            author_id=author_id
+        ).values_list('user_id', flat=True)
+        feed_cache.bump(
+            f'profile:{User.objects.get(pk=author_id).username}',
+            *(f'group:{slug}' for slug in Group.objects.filter(
+                pk__in=group_ids
+            ).values_list('slug', flat=True)),
+            *(f'follow:{user_id}' for user_id in followers),
+        )
+
+    def register(self, author_id, alias, batch_size):
+        # Посты, которые уже на месте, но лежат там с до-шардовых времён
+        pks = Post.objects.using(alias).filter(
+            author_id=author_id
+        ).order_by('pk').values_list('pk', flat=True)
+        last_pk = 0
+        while True:
+            batch = list(pks.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                return
+            PostKey.objects.bulk_create(
+                [PostKey(pk=pk, author_id=author_id) for pk in batch],
+                ignore_conflicts=True,
+            )
+            last_pk = batch[-1]
+
+    def continue_comment_ids(self):
+        # Новые комментарии получат id больше всех существующих
+        last = max(
+            Comment.objects.using(alias).aggregate(last=Max('pk'))['last']
+            or 0
+            for alias in shards.databases()
+        )
+        if last:
+            CommentKey.objects.bulk_create(
+                [CommentKey(pk=last)], ignore_conflicts=True
+            )
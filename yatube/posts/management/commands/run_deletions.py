@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts import deletion
+from posts.models import DeletionJob
+
+
+class Command(BaseCommand):
+    help = ('Доводит до конца фоновые удаления, прерванные остановкой '
+            'сервера или ошибкой.')
+
+    def handle(self, *args, **options):
+        jobs = DeletionJob.objects.exclude(
+            state=DeletionJob.DONE
+        ).order_by('created', 'id').values_list('pk', flat=True)
+        for job_id in jobs:
+            job = deletion.run(job_id)
+            self.stdout.write(
+                f'{job.description}: {job.get_state_display()}, '
+                f'{job.processed} из {job.total} строк'
+            )
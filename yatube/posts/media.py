@@ -0,0 +1,81 @@
+import logging
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.db.models import F
+from sorl.thumbnail import default
+from sorl.thumbnail import delete as delete_with_thumbnails
+from sorl.thumbnail.images import ImageFile
+
+from .models import StoredFile
+from .storage import hashed_storage
+
+logger = logging.getLogger(__name__)
+
+
+def retain(name):
+    """Ещё один пост ссылается на файл.
+
+    Увеличение и создание строки - по одному оператору: release удаляет
+    строку только с нулём ссылок, и тогда она просто создаётся заново.
+    """
+    if not name:
+        return
+    while not StoredFile.objects.filter(name=name).update(
+        references=F('references') + 1
+    ):
+        _, created = StoredFile.objects.get_or_create(
+            name=name, defaults={'references': 1}
+        )
+        if created:
+            return
+
+
+def release(name, storage=hashed_storage):
+    """Пост больше не ссылается на файл; последний уносит файл
+    и его миниатюры после коммита, если его не взяли снова."""
+    if not name:
+        return
+    with transaction.atomic():
+        stored = StoredFile.objects.select_for_update().filter(
+            name=name, references__gt=0
+        )
+        stored.update(references=F('references') - 1)
+        # Условный DELETE: строку, которую успел увеличить retain,
+        # он не тронет
+        deleted = StoredFile.objects.filter(
+            name=name, references=0
+        ).delete()[0]
+    if deleted:
+        transaction.on_commit(lambda: discard(name, storage))
+
+
+def discard(name, storage=hashed_storage):
+    """Удаляет файл, если на него никто не ссылается."""
+    if not StoredFile.objects.filter(name=name, references__gt=0).exists():
+        delete_file(name, storage)
+
+
+def delete_file(name, storage=hashed_storage):
+    """Удаляет файл и его миниатюры, записанные под этим хранилищем."""
+    try:
+        delete_with_thumbnails(ImageFile(name, storage))
+    except SuspiciousFileOperation:
+        logger.warning('Файл вне хранилища не удаляется: %s', name)
+
+
+def footprint(name, storage=hashed_storage, with_file=True):
+    """Байты файла вместе с его миниатюрами под этим хранилищем."""
+    source = ImageFile(name, storage)
+    total = 0
+    if with_file:
+        try:
+            total = storage.size(name)
+        except (FileNotFoundError, SuspiciousFileOperation):
+            return 0
+    kvstore = default.kvstore
+    for key in kvstore._get(source.key, identity='thumbnails') or ():
+        thumbnail = kvstore._get(key)
+        if thumbnail is not None and thumbnail.exists():
+            total += thumbnail.storage.size(thumbnail.name)
+    return total
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:14
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_stored_files'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [
+                "CREATE VIRTUAL TABLE posts_post_search USING fts5("
+                "text, content='posts_post', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2')",
+                "INSERT INTO posts_post_search(posts_post_search) "
+                "VALUES ('rebuild')",
+            ],
+            'DROP TABLE posts_post_search',
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_comment_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletionJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target', models.CharField(max_length=100, verbose_name='Модель')),
+                ('object_id', models.PositiveIntegerField(verbose_name='id объекта')),
+                ('description', models.CharField(max_length=200, verbose_name='Объект')),
+                ('state', models.CharField(choices=[('queued', 'в очереди'), ('running', 'удаляется'), ('done', 'удалён'), ('failed', 'ошибка')], default='queued', max_length=10, verbose_name='Состояние')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Обработано строк')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Всего строк')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Поставлено')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Закончено')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+            ],
+            options={
+                'verbose_name': 'Удаление',
+                'verbose_name_plural': 'Удаления',
+                'ordering': ('-created', '-id'),
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0022_deletion_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            options={
+                'verbose_name': 'Ключ комментария',
+                'verbose_name_plural': 'Ключи комментариев',
+            },
+        ),
+        migrations.AlterField(
+            model_name='feedentry',
+            name='post',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='posts.Post', verbose_name='Пост'),
+        ),
+        migrations.CreateModel(
+            name='PostKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Ключ поста',
+                'verbose_name_plural': 'Ключи постов',
+            },
+        ),
+    ]
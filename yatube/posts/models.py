@@ -1,5 +1,9 @@
+from contextlib import ExitStack
+
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, models, router, transaction
+
+from .storage import hashed_storage
 
 User = get_user_model()
 
@@ -10,6 +14,11 @@ class Group(models.Model):
     slug = models.SlugField(max_length=200,
                             unique=True,
                             verbose_name='сокращение под url')
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='число постов',
+    )
 
     class Meta:
 
@@ -20,7 +29,63 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+FEED_FIELDS = (
+    'id', 'text', 'pub_date', 'image', 'version', 'author_id', 'group_id',
+    'author__username', 'author__first_name', 'author__last_name',
+    'group__slug', 'group__title',
+)
+
+
+class CountedModel(models.Model):
+    """Сохранение и удаление вместе с сигналами - одна транзакция.
+
+    Сигналы двигают счётчики (UserStats, posts_count, comments_count);
+    так сбой между записью и счётчиком откатывает обе. Счётчики лежат
+    в default, поэтому транзакция открывается и там, и в базе объекта.
+    """
+
+    class Meta:
+        abstract = True
+
+    def _atomic(self, using):
+        stack = ExitStack()
+        using = using or router.db_for_write(type(self), instance=self)
+        for alias in dict.fromkeys((DEFAULT_DB_ALIAS, using)):
+            stack.enter_context(transaction.atomic(using=alias))
+        return stack
+
+    def save(self, *args, **kwargs):
+        with self._atomic(kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    def delete(self, using=None, keep_parents=False):
+        with self._atomic(using):
+            return super().delete(using, keep_parents)
+
+
+class ShardedQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        # Без явной базы её выбирает роутер по самому объекту:
+        # при шардировании - по автору, см. posts.shards.
+        if self._db is not None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+
+class PostQuerySet(ShardedQuerySet):
+    def for_feed(self):
+        """Всё, что нужно карточке поста, одним запросом."""
+        return self.select_related('author', 'group').only(*FEED_FIELDS)
+
+    def for_detail(self):
+        return self.select_related('author__stats', 'group').only(
+            *FEED_FIELDS, 'comments_count', 'author__stats__posts_count',
+        )
+
+
+class Post(CountedModel):
     text = models.TextField(verbose_name='текст')
     pub_date = models.DateTimeField(auto_now_add=True,
                                     verbose_name='дата публикации')
@@ -41,19 +106,48 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=hashed_storage,
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='число комментариев',
+    )
+    version = models.PositiveIntegerField(
+        default=1,
+        editable=False,
+        verbose_name='версия карточки',
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_pub_date_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:20]
 
 
-class Comment(models.Model):
+class CommentQuerySet(ShardedQuerySet):
+    def for_post(self, post):
+        return self.filter(post=post).select_related('author').only(
+            'id', 'text', 'created', 'post_id', 'author_id',
+            'author__username', 'author__first_name', 'author__last_name',
+        ).order_by('created', 'id')
+
+
+class Comment(CountedModel):
     post = models.ForeignKey(
         Post,
         related_name='comments',
@@ -74,12 +168,20 @@ class Comment(models.Model):
         auto_now_add=True
     )
 
+    objects = CommentQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(fields=['post', 'created', 'id'],
+                         name='comment_post_created_idx'),
+            models.Index(fields=['-created', '-id'],
+                         name='comment_created_idx'),
+        ]
 
 
-class Follow(models.Model):
+class Follow(CountedModel):
     author = models.ForeignKey(
         User,
         verbose_name='Автор',
@@ -100,3 +202,154 @@ class Follow(models.Model):
             models.UniqueConstraint(fields=['author', 'user'],
                                     name='follow_constraints')
         ]
+        indexes = [
+            models.Index(fields=['user', 'author'],
+                         name='follow_user_author_idx'),
+        ]
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        verbose_name='Пользователь',
+        related_name='stats',
+        on_delete=models.CASCADE,
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='число постов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='число подписчиков',
+    )
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='число подписок',
+    )
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+        indexes = [
+            models.Index(fields=['followers_count'],
+                         name='stats_followers_idx'),
+        ]
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        verbose_name='Читатель',
+        related_name='feed',
+        on_delete=models.CASCADE,
+    )
+    # Без ограничения в базе: при шардировании пост лежит в другой
+    # базе, записи ленты удаляет сигнал удаления поста.
+    post = models.ForeignKey(
+        Post,
+        verbose_name='Пост',
+        related_name='feed_entries',
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    author = models.ForeignKey(
+        User,
+        verbose_name='Автор',
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    # Копия даты поста: лента листается по индексу самой таблицы записей.
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='feed_entry_constraints')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='feed_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='feed_user_author_idx'),
+        ]
+
+
+class PostKey(models.Model):
+    """id поста при шардировании и автор, по которому выбран шард."""
+    author = models.ForeignKey(
+        User,
+        verbose_name='Автор',
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+
+    class Meta:
+        verbose_name = 'Ключ поста'
+        verbose_name_plural = 'Ключи постов'
+
+
+class CommentKey(models.Model):
+    """id комментариев при шардировании - общие для всех шардов."""
+
+    class Meta:
+        verbose_name = 'Ключ комментария'
+        verbose_name_plural = 'Ключи комментариев'
+
+
+class StoredFile(models.Model):
+    """Сколько постов ссылается на файл в posts.storage.HashedStorage."""
+    name = models.CharField('Имя файла', max_length=255, unique=True)
+    references = models.PositiveIntegerField('Число ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self):
+        return self.name
+
+
+class DeletionJob(models.Model):
+    """Объект, который posts.deletion удаляет в фоне порциями."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATES = (
+        (QUEUED, 'в очереди'),
+        (RUNNING, 'удаляется'),
+        (DONE, 'удалён'),
+        (FAILED, 'ошибка'),
+    )
+
+    target = models.CharField('Модель', max_length=100)
+    object_id = models.PositiveIntegerField('id объекта')
+    description = models.CharField('Объект', max_length=200)
+    state = models.CharField(
+        'Состояние', max_length=10, choices=STATES, default=QUEUED
+    )
+    processed = models.PositiveIntegerField('Обработано строк', default=0)
+    total = models.PositiveIntegerField('Всего строк', default=0)
+    created = models.DateTimeField('Поставлено', auto_now_add=True)
+    finished = models.DateTimeField('Закончено', null=True, blank=True)
+    error = models.TextField('Ошибка', blank=True)
+
+    class Meta:
+        verbose_name = 'Удаление'
+        verbose_name_plural = 'Удаления'
+        ordering = ('-created', '-id')
+
+    def __str__(self):
+        return self.description
+
+    @property
+    def progress(self):
+        """Доля обработанных строк в процентах."""
+        if self.state == self.DONE:
+            return 100
+        if not self.total:
+            return 0
+        return min(self.processed * 100 // self.total, 99)
@@ -0,0 +1,319 @@
+import base64
+import binascii
+import heapq
+import json
+from math import ceil
+
+from django.core.paginator import Paginator
+from django.db.models import Max, Min, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+FORWARD = 'n'
+BACKWARD = 'p'
+# Нефильтрованные таблицы больше этого размера не считаются COUNT(*):
+# число строк оценивается по диапазону первичных ключей.
+APPROXIMATE_COUNT_THRESHOLD = 100000
+# Отфильтрованный список в админке досчитывается не дальше этого
+COUNT_LIMIT = 10000
+ON_EACH_SIDE = 2
+ON_ENDS = 1
+# Ссылки ?page=N в навигации - только на первые страницы: дальние через
+# OFFSET дороги, а при оценочном числе постов могут быть пусты.
+OFFSET_LINK_PAGES = 5
+# ?page=last - последняя страница по ключу с конца ленты
+LAST_PAGE = 'last'
+
+
+def encode_values(values):
+    raw = json.dumps(values)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_values(cursor):
+    """Обратное к encode_values, None для испорченной строки."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return json.loads(raw.decode())
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return None
+
+
+def encode_key(moment, pk):
+    return encode_values([moment.isoformat(), pk])
+
+
+def decode_key(cursor):
+    """Возвращает (moment, pk) или None."""
+    values = decode_values(cursor)
+    try:
+        iso, pk = values
+        moment = parse_datetime(iso)
+    except (ValueError, TypeError):
+        return None
+    if moment is None or not isinstance(pk, int):
+        return None
+    return moment, pk
+
+
+def encode_cursor(pub_date, pk, number, direction):
+    return encode_values([pub_date.isoformat(), pk, number, direction])
+
+
+def decode_cursor(cursor):
+    """Возвращает (pub_date, pk, number, direction) или None."""
+    values = decode_values(cursor)
+    try:
+        iso, pk, number, direction = values
+        pub_date = parse_datetime(iso)
+    except (ValueError, TypeError):
+        return None
+    if (pub_date is None or not isinstance(pk, int)
+            or not isinstance(number, int)
+            or direction not in (FORWARD, BACKWARD)):
+        return None
+    return pub_date, pk, number, direction
+
+
+def approximate_count(queryset):
+    query = getattr(queryset, 'query', None)
+    if query is not None and not query.where:
+        bounds = queryset.order_by().aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['high'] is None:
+            return 0
+        estimate = bounds['high'] - bounds['low'] + 1
+        if estimate > APPROXIMATE_COUNT_THRESHOLD:
+            return estimate
+    return queryset.count()
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator для админки без COUNT(*) по всей таблице.
+
+    Без фильтров число строк оценивает approximate_count, с фильтрами
+    строки считаются до COUNT_LIMIT: дальних страниц в навигации
+    не будет, но время загрузки от размера таблицы не зависит.
+    """
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            return approximate_count(self.object_list)
+        return self.object_list[:COUNT_LIMIT].count()
+
+
+def post_key(post):
+    return post.pub_date, post.pk
+
+
+class KeysetSource:
+    """Посты по убыванию (pub_date, id) для CursorPaginator.
+
+    fields - поля ключа в queryset, item - как достать пост из строки,
+    если queryset выбирает не сами посты, load - то же для всех строк
+    порции сразу.
+    """
+
+    def __init__(self, queryset, fields=('pub_date', 'id'), item=None,
+                 load=None):
+        self.queryset = queryset.order_by(*(f'-{field}' for field in fields))
+        self.fields = fields
+        self.item = item
+        self.load = load
+
+    def _posts(self, rows):
+        if self.load is not None:
+            return self.load(list(rows))
+        if self.item is None:
+            return list(rows)
+        return [self.item(row) for row in rows]
+
+    def fetch(self, key, forward, limit):
+        """limit постов после key: вперёд по убыванию, назад по возрастанию."""
+        queryset = self.queryset
+        if key is not None:
+            date_field, id_field = self.fields
+            pub_date, pk = key
+            op = 'lt' if forward else 'gt'
+            # Отдельное условие на дату даёт SQLite диапазон по индексу,
+            # OR уточняет позицию внутри одинаковых дат.
+            queryset = queryset.filter(
+                **{f'{date_field}__{op}e': pub_date}
+            ).filter(
+                Q(**{f'{date_field}__{op}': pub_date})
+                | Q(**{f'{id_field}__{op}': pk})
+            )
+        if not forward:
+            queryset = queryset.reverse()
+        return self._posts(queryset[:limit])
+
+    def count(self):
+        return self.queryset.count()
+
+    def __getitem__(self, index):
+        return self._posts(self.queryset[index])
+
+
+class MergedSource:
+    """Слияние нескольких источников в одну ленту без повторов."""
+
+    def __init__(self, *sources):
+        self.sources = sources
+
+    def fetch(self, key, forward, limit):
+        streams = [source.fetch(key, forward, limit)
+                   for source in self.sources]
+        posts, seen = [], set()
+        for post in heapq.merge(*streams, key=post_key, reverse=forward):
+            if post.pk not in seen:
+                seen.add(post.pk)
+                posts.append(post)
+                if len(posts) == limit:
+                    break
+        return posts
+
+    def count(self):
+        return sum(source.count() for source in self.sources)
+
+    def __getitem__(self, index):
+        return self.fetch(None, True, index.stop)[index]
+
+
+class CursorPaginator(Paginator):
+    """Keyset-пагинация по (pub_date, id) без COUNT и OFFSET.
+
+    Старые ссылки вида ?page=N обслуживаются обычным Paginator,
+    но и с них дальше можно листать по курсорам. Число постов можно
+    передать заранее известным (из счётчиков или кэша) в count.
+    Вместо queryset можно передать KeysetSource или MergedSource.
+    Номер последней страницы по оценочному числу постов приблизителен.
+    """
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        if not hasattr(object_list, 'fetch'):
+            object_list = KeysetSource(object_list)
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            self.count = count
+        self.next_cursor = None
+        self.previous_cursor = None
+        self.current_number = 1
+        self._keyset_pages = None
+
+    @property
+    def num_pages(self):
+        if self._keyset_pages is not None:
+            return self._keyset_pages
+        return super().num_pages
+
+    @property
+    def total_pages(self):
+        pages = ceil(self.count / self.per_page) if self.count else 1
+        return max(pages, self._keyset_pages or 0)
+
+    @property
+    def elided_page_range(self):
+        """Номера страниц вокруг текущей и по краям, None - пропуск."""
+        number, total = self.current_number, self.total_pages
+        if total <= (ON_EACH_SIDE + ON_ENDS) * 2 + 1:
+            return list(range(1, total + 1))
+        pages = []
+        if number > ON_EACH_SIDE + ON_ENDS + 2:
+            pages += [*range(1, ON_ENDS + 1), None]
+            pages += range(number - ON_EACH_SIDE, number + 1)
+        else:
+            pages += range(1, number + 1)
+        if number < total - ON_EACH_SIDE - ON_ENDS - 1:
+            pages += range(number + 1, number + ON_EACH_SIDE + 1)
+            pages += [None, *range(total - ON_ENDS + 1, total + 1)]
+        else:
+            pages += range(number + 1, total + 1)
+        return pages
+
+    @property
+    def page_links(self):
+        """(номер, ссылка) для elided_page_range; ссылки нет у текущей
+        и у дальних страниц, куда пришлось бы идти через OFFSET."""
+        number, total = self.current_number, self.total_pages
+        links = []
+        for page in self.elided_page_range:
+            if page is None or page == number:
+                link = None
+            elif page == number - 1 and self.previous_cursor:
+                link = f'?cursor={self.previous_cursor}'
+            elif page == number + 1 and self.next_cursor:
+                link = f'?cursor={self.next_cursor}'
+            elif page == total:
+                link = f'?page={LAST_PAGE}'
+            elif page <= OFFSET_LINK_PAGES:
+                link = f'?page={page}'
+            else:
+                link = None
+            links.append((page, link))
+        return links
+
+    def get_page(self, number=None, cursor=None):
+        if cursor:
+            decoded = decode_cursor(cursor)
+            if decoded is not None:
+                pub_date, pk, number, direction = decoded
+                return self._keyset_page(
+                    (pub_date, pk), number, direction == FORWARD
+                )
+        elif number == LAST_PAGE:
+            return self._last_page()
+        elif number is not None:
+            return self._offset_page(number)
+        return self._keyset_page(None, 1, True)
+
+    def _offset_page(self, number):
+        page = super().get_page(number)
+        page.object_list = list(page.object_list)
+        if not page.object_list and page.number > 1:
+            # Оценка числа постов завысила число страниц
+            return self._last_page()
+        self.current_number = page.number
+        if page.has_next():
+            self.next_cursor = self._cursor(
+                page.object_list[-1], page.number + 1, FORWARD
+            )
+        if page.has_previous():
+            self.previous_cursor = self._cursor(
+                page.object_list[0], page.number - 1, BACKWARD
+            )
+        return page
+
+    def _keyset_page(self, key, number, forward):
+        items = self.object_list.fetch(key, forward, self.per_page + 1)
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if forward:
+            has_previous, has_next = key is not None, has_more
+        else:
+            if not items:
+                return self._keyset_page(None, 1, True)
+            items.reverse()
+            # Назад без ключа - от конца ленты, это последняя страница
+            has_previous, has_next = has_more, key is not None
+        number = max(number, 2) if has_previous else 1
+        self.current_number = number
+        self._keyset_pages = number + 1 if has_next else number
+        if has_next and items:
+            self.next_cursor = self._cursor(items[-1], number + 1, FORWARD)
+        if has_previous:
+            if items:
+                self.previous_cursor = self._cursor(
+                    items[0], number - 1, BACKWARD
+                )
+            else:
+                self.previous_cursor = encode_cursor(
+                    key[0], key[1], number - 1, BACKWARD
+                )
+        return self._get_page(items, number, self)
+
+    def _last_page(self):
+        return self._keyset_page(None, self.total_pages, False)
+
+    @staticmethod
+    def _cursor(post, number, direction):
+        return encode_cursor(*post_key(post), number, direction)
@@ -0,0 +1,212 @@
+import heapq
+import re
+from itertools import islice
+from operator import itemgetter
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from . import shards
+from .models import Post
+
+# Виртуальная таблица FTS5 над posts_post.text (external content):
+# сам текст хранится только в посте, индекс поддерживают сигналы.
+SEARCH_TABLE = 'posts_post_search'
+SNIPPET_TOKENS = 16
+# Границы совпадения в сниппете: символы, которых нет в тексте постов,
+# чтобы сначала экранировать текст, а потом подставить <mark>.
+MARK_START, MARK_END = '\x02', '\x03'
+WORD = re.compile(r'\w+')
+MARKS = re.compile(f'([{MARK_START}{MARK_END}])')
+
+
+def match_expression(query):
+    """Запрос пользователя как выражение MATCH: все слова, каждое в
+    кавычках, чтобы синтаксис FTS5 в нём не срабатывал."""
+    return ' '.join(f'"{word}"' for word in WORD.findall(query))
+
+
+def _execute(sql, params=(), using=None):
+    with connections[using or DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _delete(pk, text, using):
+    # В external content таблицу удаление передаётся со старым текстом
+    _execute(
+        f'INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, text) '
+        'VALUES (%s, %s, %s)',
+        ['delete', pk, text],
+        using,
+    )
+
+
+def _insert(pk, text, using):
+    _execute(
+        f'INSERT INTO {SEARCH_TABLE}(rowid, text) VALUES (%s, %s)',
+        [pk, text],
+        using,
+    )
+
+
+def index_post(post, created, previous_text=None, using=None):
+    """Обновляет пост в индексе базы using после сохранения."""
+    if 'text' in post.get_deferred_fields():
+        return
+    if created:
+        _insert(post.pk, post.text, using)
+    elif previous_text != post.text:
+        if previous_text is not None:
+            _delete(post.pk, previous_text, using)
+        _insert(post.pk, post.text, using)
+
+
+def unindex_post(post, using=None):
+    """Убирает пост из индекса; вызывается, пока строка ещё в базе."""
+    if 'text' in post.get_deferred_fields():
+        text = Post.objects.using(using).filter(pk=post.pk).values_list(
+            'text', flat=True
+        ).first()
+    else:
+        text = post.text
+    if text is not None:
+        _delete(post.pk, text, using)
+
+
+def rebuild(using=None):
+    """Пересобирает индекс по posts_post, возвращает число постов."""
+    for command in ('rebuild', 'optimize'):
+        _execute(
+            f'INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES (%s)',
+            [command],
+            using,
+        )
+    return _execute(f'SELECT count(*) FROM {SEARCH_TABLE}', (), using)[0][0]
+
+
+def filter_posts(queryset, query):
+    """Посты queryset, подходящие под запрос, отобранные по индексу."""
+    match = match_expression(query)
+    if not match:
+        return queryset.none()
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+        [match],
+    ))
+
+
+def strip_marks(text):
+    """Текст поста без символов-границ совпадения."""
+    return text.replace(MARK_START, '').replace(MARK_END, '')
+
+
+def highlight(snippet):
+    """Сниппет в HTML: текст экранирован, совпадения в <mark>.
+
+    Границы, попавшие в старые посты, не ломают разметку: лишние
+    выбрасываются, незакрытая закрывается в конце.
+    """
+    parts, opened = [], False
+    for piece in MARKS.split(snippet):
+        if piece == MARK_START:
+            if not opened:
+                parts.append('<mark>')
+                opened = True
+        elif piece == MARK_END:
+            if opened:
+                parts.append('</mark>')
+                opened = False
+        else:
+            parts.append(escape(piece))
+    if opened:
+        parts.append('</mark>')
+    return mark_safe(''.join(parts))
+
+
+class SearchResults:
+    """Посты по запросу в порядке BM25 для django.core.paginator.
+
+    Срез - один запрос к индексу за id и сниппетами страницы и один
+    за самими постами; count() - COUNT(*) по тому же MATCH. При
+    шардировании запросы идут в каждый шард (с фильтром по автору -
+    только в его), страницы сливаются по rank.
+    """
+
+    def __init__(self, query, group_id=None, author_id=None):
+        self.match = match_expression(query)
+        self.filters = []
+        self.params = [self.match]
+        for column, value in (('group_id', group_id),
+                              ('author_id', author_id)):
+            if value is not None:
+                self.filters.append(f'AND posts_post.{column} = %s')
+                self.params.append(value)
+        self.aliases = (shards.aliases() if author_id is None
+                        else [shards.for_author(author_id)])
+        self._count = None
+
+    def _from(self):
+        join = (
+            f'JOIN posts_post ON posts_post.id = {SEARCH_TABLE}.rowid '
+            if self.filters else ''
+        )
+        return (
+            f'FROM {SEARCH_TABLE} {join}'
+            f'WHERE {SEARCH_TABLE} MATCH %s {" ".join(self.filters)}'
+        )
+
+    def count(self):
+        if not self.match:
+            return 0
+        if self._count is None:
+            self._count = sum(
+                _execute(f'SELECT count(*) {self._from()}', self.params,
+                         alias)[0][0]
+                for alias in self.aliases
+            )
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def _rows(self, alias, limit, offset):
+        return [(rank, pk, snippet, alias) for pk, snippet, rank in _execute(
+            f'SELECT {SEARCH_TABLE}.rowid, '
+            f'snippet({SEARCH_TABLE}, 0, %s, %s, %s, %s), rank '
+            f'{self._from()} ORDER BY rank LIMIT %s OFFSET %s',
+            [MARK_START, MARK_END, '…', SNIPPET_TOKENS,
+             *self.params, limit, offset],
+            alias,
+        )]
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        if not self.match:
+            return []
+        start, stop = index.start or 0, index.stop
+        # Из одной базы - сразу страница через OFFSET, из нескольких -
+        # первые stop строк каждой, страница вырезается после слияния.
+        offset = start if len(self.aliases) == 1 else 0
+        limit = -1 if stop is None else max(stop - offset, 0)
+        rows = heapq.merge(
+            *(self._rows(alias, limit, offset) for alias in self.aliases),
+            key=itemgetter(0),
+        )
+        rows = list(islice(rows, start - offset, None if stop is None
+                           else stop - offset))
+        posts = {}
+        for alias in self.aliases:
+            posts.update(Post.objects.using(alias).for_feed().in_bulk(
+                [pk for _, pk, _, found_in in rows if found_in == alias]
+            ))
+        found = []
+        for _, pk, snippet, _ in rows:
+            post = posts.get(pk)
+            if post is not None:
+                post.snippet = highlight(snippet)
+                found.append(post)
+        return found
@@ -0,0 +1,266 @@
+"""Шардирование постов и комментариев по автору.
+
+POST_SHARDS - псевдонимы баз из DATABASES. Посты автора и комментарии
+к ним лежат в базе POST_SHARDS[author_id % len(POST_SHARDS)]. id постов
+и комментариев выдают таблицы PostKey и CommentKey в default: id
+уникальны между шардами, по id поста находится автор, а по нему шард.
+В шарды копируются пользователи и группы: на них ссылаются посты,
+и ленты берут их JOIN-ом.
+
+Без POST_SHARDS for_author и for_post возвращают None, и using(None)
+оставляет выбор базы роутерам - всё лежит в default, как раньше.
+Порядок перехода: добавить базы в DATABASES, migrate --database для
+каждой, заполнить POST_SHARDS и сразу выполнить manage.py reshard.
+"""
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from . import search
+from .models import Comment, CommentKey, Group, Post, PostKey, User
+from .paginators import KeysetSource, MergedSource, approximate_count
+
+SHARDED_MODELS = (Post, Comment)
+# Поля копий в шардах: их показывают карточки постов
+MIRRORED_FIELDS = {
+    User: ('username', 'first_name', 'last_name'),
+    Group: ('title', 'slug', 'description'),
+}
+# Автор поста не меняется: соответствие id поста автору кэшируется
+# в процессе, при переполнении кэш просто очищается.
+AUTHOR_CACHE_SIZE = 100000
+
+_authors = {}
+_authors_lock = threading.Lock()
+
+
+def enabled():
+    return bool(settings.POST_SHARDS)
+
+
+def aliases():
+    """Базы с постами для using(); без шардирования - [None]."""
+    return list(settings.POST_SHARDS) or [None]
+
+
+def databases():
+    """Все базы, в которые пишут запросы: default и шарды."""
+    return [DEFAULT_DB_ALIAS] + [alias for alias in settings.POST_SHARDS
+                                 if alias != DEFAULT_DB_ALIAS]
+
+
+def for_author(author_id):
+    shards = settings.POST_SHARDS
+    if not shards:
+        return None
+    return shards[author_id % len(shards)]
+
+
+def post_author(post_id):
+    author_id = _authors.get(post_id)
+    if author_id is None:
+        author_id = PostKey.objects.filter(pk=post_id).values_list(
+            'author_id', flat=True
+        ).first()
+        if author_id is not None:
+            with _authors_lock:
+                if len(_authors) >= AUTHOR_CACHE_SIZE:
+                    _authors.clear()
+                _authors[post_id] = author_id
+    return author_id
+
+
+def for_post(post_id):
+    if not enabled():
+        return None
+    author_id = post_author(post_id)
+    # Неизвестный пост ищется в default: там его нет, будет 404
+    if author_id is None:
+        return DEFAULT_DB_ALIAS
+    return for_author(author_id)
+
+
+def each(queryset):
+    """queryset в каждом шарде; для прочих моделей - он сам."""
+    if getattr(queryset, 'model', None) not in SHARDED_MODELS:
+        return [queryset]
+    return [queryset.using(alias) for alias in aliases()]
+
+
+def count(queryset):
+    """approximate_count по всем шардам.
+
+    id постов общие для шардов, и диапазон id в каждом шарде - почти
+    весь диапазон: оценка без фильтров берётся один раз по ключам.
+    """
+    parts = each(queryset)
+    if len(parts) > 1 and queryset.model is Post and not queryset.query.where:
+        return approximate_count(PostKey.objects.all())
+    return sum(approximate_count(part) for part in parts)
+
+
+def by_author(queryset, author_ids):
+    """queryset по авторам author_ids - в шардах, где они лежат."""
+    grouped = {}
+    for author_id in author_ids:
+        grouped.setdefault(for_author(author_id), []).append(author_id)
+    return [queryset.using(alias).filter(author_id__in=ids)
+            for alias, ids in grouped.items()]
+
+
+def feed(queryset):
+    """Источник для CursorPaginator: слияние лент всех шардов.
+
+    Каждый шард отдаёт посты уже по убыванию (pub_date, id),
+    MergedSource сливает их через heapq.merge.
+    """
+    sources = [KeysetSource(part) for part in each(queryset)]
+    if len(sources) == 1:
+        return sources[0]
+    return MergedSource(*sources)
+
+
+def in_bulk(queryset, post_ids):
+    """{id: пост} из шардов, где лежат посты."""
+    grouped = {}
+    for post_id in post_ids:
+        grouped.setdefault(for_post(post_id), []).append(post_id)
+    found = {}
+    for alias, ids in grouped.items():
+        found.update(queryset.using(alias).in_bulk(ids))
+    return found
+
+
+def assign_key(instance):
+    """id нового поста или комментария - из общей таблицы в default."""
+    if not enabled() or not instance._state.adding or instance.pk:
+        return
+    if isinstance(instance, Post):
+        instance.pk = PostKey.objects.create(author_id=instance.author_id).pk
+    else:
+        instance.pk = CommentKey.objects.create().pk
+
+
+class ShardRouter:
+    """Посты и комментарии - в шард автора, если запрос знает объект:
+    сохранение, удаление, связанные менеджеры вроде author.posts."""
+
+    def _shard(self, model, **hints):
+        if not enabled() or model not in SHARDED_MODELS:
+            return None
+        instance = hints.get('instance')
+        if isinstance(instance, Post) and instance.author_id is not None:
+            return for_author(instance.author_id)
+        if isinstance(instance, Comment) and instance.post_id is not None:
+            return for_post(instance.post_id)
+        if isinstance(instance, User) and model is Post:
+            return for_author(instance.pk)
+        return None
+
+    db_for_read = _shard
+    db_for_write = _shard
+
+
+def _mirror_aliases():
+    return [alias for alias in settings.POST_SHARDS
+            if alias != DEFAULT_DB_ALIAS]
+
+
+def mirror(model, instances):
+    """Копирует пользователей или группы во все шарды.
+
+    Новые копии создаются, а существующие обновляются, только если
+    их поля отличаются от оригинала.
+    """
+    fields = MIRRORED_FIELDS[model]
+    values = {obj.pk: tuple(getattr(obj, field) for field in fields)
+              for obj in instances}
+    for alias in _mirror_aliases():
+        stored = {
+            pk: tuple(row)
+            for pk, *row in model.objects.using(alias).filter(
+                pk__in=values
+            ).values_list('pk', *fields)
+        }
+        missing = [obj for obj in instances if obj.pk not in stored]
+        changed = [obj for obj in instances
+                   if obj.pk in stored and stored[obj.pk] != values[obj.pk]]
+        if missing:
+            model.objects.using(alias).bulk_create(
+                [model(pk=obj.pk, **dict(zip(fields, values[obj.pk])))
+                 for obj in missing],
+                ignore_conflicts=True,
+            )
+        if changed:
+            model.objects.using(alias).bulk_update(changed, fields)
+
+
+def drop_mirror(instance):
+    """Удаляет копию из шардов; их посты удаляются вместе с ней."""
+    for alias in _mirror_aliases():
+        type(instance).objects.using(alias).filter(pk=instance.pk).delete()
+
+
+def _delete_rows(model, alias, pks):
+    # Без сигналов: строки не удаляются, а переезжают
+    table = connections[alias].ops.quote_name(model._meta.db_table)
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE id IN '
+            f'({", ".join(["%s"] * len(pks))})',
+            pks,
+        )
+
+
+def _copy(model, alias, rows, date_field):
+    # bulk_create ставит auto_now_add заново, возвращаем даты на место
+    dates = [getattr(row, date_field) for row in rows]
+    model.objects.using(alias).bulk_create(rows)
+    for row, date in zip(rows, dates):
+        setattr(row, date_field, date)
+    model.objects.using(alias).bulk_update(rows, [date_field])
+
+
+def move_posts(author_id, source, target, batch_size):
+    """Переносит посты автора и комментарии к ним из source в target.
+
+    Порция сначала целиком пишется в target, потом удаляется из
+    source: прерванный перенос можно запустить снова. Строки удаляются
+    без сигналов, поэтому счётчики, ленты и их кэш после переноса
+    освежает вызывающий, см. команду reshard. Возвращает
+    (число постов, число комментариев).
+    """
+    posts = Post.objects.using(source).filter(author_id=author_id)
+    moved = [0, 0]
+    while True:
+        batch = list(posts.order_by('pk')[:batch_size])
+        if not batch:
+            return tuple(moved)
+        pks = [post.pk for post in batch]
+        comments = list(Comment.objects.using(source).filter(post_id__in=pks))
+        copied = set(Post.objects.using(target).filter(
+            pk__in=pks
+        ).values_list('pk', flat=True))
+        fresh = [post for post in batch if post.pk not in copied]
+        with transaction.atomic(using=target):
+            _copy(Post, target, fresh, 'pub_date')
+            _copy(Comment, target, [comment for comment in comments
+                                    if comment.post_id not in copied],
+                  'created')
+            for post in fresh:
+                search.index_post(post, True, using=target)
+        # С ключом пост ищется уже в target
+        PostKey.objects.bulk_create(
+            [PostKey(pk=pk, author_id=author_id) for pk in pks],
+            ignore_conflicts=True,
+        )
+        with transaction.atomic(using=source):
+            for post in batch:
+                search.unindex_post(post, using=source)
+            if comments:
+                _delete_rows(Comment, source,
+                             [comment.pk for comment in comments])
+            _delete_rows(Post, source, pks)
+        moved[0] += len(batch)
+        moved[1] += len(comments)
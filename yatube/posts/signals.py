@@ -0,0 +1,238 @@
+from functools import partial
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import (cards, counters, feed_cache, feeds, images, media, search,
+               shards)
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+AUTHOR_CARD_FIELDS = ('username', 'first_name', 'last_name')
+GROUP_CARD_FIELDS = ('title', 'slug')
+
+
+def changed_fields(instance, fields, update_fields):
+    """Какие из полей fields отличаются от сохранённых в базе."""
+    if instance._state.adding:
+        return ()
+    if update_fields is not None:
+        fields = [field for field in fields if field in update_fields]
+        if not fields:
+            return ()
+    stored = type(instance).objects.filter(pk=instance.pk).values(
+        *fields
+    ).first() or {}
+    return [field for field in fields
+            if stored.get(field) != getattr(instance, field)]
+
+
+@receiver(pre_save, sender=User)
+def refresh_author_cards(sender, instance, update_fields, **kwargs):
+    if changed_fields(instance, AUTHOR_CARD_FIELDS, update_fields):
+        cards.bump_versions(author_id=instance.pk)
+        feed_cache.bump(feed_cache.EVERYTHING)
+
+
+@receiver(pre_save, sender=Group)
+def refresh_group_cards(sender, instance, update_fields, **kwargs):
+    if changed_fields(instance, GROUP_CARD_FIELDS, update_fields):
+        cards.bump_versions(group_id=instance.pk)
+        feed_cache.bump(feed_cache.EVERYTHING)
+
+
+@receiver(pre_delete, sender=Group)
+def drop_group_cards(sender, instance, **kwargs):
+    cards.bump_versions(group_id=instance.pk)
+    feed_cache.bump(feed_cache.EVERYTHING)
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Comment)
+def assign_shard_key(sender, instance, **kwargs):
+    shards.assign_key(instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Group)
+def mirror_to_shards(sender, instance, created, update_fields, using,
+                     **kwargs):
+    # Вход пользователя сохраняет только last_login - копия не нужна
+    if using != DEFAULT_DB_ALIAS or not shards.enabled() or not (
+        created or update_fields is None
+        or set(update_fields) & set(shards.MIRRORED_FIELDS[sender])
+    ):
+        return
+    shards.mirror(sender, [instance])
+
+
+@receiver(pre_delete, sender=User)
+@receiver(pre_delete, sender=Group)
+def drop_shard_mirror(sender, instance, using, **kwargs):
+    if using == DEFAULT_DB_ALIAS:
+        shards.drop_mirror(instance)
+
+
+@receiver(pre_save, sender=Post)
+def strip_search_marks(sender, instance, **kwargs):
+    # Эти символы отмечают совпадения в сниппетах поиска
+    instance.text = search.strip_marks(instance.text)
+
+
+@receiver(pre_save, sender=Post)
+def prepare_post_update(sender, instance, using, **kwargs):
+    if not instance._state.adding:
+        stored = Post.objects.using(using).filter(pk=instance.pk).values(
+            'group_id', 'image', 'version', 'text'
+        ).first() or {}
+        # Версию мог поднять и фоновый пересчёт, берём её из базы
+        instance.version = stored.get('version', instance.version) + 1
+        instance._previous_group_id = stored.get('group_id')
+        instance._previous_image = stored.get('image')
+        instance._previous_text = stored.get('text')
+
+
+@receiver(post_save, sender=Post)
+def push_to_feeds(sender, instance, created, **kwargs):
+    if created:
+        feeds.push_post(instance)
+
+
+@receiver(post_save, sender=Post)
+def schedule_thumbnails(sender, instance, created, **kwargs):
+    image = instance.image.name
+    if image and (created or image != getattr(
+        instance, '_previous_image', None
+    )):
+        transaction.on_commit(partial(images.schedule, instance.pk))
+
+
+@receiver(post_save, sender=Post)
+def index_text(sender, instance, created, using, **kwargs):
+    search.index_post(
+        instance, created, getattr(instance, '_previous_text', None), using
+    )
+
+
+@receiver(pre_delete, sender=Post)
+def unindex_text(sender, instance, using, **kwargs):
+    search.unindex_post(instance, using)
+
+
+@receiver(post_save, sender=Post)
+def count_image_references(sender, instance, created, **kwargs):
+    previous = '' if created else getattr(instance, '_previous_image', '')
+    if instance.image.name != previous:
+        media.retain(instance.image.name)
+        media.release(previous)
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, **kwargs):
+    if created:
+        counters.shift_user(instance.author_id, posts_count=1)
+        counters.shift_group(instance.group_id, 1)
+        return
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    if previous_group_id != instance.group_id:
+        counters.shift_group(previous_group_id, -1)
+        counters.shift_group(instance.group_id, 1)
+
+
+# Поколения лент меняются только после коммита: иначе параллельный
+# запрос успеет закэшировать старый снимок базы под новым поколением.
+# Имена лент считаются сразу: после коммита автора уже может не быть.
+@receiver(post_save, sender=Post)
+def refresh_feeds_on_save(sender, instance, **kwargs):
+    transaction.on_commit(partial(
+        feed_cache.bump, *feed_cache.post_namespaces(
+            instance,
+            instance.group_id,
+            getattr(instance, '_previous_group_id', None),
+        )
+    ))
+
+
+@receiver(post_delete, sender=Post)
+def refresh_feeds_on_delete(sender, instance, **kwargs):
+    transaction.on_commit(partial(
+        feed_cache.bump,
+        *feed_cache.post_namespaces(instance, instance.group_id),
+    ))
+
+
+@receiver(post_delete, sender=Post)
+def drop_feed_entries(sender, instance, using, **kwargs):
+    # Из шарда CASCADE до записей лент в default не дотягивается
+    if using != DEFAULT_DB_ALIAS:
+        feeds.drop_post(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def release_image(sender, instance, **kwargs):
+    media.release(instance.image.name)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    counters.shift_user(instance.author_id, posts_count=-1)
+    counters.shift_group(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.shift_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    counters.shift_comments(instance.post_id, -1)
+
+
+def check_fanout(author_id, delta):
+    # Автор, переставший быть тяжёлым, снова раздаёт посты, но написанные
+    # за время «тяжести» ни в одной ленте не лежат: раздаём их заново.
+    limit = settings.FEED_FANOUT_LIMIT
+    followers = UserStats.objects.filter(user_id=author_id).values_list(
+        'followers_count', flat=True
+    ).first()
+    if followers == (limit + 1 if delta > 0 else limit):
+        transaction.on_commit(partial(feeds.refresh_fanout, author_id))
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(sender, instance, created, **kwargs):
+    if created:
+        counters.shift_user(instance.author_id, followers_count=1)
+        counters.shift_user(instance.user_id, following_count=1)
+        check_fanout(instance.author_id, 1)
+        feeds.backfill(instance.user_id, instance.author_id)
+        transaction.on_commit(partial(
+            feed_cache.bump,
+            f'profile:{instance.author.username}',
+            f'profile:{instance.user.username}',
+            f'follow:{instance.user_id}',
+        ))
+
+
+@receiver(post_delete, sender=Follow)
+def drop_from_feed(sender, instance, **kwargs):
+    feeds.drop_author(instance.user_id, instance.author_id)
+    counters.shift_user(instance.author_id, followers_count=-1)
+    counters.shift_user(instance.user_id, following_count=-1)
+    check_fanout(instance.author_id, -1)
+    transaction.on_commit(partial(
+        feed_cache.bump,
+        f'profile:{instance.author.username}',
+        f'profile:{instance.user.username}',
+        f'follow:{instance.user_id}',
+    ))
@@ -0,0 +1,40 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+def content_name(name, content):
+    """Имя по SHA-256 содержимого в каталоге исходного имени."""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    directory, filename = posixpath.split(name)
+    extension = os.path.splitext(filename)[1].lower()
+    return posixpath.join(directory, digest.hexdigest() + extension)
+
+
+@deconstructible
+class HashedStorage(FileSystemStorage):
+    """Файлы называются хэшем содержимого: одинаковые загрузки
+    ложатся в один файл, а с ним у них общие и миниатюры.
+
+    Удаляет их не хранилище, а posts.media.release, когда на файл
+    не осталось ссылок.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = content_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+
+hashed_storage = HashedStorage()
@@ -0,0 +1,217 @@
+import datetime
+import re
+from unittest import mock
+
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import paginators
+from ..admin import IndexedDatesQuerySet
+from ..models import Comment, Follow, Group, Post, User
+
+
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.admin, text='Первый пост про котиков', group=cls.group,
+        )
+        moments = [
+            timezone.make_aware(datetime.datetime(*date))
+            for date in ((2020, 5, 1), (2020, 5, 3), (2021, 1, 9),
+                         (2023, 12, 31, 23, 30))
+        ]
+        for i, moment in enumerate(moments):
+            post = Post.objects.create(author=cls.admin, text=f'Пост {i}')
+            Post.objects.filter(pk=post.pk).update(pub_date=moment)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def changelist_queries(self, model, data=None):
+        url = reverse(f'admin:posts_{model}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_queries_do_not_grow_with_rows(self):
+        """Число запросов списка не зависит от числа строк."""
+        for model in ('post', 'comment'):
+            with self.subTest(model=model):
+                Comment.objects.create(
+                    post=self.post, author=self.admin, text='Ок'
+                )
+                before = self.changelist_queries(model)
+                for i in range(10):
+                    post = Post.objects.create(
+                        author=User.objects.create_user(f'{model}{i}'),
+                        text='Ещё пост', group=Group.objects.create(
+                            title=f'{model}{i}', slug=f'{model}-{i}',
+                            description='-',
+                        ),
+                    )
+                    Comment.objects.create(
+                        post=post, author=post.author, text='Ок'
+                    )
+                self.assertEqual(self.changelist_queries(model), before)
+
+    def test_no_full_count(self):
+        """Полный COUNT(*) в отфильтрованном списке не выполняется."""
+        url = reverse('admin:posts_post_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {'q': 'котиков'})
+        counts = [query['sql'] for query in queries
+                  if 'COUNT(' in query['sql'] and 'posts_post' in query['sql']]
+        self.assertTrue(counts)
+        self.assertTrue(all('MATCH' in sql for sql in counts))
+
+    def test_search_uses_full_text_index(self):
+        """Поиск в админке постов идёт по FTS5."""
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'котиков'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.post]
+        )
+
+    def test_count_is_capped(self):
+        """Отфильтрованный список считается до COUNT_LIMIT строк."""
+        with mock.patch.object(paginators, 'COUNT_LIMIT', 2):
+            paginator = paginators.EstimatedCountPaginator(
+                Post.objects.filter(author=self.admin), 1
+            )
+            self.assertEqual(paginator.count, 2)
+
+    def test_indexed_dates_match_queryset_dates(self):
+        """date_hierarchy получает те же даты, что и от QuerySet.dates."""
+        queryset = IndexedDatesQuerySet(Post).filter(
+            pub_date__year__lt=2024
+        )
+        for kind in ('year', 'month', 'day'):
+            for order in ('ASC', 'DESC'):
+                with self.subTest(kind=kind, order=order):
+                    self.assertEqual(
+                        queryset.dates('pub_date', kind, order),
+                        list(Post.objects.filter(
+                            pub_date__year__lt=2024
+                        ).dates('pub_date', kind, order)),
+                    )
+
+    def test_date_hierarchy_pages(self):
+        """Навигация по годам и месяцам открывается."""
+        for data in ({}, {'pub_date__year': 2020},
+                     {'pub_date__year': 2020, 'pub_date__month': 5}):
+            with self.subTest(data=data):
+                self.changelist_queries('post', data)
+                self.changelist_queries('comment')
+
+    def test_list_editable_group(self):
+        """Группа поста меняется прямо из списка."""
+        other = Group.objects.create(
+            title='Другая группа', slug='other', description='-'
+        )
+        url = reverse('admin:posts_post_changelist')
+        response = self.client.get(url, {'q': 'котиков'})
+        self.assertContains(response, 'Тестовая группа</option>')
+        response = self.client.post(url + '?q=котиков', {
+            'form-TOTAL_FORMS': 1,
+            'form-INITIAL_FORMS': 1,
+            'form-0-id': self.post.pk,
+            'form-0-group': other.pk,
+            '_save': 'Сохранить',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.group, other)
+
+
+class FollowAdminTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        cls.anna = User.objects.create_user(username='anna')
+        cls.annet = User.objects.create_user(username='annet')
+        cls.boris = User.objects.create_user(username='boris')
+        cls.anna_boris = Follow.objects.create(user=cls.anna, author=cls.boris)
+        cls.boris_annet = Follow.objects.create(
+            user=cls.boris, author=cls.annet
+        )
+        cls.admin_boris = Follow.objects.create(
+            user=cls.admin, author=cls.boris
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:posts_follow_changelist')
+
+    def results(self, data):
+        response = self.client.get(self.url, data)
+        self.assertEqual(response.status_code, 200)
+        return set(response.context['cl'].result_list)
+
+    def test_prefix_search(self):
+        """Поиск по началу имени подписчика или автора."""
+        self.assertEqual(
+            self.results({'q': 'ann'}), {self.anna_boris, self.boris_annet}
+        )
+        self.assertEqual(self.results({'q': 'annet'}), {self.boris_annet})
+        self.assertEqual(self.results({'q': 'nna'}), set())
+
+    def test_prefix_search_uses_indexes(self):
+        """Поиск идёт по индексам, без чтения таблиц целиком."""
+        with CaptureQueriesContext(connection) as queries:
+            self.results({'q': 'ann'})
+        sql = next(query['sql'] for query in queries
+                   if 'posts_follow' in query['sql']
+                   and 'auth_user' in query['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertFalse(
+            [step for step in plan if re.match(r'^SCAN (TABLE )?auth_user$',
+                                               step)],
+            plan,
+        )
+
+    def test_autocomplete_filter(self):
+        """Фильтр не перечисляет пользователей, а фильтрует по id."""
+        response = self.client.get(self.url)
+        self.assertNotContains(response, '>annet</a>')
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertEqual(
+            self.results({'user__id__exact': self.anna.pk}),
+            {self.anna_boris},
+        )
+        response = self.client.get(
+            self.url, {'author__id__exact': self.boris.pk}
+        )
+        self.assertContains(response, '<option value="%s" selected>boris'
+                            % self.boris.pk)
+
+    def test_user_autocomplete(self):
+        """Подсказки пользователей - по началу имени."""
+        response = self.client.get(
+            reverse('admin:auth_user_autocomplete'), {'term': 'ann'}
+        )
+        self.assertEqual(
+            [item['text'] for item in response.json()['results']],
+            ['anna', 'annet'],
+        )
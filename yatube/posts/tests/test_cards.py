@@ -0,0 +1,61 @@
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..cards import CARD_TEMPLATE, post_cards
+from ..models import Group, Post, User
+
+
+class PostCardsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='auth', first_name='Имя', last_name='Фамилия'
+        )
+        cls.autoriz_client = Client()
+        cls.autoriz_client.force_login(cls.user)
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text='Тестовый пост', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def render_card(self):
+        return str(post_cards(Post.objects.for_feed())[0])
+
+    def test_cards_are_cached(self):
+        """Повторная страница берёт карточки из кэша, не рендеря их."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        response = self.autoriz_client.get(url)
+        self.assertTemplateUsed(response, CARD_TEMPLATE)
+        response = self.autoriz_client.get(url)
+        self.assertTemplateNotUsed(response, CARD_TEMPLATE)
+        self.assertContains(response, 'Тестовый пост')
+
+    def test_edit_refreshes_card(self):
+        """Правка поста сбрасывает его карточку."""
+        self.render_card()
+        self.autoriz_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.id}),
+            data={'text': 'Изменённый пост'},
+        )
+        self.assertIn('Изменённый пост', self.render_card())
+
+    def test_group_and_author_changes_refresh_card(self):
+        """Переименование группы и автора сбрасывает карточки."""
+        self.render_card()
+        self.group.title = 'Новое название'
+        self.group.save()
+        self.assertIn('Новое название', self.render_card())
+        self.user.first_name = 'Другое'
+        self.user.save()
+        self.assertIn('Другое Фамилия', self.render_card())
+        self.group.delete()
+        self.assertNotIn('Новое название', self.render_card())
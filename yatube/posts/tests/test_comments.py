@@ -0,0 +1,70 @@
+from urllib.parse import parse_qs, urlsplit
+
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..comments import COMMENTS_PER_PAGE
+from ..models import Comment, Post, User
+
+
+class CommentsPageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.autoriz_client = Client()
+        cls.autoriz_client.force_login(cls.user)
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+        for i in range(COMMENTS_PER_PAGE * 2 + 5):
+            Comment.objects.create(
+                post=cls.post, author=cls.user, text=f'Коммент-{i}'
+            )
+        cls.expected = list(Comment.objects.order_by('created', 'id'))
+        cls.detail_url = reverse(
+            'posts:post_detail', kwargs={'post_id': cls.post.id}
+        )
+        cls.fragment_url = reverse(
+            'posts:post_comments', kwargs={'post_id': cls.post.id}
+        )
+
+    def test_comments_are_loaded_by_portions(self):
+        """Первая порция на странице поста, остальные фрагментами."""
+        response = self.autoriz_client.get(self.detail_url)
+        loaded = list(response.context['comments'])
+        cursor = response.context['next_cursor']
+        while cursor:
+            response = self.autoriz_client.get(
+                self.fragment_url, {'comments': cursor}
+            )
+            self.assertTemplateUsed(
+                response, 'posts/includes/comments.html'
+            )
+            self.assertTemplateNotUsed(response, 'base.html')
+            loaded += response.context['comments']
+            cursor = response.context['next_cursor']
+        self.assertEqual(loaded, self.expected)
+
+    def test_fragment_of_missing_post(self):
+        """Фрагмент комментариев несуществующего поста - 404."""
+        response = self.autoriz_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 10 ** 6})
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_add_comment_opens_its_portion(self):
+        """После комментария открывается порция, где он виден."""
+        response = self.autoriz_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+            data={'text': 'Новый коммент'},
+        )
+        comment = Comment.objects.get(text='Новый коммент')
+        url = urlsplit(response.url)
+        self.assertEqual(url.path, self.detail_url)
+        self.assertEqual(url.fragment, f'comment-{comment.id}')
+        response = self.autoriz_client.get(
+            self.detail_url, parse_qs(url.query)
+        )
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENTS_PER_PAGE)
+        self.assertEqual(comments[-1], comment)
+        self.assertContains(response, f'id="comment-{comment.id}"')
@@ -0,0 +1,101 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..models import Comment, Follow, Group, Post, User, UserStats
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.group2 = Group.objects.create(
+            title='Тестовая группа-2',
+            slug='test-slug-2',
+            description='Тестовое описание-2',
+        )
+
+    def assertCounters(self, user, **expected):
+        stats = UserStats.objects.get(user=user)
+        for field, value in expected.items():
+            with self.subTest(field=field):
+                self.assertEqual(getattr(stats, field), value)
+
+    def test_post_and_comment_counters(self):
+        """Счётчики постов и комментариев следуют за записью и удалением."""
+        post = Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group
+        )
+        self.assertCounters(self.user, posts_count=1)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        post.group = self.group2
+        post.save()
+        self.assertEqual(
+            list(Group.objects.order_by('pk').values_list(
+                'posts_count', flat=True
+            )),
+            [0, 1],
+        )
+        Comment.objects.create(post=post, author=self.reader, text='Ок')
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        post.delete()
+        self.assertCounters(self.user, posts_count=0)
+        self.group2.refresh_from_db()
+        self.assertEqual(self.group2.posts_count, 0)
+
+    def test_follow_counters(self):
+        """Подписка и отписка меняют счётчики обеих сторон."""
+        Follow.objects.create(author=self.user, user=self.reader)
+        self.assertCounters(self.user, followers_count=1, following_count=0)
+        self.assertCounters(self.reader, followers_count=0, following_count=1)
+        Follow.objects.all().delete()
+        self.assertCounters(self.user, followers_count=0)
+        self.assertCounters(self.reader, following_count=0)
+
+    def test_failed_counter_rolls_back_write(self):
+        """Сбой счётчика откатывает и саму запись."""
+        post = Post.objects.create(author=self.user, text='Тестовый пост')
+        with mock.patch('posts.counters.shift_comments',
+                        side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                Comment.objects.create(post=post, author=self.reader,
+                                       text='Ок')
+        self.assertFalse(Comment.objects.exists())
+        with mock.patch('posts.counters.shift_user',
+                        side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                post.delete()
+        self.assertTrue(Post.objects.filter(pk=post.pk).exists())
+        self.assertCounters(self.user, posts_count=1)
+
+    def test_reconcile_counters_repairs_drift(self):
+        """reconcile_counters исправляет разошедшиеся счётчики."""
+        post = Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group
+        )
+        Comment.objects.create(post=post, author=self.reader, text='Ок')
+        Follow.objects.create(author=self.user, user=self.reader)
+        UserStats.objects.filter(user=self.reader).delete()
+        UserStats.objects.update(posts_count=7, followers_count=7)
+        Group.objects.update(posts_count=7)
+        Post.objects.update(comments_count=7)
+        call_command(
+            'reconcile_counters', '--chunk-size', '1', stdout=StringIO()
+        )
+        self.assertCounters(self.user, posts_count=1, followers_count=1)
+        self.assertCounters(self.reader, posts_count=0, following_count=1)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
@@ -0,0 +1,144 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import Permission
+from django.core.management import call_command
+from django.db import transaction
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from .. import deletion
+from ..models import (Comment, DeletionJob, FeedEntry, Follow, Group, Post,
+                      User, UserStats)
+
+
+@override_settings(DELETION_BATCH_SIZE=2, DELETION_IN_BACKGROUND=False)
+class DeletionTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=self.reader, author=self.user)
+        Follow.objects.create(user=self.user, author=self.reader)
+        self.posts = [
+            Post.objects.create(
+                author=self.user, text=f'Пост {i}', group=self.group
+            )
+            for i in range(5)
+        ]
+        self.other_post = Post.objects.create(
+            author=self.reader, text='Чужой пост', group=self.group
+        )
+        for post in self.posts[:2]:
+            Comment.objects.create(post=post, author=self.reader, text='Ок')
+        Comment.objects.create(
+            post=self.other_post, author=self.user, text='Ок'
+        )
+
+    def test_user_is_deleted_in_batches(self):
+        """Пользователь удаляется порциями со всем, что с ним связано."""
+        with mock.patch.object(
+            deletion.transaction, 'atomic', wraps=transaction.atomic
+        ) as atomic:
+            job = deletion.schedule(self.user)
+        job.refresh_from_db()
+        self.assertEqual(job.state, DeletionJob.DONE)
+        # total - оценка: часть строк удаляют сигналы соседних шагов
+        self.assertLessEqual(job.processed, job.total)
+        self.assertEqual(job.progress, 100)
+        # 5 постов порциями по 2 - уже три транзакции
+        self.assertGreaterEqual(atomic.call_count, 3)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Post.objects.filter(author=self.user.pk).exists())
+        self.assertFalse(Comment.objects.filter(author=self.user.pk).exists())
+        self.assertFalse(
+            FeedEntry.objects.filter(author=self.user.pk).exists()
+        )
+        self.assertEqual(Follow.objects.count(), 0)
+        stats = UserStats.objects.get(user=self.reader)
+        self.assertEqual(
+            (stats.followers_count, stats.following_count), (0, 0)
+        )
+        self.other_post.refresh_from_db()
+        self.assertEqual(self.other_post.comments_count, 0)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+
+    def test_group_posts_are_detached(self):
+        """У постов удаляемой группы группа снимается порциями."""
+        versions = dict(Post.objects.values_list('pk', 'version'))
+        job = deletion.schedule(self.group)
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.processed), (DeletionJob.DONE, 7))
+        self.assertFalse(Group.objects.exists())
+        for pk, version in Post.objects.values_list('pk', 'version'):
+            self.assertEqual(version, versions[pk] + 1)
+        self.assertEqual(Post.objects.filter(group__isnull=True).count(), 6)
+
+    def test_failed_job_is_resumed(self):
+        """run_deletions доводит прерванное удаление до конца."""
+        post = self.posts[0]
+        with mock.patch.object(
+            deletion, '_run_step', side_effect=RuntimeError('сбой')
+        ):
+            job = deletion.schedule(post)
+        job.refresh_from_db()
+        self.assertEqual(job.state, DeletionJob.FAILED)
+        self.assertIn('сбой', job.error)
+        out = StringIO()
+        call_command('run_deletions', stdout=out)
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists())
+        self.assertIn('удалён', out.getvalue())
+
+    def test_admin_deletes_in_background(self):
+        """Админка удаляет через фоновые задачи, без обхода связей."""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        client = Client()
+        client.force_login(admin)
+        url = reverse('admin:posts_post_changelist')
+        response = client.get(url)
+        actions = [name for name, _ in
+                   response.context['action_form'].fields['action'].choices]
+        self.assertIn('delete_in_background', actions)
+        self.assertNotIn('delete_selected', actions)
+        response = client.post(url, {
+            'action': 'delete_in_background',
+            '_selected_action': [post.pk for post in self.posts[:2]],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Post.objects.filter(author=self.user).count(), 3)
+        delete_url = reverse('admin:auth_user_delete', args=[self.user.pk])
+        response = client.get(delete_url)
+        self.assertNotContains(response, 'Пост 2')
+        client.post(delete_url, {'post': 'yes'})
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(DeletionJob.objects.filter(
+            state=DeletionJob.DONE
+        ).count(), 3)
+
+    def test_admin_checks_cascade_permissions(self):
+        """Без прав на посты и комментарии пользователя не удалить."""
+        staff = User.objects.create_user('staff', is_staff=True)
+        staff.user_permissions.add(*Permission.objects.filter(
+            codename__in=('view_user', 'delete_user')
+        ))
+        client = Client()
+        client.force_login(staff)
+        delete_url = reverse('admin:auth_user_delete', args=[self.user.pk])
+        response = client.get(delete_url)
+        self.assertEqual(set(response.context['perms_lacking']),
+                         {'Пост', 'Комментарий', 'Подписка'})
+        response = client.post(delete_url, {'post': 'yes'})
+        self.assertEqual(response.status_code, 403)
+        response = client.post(reverse('admin:auth_user_changelist'), {
+            'action': 'delete_in_background',
+            '_selected_action': [self.user.pk],
+        })
+        self.assertTrue(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(DeletionJob.objects.exists())
@@ -0,0 +1,92 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ..feeds import follow_feed
+from ..models import FeedEntry, Follow, Post, User
+from . import run_on_commit
+
+
+class FeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        for i in range(3):
+            Post.objects.create(author=cls.author, text=f'Тестовый пост-{i}')
+
+    def setUp(self):
+        cache.clear()
+
+    def follow_posts(self):
+        return follow_feed(self.reader).fetch(None, True, 100)
+
+    def test_follow_unfollow_updates_feed(self):
+        """Подписка дозаполняет ленту, новый пост в неё попадает,
+        отписка её очищает."""
+        Follow.objects.create(author=self.author, user=self.reader)
+        self.assertEqual(FeedEntry.objects.filter(user=self.reader).count(), 3)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(self.follow_posts()[0], post)
+        Follow.objects.filter(author=self.author, user=self.reader).delete()
+        self.assertFalse(FeedEntry.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.follow_posts(), [])
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_heavy_author_is_pulled(self):
+        """Посты авторов сверх лимита не раздаются, а читаются напрямую."""
+        Follow.objects.create(author=self.author, user=self.reader)
+        cache.clear()
+        Post.objects.create(author=self.author, text='Новый пост')
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(
+            set(self.follow_posts()),
+            set(Post.objects.filter(author=self.author)),
+        )
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_pulled_posts_are_merged_in_order(self):
+        """Записи ленты и посты тяжёлых авторов сливаются по дате."""
+        light = User.objects.create_user(username='light')
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(author=self.author, user=self.reader)
+        Follow.objects.create(author=self.author, user=other)
+        Follow.objects.create(author=light, user=self.reader)
+        cache.clear()
+        for i in range(4):
+            Post.objects.create(author=light, text=f'Лёгкий пост-{i}')
+            Post.objects.create(author=self.author, text=f'Новый пост-{i}')
+        self.assertEqual(
+            self.follow_posts(),
+            list(Post.objects.order_by('-pub_date', '-id')),
+        )
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_author_below_limit_is_fanned_out_again(self):
+        """Посты, написанные, пока автор был тяжёлым, попадают в ленты,
+        как только подписчиков снова не больше лимита."""
+        other = User.objects.create_user(username='other')
+        with run_on_commit():
+            Follow.objects.create(author=self.author, user=self.reader)
+            Follow.objects.create(author=self.author, user=other)
+        post = Post.objects.create(author=self.author, text='Пока тяжёлый')
+        self.assertFalse(FeedEntry.objects.filter(post=post).exists())
+        with run_on_commit():
+            Follow.objects.filter(user=other).delete()
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.reader, post=post
+        ).exists())
+        self.assertEqual(self.follow_posts()[0], post)
+
+    def test_rebuild_command(self):
+        """Команда rebuild_feeds восстанавливает ленту."""
+        Follow.objects.create(author=self.author, user=self.reader)
+        FeedEntry.objects.all().delete()
+        call_command('rebuild_feeds', stdout=StringIO())
+        self.assertEqual(
+            set(self.follow_posts()),
+            set(Post.objects.filter(author=self.author)),
+        )
@@ -0,0 +1,70 @@
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from ..images import EXIF_ORIENTATION, normalize_image
+from ..models import Post, StoredFile, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def photo(size, orientation=1):
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = orientation
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif.tobytes())
+    return SimpleUploadedFile('photo.jpg', buffer.getvalue(), 'image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostImageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.autoriz_client = Client()
+        cls.autoriz_client.force_login(cls.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=1000)
+    def test_too_many_pixels_are_rejected(self):
+        """Картинка больше лимита по заголовку не принимается."""
+        response = self.autoriz_client.post(reverse('posts:post_create'), {
+            'text': 'Огромная картинка',
+            'image': photo((50, 50)),
+        })
+        self.assertFormError(
+            response, 'form', 'image',
+            'Картинка слишком большая: 50×50 пикселей.',
+        )
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_SIDE=60)
+    def test_normalize_rotates_and_downsizes(self):
+        """Оригинал поворачивается по EXIF и уменьшается, ссылка
+        переходит на новый файл."""
+        post = Post.objects.create(
+            author=self.user, text='Фото', image=photo((200, 100), 6)
+        )
+        old = post.image.name
+        self.assertTrue(normalize_image(post.id))
+        post.refresh_from_db()
+        self.assertNotEqual(post.image.name, old)
+        self.assertFalse(StoredFile.objects.filter(name=old).exists())
+        self.assertEqual(
+            StoredFile.objects.get(name=post.image.name).references, 1
+        )
+        with Image.open(post.image) as image:
+            self.assertEqual(image.size, (30, 60))
+            self.assertEqual(image.getexif().get(EXIF_ORIENTATION, 1), 1)
+        self.assertFalse(normalize_image(post.id))
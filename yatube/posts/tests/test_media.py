@@ -0,0 +1,99 @@
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings
+from PIL import Image
+
+from .. import media
+from ..models import Post, StoredFile, User
+from ..storage import hashed_storage
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def picture(color):
+    buffer = BytesIO()
+    Image.new('RGB', (40, 20), color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class HashedMediaTests(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+
+    def post(self, content, name='meme.jpg'):
+        return Post.objects.create(
+            author=self.user, text='Мем',
+            image=SimpleUploadedFile(name, content, 'image/jpeg'),
+        )
+
+    def test_same_upload_is_stored_once(self):
+        """Одинаковые загрузки делят файл, он удаляется с последним
+        постом."""
+        first = self.post(picture('red'))
+        second = self.post(picture('red'), 'copy.jpg')
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(StoredFile.objects.get(name=name).references, 2)
+        first.delete()
+        self.assertTrue(hashed_storage.exists(name))
+        second.delete()
+        self.assertFalse(hashed_storage.exists(name))
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_retain_after_last_release_keeps_file(self):
+        """Файл, который снова взяли до коммита удаления, остаётся."""
+        post = self.post(picture('blue'))
+        name = post.image.name
+        with transaction.atomic():
+            media.release(name)
+            self.assertFalse(StoredFile.objects.exists())
+            media.retain(name)
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+        self.assertTrue(hashed_storage.exists(name))
+        media.retain(name)
+        media.release(name)
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+
+    def test_dedupe_media_command(self):
+        """Команда dedupe_media склеивает старые файлы-дубликаты."""
+        names = [
+            default_storage.save(f'posts/{name}.jpg', ContentFile(content))
+            for name, content in (
+                ('a', picture('red')),
+                ('b', picture('red')),
+                ('c', picture('green')),
+            )
+        ]
+        for name in names:
+            post = Post.objects.create(author=self.user, text='Старый пост')
+            Post.objects.filter(pk=post.pk).update(image=name)
+        out = StringIO()
+        call_command('dedupe_media', stdout=out)
+        self.assertIn('Перенесено файлов: 2, склеено дубликатов: 1',
+                      out.getvalue())
+        self.assertIn('освобождено', out.getvalue())
+        images = [post.image.name for post in Post.objects.order_by('pk')]
+        self.assertEqual(images[0], images[1])
+        self.assertNotEqual(images[1], images[2])
+        for name in names:
+            self.assertFalse(default_storage.exists(name))
+        for name in set(images):
+            self.assertTrue(hashed_storage.exists(name))
+        self.assertEqual(
+            dict(StoredFile.objects.values_list('name', 'references')),
+            {images[0]: 2, images[2]: 1},
+        )
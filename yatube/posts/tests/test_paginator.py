@@ -0,0 +1,154 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..feed_cache import cached_count
+from ..models import Post, User
+from ..paginators import LAST_PAGE, CursorPaginator, approximate_count
+from . import run_on_commit
+
+
+class CursorPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.PER_PAGE = 10
+        cls.user = User.objects.create_user(username='auth')
+        cls.guest_client = Client()
+        for i in range(25):
+            Post.objects.create(author=cls.user, text=f'Тестовый пост-{i}')
+        cls.expected = list(Post.objects.order_by('-pub_date', '-id'))
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, cursor=None, direction='next_cursor'):
+        pages = []
+        while True:
+            paginator = CursorPaginator(Post.objects.all(), self.PER_PAGE)
+            page = paginator.get_page(cursor=cursor)
+            pages.append(page)
+            cursor = getattr(paginator, direction)
+            if cursor is None:
+                return pages
+
+    def test_first_page_without_count(self):
+        """Первая страница собирается одним запросом, без COUNT."""
+        with self.assertNumQueries(1):
+            page = CursorPaginator(
+                Post.objects.all(), self.PER_PAGE
+            ).get_page()
+            self.assertTrue(page.has_next())
+        self.assertEqual(page.object_list, self.expected[:self.PER_PAGE])
+
+    def test_forward_and_backward_walk(self):
+        """По курсорам проходятся все посты без пропусков и повторов."""
+        pages = self.walk()
+        self.assertEqual([page.number for page in pages], [1, 2, 3])
+        posts = [post for page in pages for post in page]
+        self.assertEqual(posts, self.expected)
+        second = pages[1].paginator
+        back = CursorPaginator(
+            Post.objects.all(), self.PER_PAGE
+        ).get_page(cursor=second.previous_cursor)
+        self.assertEqual(back.number, 1)
+        self.assertFalse(back.has_previous())
+        self.assertEqual(back.object_list, self.expected[:self.PER_PAGE])
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        """Испорченный курсор открывает первую страницу."""
+        page = CursorPaginator(
+            Post.objects.all(), self.PER_PAGE
+        ).get_page(cursor='мусор')
+        self.assertEqual(page.number, 1)
+
+    def test_page_parameter_still_works(self):
+        """Старые ссылки ?page= продолжают работать."""
+        response = self.guest_client.get(
+            reverse('posts:index'), {'page': 3}
+        )
+        page = response.context['page_obj']
+        self.assertEqual(page.number, 3)
+        self.assertEqual(page.object_list, self.expected[20:])
+        response = self.guest_client.get(
+            reverse('posts:index'),
+            {'cursor': page.paginator.previous_cursor},
+        )
+        self.assertEqual(response.context['page_obj'].object_list,
+                         self.expected[10:20])
+
+    def test_overestimated_count_opens_last_page(self):
+        """Страница за концом ленты при завышенном числе постов -
+        последняя настоящая, а не пустая."""
+        for number in ('20', LAST_PAGE):
+            with self.subTest(number=number):
+                paginator = CursorPaginator(
+                    Post.objects.all(), self.PER_PAGE, count=1000
+                )
+                page = paginator.get_page(number)
+                self.assertEqual(page.object_list,
+                                 self.expected[-self.PER_PAGE:])
+                self.assertTrue(page.has_previous())
+                self.assertFalse(page.has_next())
+                back = CursorPaginator(
+                    Post.objects.all(), self.PER_PAGE
+                ).get_page(cursor=paginator.previous_cursor)
+                self.assertEqual(back.object_list,
+                                 self.expected[5:15])
+        response = self.guest_client.get(reverse('posts:index'),
+                                         {'page': 20})
+        self.assertEqual(response.status_code, 200)
+
+    def test_page_links_avoid_deep_offsets(self):
+        """Дальние номера не ведут через OFFSET: соседние - по курсорам,
+        последний - ?page=last."""
+        paginator = CursorPaginator(
+            Post.objects.all(), self.PER_PAGE, count=10 ** 6
+        )
+        paginator.get_page()
+        paginator.current_number = 50000
+        paginator.previous_cursor = 'prev'
+        paginator.next_cursor = 'next'
+        self.assertEqual(paginator.page_links, [
+            (1, '?page=1'), (None, None), (49998, None),
+            (49999, '?cursor=prev'), (50000, None), (50001, '?cursor=next'),
+            (50002, None), (None, None), (100000, f'?page={LAST_PAGE}'),
+        ])
+
+    def test_elided_page_range(self):
+        """Номера страниц выводятся окном, сколько бы их ни было."""
+        paginator = CursorPaginator(
+            Post.objects.all(), self.PER_PAGE, count=10 ** 6
+        )
+        paginator.get_page()
+        self.assertEqual(paginator.elided_page_range,
+                         [1, 2, 3, None, 100000])
+        paginator.current_number = 50000
+        self.assertEqual(
+            paginator.elided_page_range,
+            [1, None, 49998, 49999, 50000, 50001, 50002, None, 100000],
+        )
+        small = CursorPaginator(Post.objects.all(), self.PER_PAGE)
+        small.get_page()
+        self.assertEqual(small.elided_page_range, [1, 2, 3])
+
+    def test_count_is_cached_until_write(self):
+        """Число постов ленты считается один раз до следующей записи."""
+        posts = Post.objects.all()
+        self.assertEqual(cached_count('index', posts), 25)
+        with self.assertNumQueries(0):
+            self.assertEqual(cached_count('index', posts), 25)
+        with run_on_commit():
+            Post.objects.create(author=self.user, text='Ещё пост')
+        self.assertEqual(cached_count('index', posts), 26)
+
+    def test_approximate_count(self):
+        """Большая таблица без фильтров оценивается по диапазону id."""
+        with mock.patch('posts.paginators.APPROXIMATE_COUNT_THRESHOLD', 5):
+            Post.objects.filter(pk=self.expected[5].pk).delete()
+            self.assertEqual(approximate_count(Post.objects.all()), 25)
+            self.assertEqual(
+                approximate_count(Post.objects.filter(author=self.user)), 24
+            )
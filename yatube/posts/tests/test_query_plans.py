@@ -0,0 +1,80 @@
+import re
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\S+$')
+TEMP_SORT = 'TEMP B-TREE'
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN из SQLite')
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.autoriz_client = Client()
+        cls.autoriz_client.force_login(cls.reader)
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(author=cls.user, user=cls.reader)
+        for i in range(15):
+            post = Post.objects.create(
+                author=cls.user, text=f'Тестовый пост-{i}', group=cls.group
+            )
+        cls.post = post
+        for i in range(3):
+            Comment.objects.create(post=post, author=cls.reader, text='Ок')
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexedQueries(self, url, data=None):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.autoriz_client.get(url, data)
+        for query in queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or 'posts_' not in sql:
+                continue
+            for step in self.plan(sql):
+                with self.subTest(url=url, sql=sql, step=step):
+                    self.assertNotRegex(step, FULL_SCAN)
+                    self.assertNotIn(TEMP_SORT, step)
+        return response
+
+    def test_feed_views_use_indexes(self):
+        """Запросы лент идут по индексам, без полного обхода и сортировки."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:follow_index'),
+        ]
+        for url in urls:
+            response = self.assertIndexedQueries(url)
+            self.assertIndexedQueries(
+                url, {'cursor': response.context['page_obj'].paginator
+                      .next_cursor}
+            )
+
+    def test_post_detail_uses_indexes(self):
+        """Страница поста и её комментарии идут по индексам."""
+        self.assertIndexedQueries(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        )
+        self.assertIndexedQueries(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.id})
+        )
@@ -0,0 +1,128 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Group, Post, User
+from ..search import SEARCH_TABLE, SearchResults, highlight
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.rare = Post.objects.create(
+            author=cls.user, text='Котики спят. Про котиков и не только.',
+        )
+        cls.often = Post.objects.create(
+            author=cls.user, group=cls.group,
+            text='Котики котики котики, всюду котики',
+        )
+        cls.foreign = Post.objects.create(
+            author=cls.other, text='Собаки и котики <b>дружат</b>',
+        )
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def found(self, query, **filters):
+        return [post.pk for post in SearchResults(query, **filters)[:10]]
+
+    def test_ranking_and_filters(self):
+        """Выдача по BM25, фильтры по группе и автору."""
+        found = self.found('котики')
+        self.assertEqual(found[0], self.often.pk)
+        self.assertCountEqual(found, [self.often.pk, self.rare.pk,
+                                      self.foreign.pk])
+        self.assertEqual(self.found('Котики спят'), [self.rare.pk])
+        self.assertEqual(
+            self.found('котики', group_id=self.group.pk), [self.often.pk]
+        )
+        self.assertEqual(
+            self.found('котики', author_id=self.other.pk), [self.foreign.pk]
+        )
+        self.assertEqual(SearchResults('котики').count(), 3)
+
+    def test_query_syntax_is_escaped(self):
+        """Операторы FTS5 во вводе не ломают запрос."""
+        for query in ('"котики', 'котики OR', 'text:котики*', '-()', ''):
+            with self.subTest(query=query):
+                SearchResults(query).count()
+                SearchResults(query)[:10]
+
+    def test_snippet_is_escaped(self):
+        """Сниппет экранирован, совпадения выделены."""
+        post, = SearchResults('дружат')[:1]
+        self.assertIn('&lt;b&gt;<mark>дружат</mark>&lt;/b&gt;', post.snippet)
+
+    def test_marks_in_text_keep_snippet_balanced(self):
+        """Символы-границы в тексте поста не ломают разметку."""
+        post = Post.objects.create(
+            author=self.user, text='Ёжики \x03 \x02дружат\x02 с \x02белками'
+        )
+        self.assertEqual(post.text, 'Ёжики  дружат с белками')
+        self.assertEqual(
+            str(highlight('\x03a \x02b\x02 c\x03 \x02d <e>')),
+            'a <mark>b c</mark> <mark>d &lt;e&gt;</mark>',
+        )
+
+    def test_index_follows_edits(self):
+        """Правка и удаление поста меняют индекс."""
+        post = Post.objects.get(pk=self.rare.pk)
+        post.text = 'Теперь про хомяков'
+        post.save()
+        self.assertNotIn(self.rare.pk, self.found('котики'))
+        self.assertEqual(self.found('хомяков'), [self.rare.pk])
+        Post.objects.get(pk=self.foreign.pk).delete()
+        self.assertEqual(self.found('собаки'), [])
+        with connection.cursor() as cursor:
+            # Проверка целостности external content индекса
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rank) '
+                "VALUES ('integrity-check', 1)"
+            )
+
+    def test_rebuild_command(self):
+        """Команда пересобирает индекс с нуля."""
+        Post.objects.filter(pk=self.rare.pk).update(text='Хомяки')
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertEqual(self.found('хомяки'), [self.rare.pk])
+        self.assertIn('3', out.getvalue())
+
+    def test_search_page(self):
+        """Страница поиска: сниппеты, фильтры и пагинация."""
+        url = reverse('posts:search')
+        response = self.guest_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('page_obj', response.context)
+        response = self.guest_client.get(
+            url, {'q': 'котики', 'group': self.group.slug}
+        )
+        self.assertTemplateUsed(response, 'posts/search.html')
+        self.assertEqual(list(response.context['page_obj']), [self.often])
+        self.assertContains(response, '<mark>Котики</mark>')
+        response = self.guest_client.get(
+            url, {'q': 'котики', 'author': 'nobody'}
+        )
+        self.assertEqual(response.context['page_obj'].paginator.count, 0)
+
+    def test_search_pages(self):
+        """Ссылки на страницы сохраняют запрос."""
+        for i in range(12):
+            Post.objects.create(author=self.user, text=f'Котики {i}')
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': 'котики', 'page': 2}
+        )
+        self.assertEqual(len(response.context['page_obj']), 5)
+        self.assertContains(response, '?q=%D0%BA%D0%BE%D1%82%D0%B8%D0%BA%D0')
+        self.assertContains(response, 'page=1')
@@ -0,0 +1,297 @@
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import QuerySet
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from .. import deletion, feed_cache, search, shards
+from ..models import (Comment, FeedEntry, Follow, Group, Post, PostKey, User,
+                      UserStats)
+from ..search import SearchResults
+
+SHARDS = ['shard_a', 'shard_b']
+
+
+@override_settings(POST_SHARDS=SHARDS, DELETION_IN_BACKGROUND=False)
+class ShardTests(TransactionTestCase):
+    """Шарды - два файла SQLite рядом с тестовой базой."""
+
+    databases = {DEFAULT_DB_ALIAS, *SHARDS}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        for alias in SHARDS:
+            connections.databases[alias] = {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(cls.directory.name, f'{alias}.sqlite3'),
+            }
+            call_command('migrate', database=alias, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in SHARDS:
+            connections[alias].close()
+            del connections.databases[alias]
+            delattr(connections._connections, alias)
+        cls.directory.cleanup()
+
+    def setUp(self):
+        cache.clear()
+        shards._authors.clear()
+        for alias in SHARDS:
+            # Индекс FTS5 не очищается вместе с таблицами
+            search.rebuild(alias)
+        self.group = Group.objects.create(title='Группа', slug='group')
+        # Соседние id - в разных шардах
+        self.authors = [User.objects.create_user(username=f'author{i}')
+                        for i in range(2)]
+        self.reader = User.objects.create_user(username='reader')
+
+    def create_posts(self, count=3):
+        return [
+            Post.objects.create(author=author, text=f'Пост {i} {author}',
+                                group=self.group)
+            for i in range(count) for author in self.authors
+        ]
+
+    def located(self, model, alias):
+        return set(model.objects.using(alias).values_list('pk', flat=True))
+
+    def test_posts_and_comments_go_to_author_shard(self):
+        """Пост и комментарии к нему - в шарде автора поста."""
+        posts = self.create_posts(1)
+        comment = Comment.objects.create(
+            post=posts[0], author=self.authors[1], text='Ок'
+        )
+        self.assertEqual(len({shards.for_author(author.pk)
+                              for author in self.authors}), 2)
+        for post in posts:
+            alias = shards.for_author(post.author_id)
+            self.assertIn(post.pk, self.located(Post, alias))
+            self.assertEqual(shards.for_post(post.pk), alias)
+        self.assertEqual(self.located(Post, DEFAULT_DB_ALIAS), set())
+        self.assertEqual(
+            self.located(Comment, shards.for_author(posts[0].author_id)),
+            {comment.pk},
+        )
+        # Счётчик комментариев - в строке поста в шарде
+        self.assertEqual(
+            Post.objects.using(shards.for_post(posts[0].pk))
+            .get(pk=posts[0].pk).comments_count,
+            1,
+        )
+        self.assertEqual(
+            set(PostKey.objects.values_list('pk', flat=True)),
+            {post.pk for post in posts},
+        )
+
+    def test_feeds_merge_shards(self):
+        """Общие ленты сливают шарды по убыванию даты."""
+        posts = self.create_posts(6)
+        expected = sorted(posts, key=lambda post: (post.pub_date, post.pk),
+                          reverse=True)
+        client = Client()
+        for url in (reverse('posts:index'),
+                    reverse('posts:group_list', args=[self.group.slug])):
+            with self.subTest(url=url):
+                response = client.get(url)
+                page = response.context['page_obj']
+                self.assertEqual(list(page), expected[:10])
+                self.assertEqual(page.paginator.count, 12)
+                response = client.get(
+                    url, {'cursor': page.paginator.next_cursor}
+                )
+                self.assertEqual(list(response.context['page_obj']),
+                                 expected[10:])
+        response = client.get(
+            reverse('posts:profile', args=[self.authors[0].username])
+        )
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [post for post in expected if post.author == self.authors[0]],
+        )
+
+    def test_index_count_is_estimated_once(self):
+        """Оценка числа постов - по общему диапазону id, а не по шардам."""
+        self.create_posts(5)
+        with mock.patch('posts.paginators.APPROXIMATE_COUNT_THRESHOLD', 2):
+            self.assertEqual(
+                feed_cache.cached_count('index', Post.objects.all()), 10
+            )
+
+    def test_follow_feed_reads_posts_from_shards(self):
+        posts = self.create_posts(2)
+        for author in self.authors:
+            Follow.objects.create(user=self.reader, author=author)
+        client = Client()
+        client.force_login(self.reader)
+        response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']),
+            sorted(posts, key=lambda post: (post.pub_date, post.pk),
+                   reverse=True),
+        )
+
+    def test_failed_post_leaves_no_key(self):
+        """Ключ поста создаётся в одной транзакции с самим постом."""
+        with mock.patch('posts.feeds.push_post', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                Post.objects.create(author=self.authors[0], text='Пост')
+        self.assertFalse(PostKey.objects.exists())
+        for alias in SHARDS:
+            self.assertEqual(self.located(Post, alias), set())
+
+    def test_mirror_updates_only_changed_copies(self):
+        with mock.patch.object(
+            QuerySet, 'bulk_update', autospec=True
+        ) as bulk_update:
+            self.group.save()
+            bulk_update.assert_not_called()
+            self.group.title = 'Новое имя'
+            self.group.save()
+        self.assertEqual(bulk_update.call_count, len(SHARDS))
+
+    def test_post_pages_find_shard(self):
+        """Страницы поста по id находят его шард."""
+        post = self.create_posts(1)[1]
+        client = Client()
+        client.force_login(self.reader)
+        response = client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+            {'text': 'Комментарий'},
+        )
+        comment = Comment.objects.using(shards.for_post(post.pk)).get()
+        self.assertRedirects(
+            response, f'/posts/{post.pk}/#comment-{comment.pk}',
+            fetch_redirect_response=False,
+        )
+        response = client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        self.assertEqual(response.context['post'], post)
+        self.assertEqual(list(response.context['comments']), [comment])
+        self.assertEqual(client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': post.pk + 100}
+        )).status_code, 404)
+
+    def test_search_covers_all_shards(self):
+        posts = self.create_posts(1)
+        results = SearchResults('Пост')
+        self.assertEqual(results.count(), 2)
+        self.assertEqual(set(results[0:10]), set(posts))
+        self.assertEqual(list(SearchResults(
+            'Пост', author_id=self.authors[1].pk
+        )[0:10]), [posts[1]])
+
+    def test_deleted_user_leaves_no_posts(self):
+        """Удаление пользователя удаляет его посты во всех шардах."""
+        posts = self.create_posts(1)
+        Follow.objects.create(user=self.reader, author=self.authors[0])
+        Comment.objects.create(post=posts[1], author=self.authors[0],
+                               text='Ок')
+        self.authors[0].delete()
+        for alias in SHARDS:
+            self.assertFalse(Post.objects.using(alias).filter(
+                author_id=posts[0].author_id
+            ).exists())
+            self.assertFalse(Comment.objects.using(alias).exists())
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_background_group_deletion_reaches_shards(self):
+        posts = self.create_posts(1)
+        job = deletion.schedule(self.group)
+        job.refresh_from_db()
+        self.assertEqual(job.state, job.DONE)
+        for post in posts:
+            stored = Post.objects.using(shards.for_post(post.pk)).get(
+                pk=post.pk
+            )
+            self.assertIsNone(stored.group_id)
+            self.assertEqual(stored.version, post.version + 1)
+
+    def test_background_deletion_drops_post_keys(self):
+        """Ключи постов удаляются порциями вместе с постами."""
+        posts = self.create_posts(2)
+        deletion.schedule(posts[1])
+        self.assertFalse(PostKey.objects.filter(pk=posts[1].pk).exists())
+        # Ключи - отдельный шаг порциями, а не CASCADE от автора
+        self.assertIn(PostKey, deletion.deleted_models(self.authors[0]))
+        with override_settings(DELETION_BATCH_SIZE=1):
+            job = deletion.schedule(self.authors[0])
+        job.refresh_from_db()
+        self.assertEqual(job.state, job.DONE)
+        self.assertEqual(
+            set(PostKey.objects.values_list('author_id', flat=True)),
+            {self.authors[1].pk},
+        )
+
+    def test_reshard(self):
+        """reshard переносит посты из default, а после смены списка
+        шардов - между шардами."""
+        with override_settings(POST_SHARDS=[]):
+            posts = self.create_posts(2)
+            comment = Comment.objects.create(
+                post=posts[0], author=self.reader, text='Ок'
+            )
+        self.assertEqual(self.located(Post, DEFAULT_DB_ALIAS),
+                         {post.pk for post in posts})
+        for layout in (SHARDS, SHARDS[::-1]):
+            with self.subTest(layout=layout), override_settings(
+                POST_SHARDS=layout
+            ):
+                out = StringIO()
+                call_command('reshard', batch_size=1, stdout=out)
+                self.assertIn('Перенесено постов: 4', out.getvalue())
+                for post in posts:
+                    alias = shards.for_author(post.author_id)
+                    stored = Post.objects.using(alias).get(pk=post.pk)
+                    self.assertEqual(stored.pub_date, post.pub_date)
+                    self.assertEqual(shards.for_post(post.pk), alias)
+                self.assertEqual(
+                    self.located(Comment, shards.for_post(posts[0].pk)),
+                    {comment.pk},
+                )
+                self.assertEqual(SearchResults('Пост').count(), 4)
+                shards._authors.clear()
+        self.assertEqual(self.located(Post, DEFAULT_DB_ALIAS), set())
+        with override_settings(POST_SHARDS=SHARDS[::-1]):
+            # Новые id не совпадают с перенесёнными
+            new = Comment.objects.create(post=posts[0], author=self.reader,
+                                         text='Новый')
+        self.assertGreater(new.pk, comment.pk)
+
+    def test_reshard_refreshes_moved_author(self):
+        """После переноса счётчики, записи лент и кэш лент автора
+        освежены: сигналы при переносе не срабатывают."""
+        author = self.authors[0]
+        with override_settings(POST_SHARDS=[]):
+            Follow.objects.create(user=self.reader, author=author)
+            posts = self.create_posts(2)
+        # Счётчики и записи лент разошлись с данными
+        UserStats.objects.filter(user=author).update(posts_count=0)
+        Group.objects.filter(pk=self.group.pk).update(posts_count=0)
+        FeedEntry.objects.all().delete()
+        namespaces = ['index', f'profile:{author.username}',
+                      f'group:{self.group.slug}', f'follow:{self.reader.pk}']
+        before = feed_cache.generations(namespaces)
+        call_command('reshard', stdout=StringIO())
+        self.assertEqual(UserStats.objects.get(user=author).posts_count, 2)
+        self.assertEqual(Group.objects.get(pk=self.group.pk).posts_count, 4)
+        self.assertEqual(
+            set(FeedEntry.objects.values_list('post_id', flat=True)),
+            {post.pk for post in posts if post.author == author},
+        )
+        for namespace, old, new in zip(
+            namespaces, before, feed_cache.generations(namespaces)
+        ):
+            with self.subTest(namespace=namespace):
+                self.assertNotEqual(old, new)
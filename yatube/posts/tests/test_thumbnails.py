@@ -0,0 +1,152 @@
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import default
+
+from ..images import process_image, schedule
+from ..models import Post, User
+from ..thumbnails import (BASELINE, THUMBNAILS, make_thumbnails,
+                          ready_thumbnail, ready_variants)
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+PLACEHOLDER = 'Картинка обрабатывается'
+
+
+def image_file(name='photo.jpg', size=(200, 100)):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'blue').save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.autoriz_client = Client()
+        cls.autoriz_client.force_login(cls.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            author=self.user, text='Тестовый пост', image=image_file()
+        )
+
+    def test_placeholder_until_thumbnail_is_ready(self):
+        """Пока миниатюры нет, вместо неё заглушка, запрос её не делает."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.autoriz_client.get(url), PLACEHOLDER)
+        self.assertIsNone(ready_variants(self.post.image))
+        self.assertEqual(set(process_image(self.post.id)), set(THUMBNAILS))
+        thumbnail = ready_thumbnail(self.post.image, 'card-360-webp')
+        self.assertEqual((thumbnail.width, thumbnail.height), (360, 127))
+        self.assertTrue(thumbnail.name.endswith('.webp'))
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.autoriz_client.get(url)
+                self.assertNotContains(response, PLACEHOLDER)
+                self.assertContains(response, f'{thumbnail.url} 360w')
+                self.assertContains(response, 'loading="lazy"')
+
+    def test_feed_page_reads_thumbnails_at_once(self):
+        """Миниатюры всех карточек страницы читаются одним get_many."""
+        for i in range(3):
+            post = Post.objects.create(
+                author=self.user, text=f'Пост-{i}', image=image_file()
+            )
+            make_thumbnails(post.id)
+        make_thumbnails(self.post.id)
+        cache.clear()
+        kvstore = default.kvstore
+        with mock.patch.object(
+            kvstore, 'get_many', wraps=kvstore.get_many
+        ) as get_many, mock.patch.object(
+            kvstore, '_get_raw', side_effect=AssertionError
+        ):
+            response = self.autoriz_client.get(reverse('posts:index'))
+        get_many.assert_called_once()
+        self.assertNotContains(response, PLACEHOLDER)
+        self.assertContains(response, '<picture>', count=4)
+
+    @staticmethod
+    def scheduled(on_commit):
+        return [call[0][0] for call in on_commit.call_args_list
+                if getattr(call[0][0], 'func', None) is schedule]
+
+    def test_thumbnails_are_scheduled_after_commit(self):
+        """Новая картинка ставит пост в очередь после коммита."""
+        with mock.patch('posts.signals.transaction.on_commit') as on_commit:
+            self.post.text = 'Без новой картинки'
+            self.post.save()
+            self.assertEqual(self.scheduled(on_commit), [])
+            self.post.image = image_file('other.jpg', (300, 100))
+            self.post.save()
+        task, = self.scheduled(on_commit)
+        with override_settings(THUMBNAIL_WORKERS=0):
+            task()
+        self.assertIsNotNone(ready_variants(self.post.image))
+
+    def test_generate_thumbnails_in_batches(self):
+        """Команда проходит посты порциями по --batch-size."""
+        posts = [self.post] + [
+            Post.objects.create(author=self.user, text=f'Пост-{i}',
+                                image=image_file(size=(300 + i, 100)))
+            for i in range(2)
+        ]
+        out = StringIO()
+        call_command('generate_thumbnails', workers=1, batch_size=2,
+                     stdout=out)
+        self.assertIn('для 3 постов из 3', out.getvalue())
+        for post in posts:
+            self.assertIsNotNone(ready_variants(post.image))
+
+    def test_generate_thumbnails_command(self):
+        """Команда generate_thumbnails делает недостающие варианты
+        и считает экономию."""
+        Post.objects.create(author=self.user, text='Без картинки')
+        out = StringIO()
+        call_command('generate_thumbnails', workers=1, stdout=out)
+        self.assertIn('для 1 постов из 1', out.getvalue())
+        self.assertIn('card-360-webp: ', out.getvalue())
+        self.assertIn(f'против {BASELINE}', out.getvalue())
+        for name in THUMBNAILS:
+            self.assertIsNotNone(ready_thumbnail(self.post.image, name))
+        call_command('generate_thumbnails', workers=1, stdout=out)
+        self.assertIn('для 0 постов из 0', out.getvalue())
+        call_command('generate_thumbnails', workers=1, all=True, stdout=out)
+        self.assertIn('для 1 постов из 1', out.getvalue().splitlines()[-7])
+        self.assertIsNotNone(ready_variants(self.post.image))
+
+    def test_generate_thumbnails_in_batches(self):
+        """Команда проходит посты порциями по --batch-size."""
+        posts = [self.post] + [
+            Post.objects.create(author=self.user, text=f'Пост-{i}',
+                                image=image_file(size=(300 + i, 100)))
+            for i in range(2)
+        ]
+        out = StringIO()
+        call_command('generate_thumbnails', workers=1, batch_size=2,
+                     stdout=out)
+        self.assertIn('для 3 постов из 3', out.getvalue())
+        for post in posts:
+            self.assertIsNotNone(ready_variants(post.image))
@@ -4,10 +4,13 @@ import tempfile
 from django.core.cache import cache
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from ..models import Follow, Group, Post, User
+from ..models import Comment, Follow, Group, Post, User
+from . import run_on_commit
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -167,6 +170,8 @@ class ViewsTests(TestCase):
         self.assertEqual(image_in_fp, post.image)
 
     def test_cache(self):
+        '''Главная страница отдаётся из кэша, пока лента не менялась,
+        и обновляется сразу после удаления поста.'''
         Post.objects.all().delete()
         Post.objects.create(
             id=50,
@@ -174,9 +179,50 @@ class ViewsTests(TestCase):
             text='Тестовый пост',
         )
         response = self.autoriz_client.get(reverse('posts:index'))
-        Post.objects.filter(id=50).delete()
+        cached = self.autoriz_client.get(reverse('posts:index'))
+        self.assertIsNone(cached.context)
+        self.assertEqual(response.content, cached.content)
+        with run_on_commit():
+            Post.objects.filter(id=50).delete()
         response2 = self.autoriz_client.get(reverse('posts:index'))
-        self.assertEqual(response.content, response2.content)
+        self.assertNotEqual(response.content, response2.content)
+
+    def test_cache_is_per_viewer_and_page(self):
+        '''Кэш страниц различает гостя, пользователя и номер страницы.'''
+        cache.clear()
+        url = reverse('posts:index')
+        guest = self.guest_client.get(url)
+        user = self.autoriz_client.get(url)
+        self.assertNotEqual(guest.content, user.content)
+        self.assertIsNotNone(self.autoriz_client.get(url, {'page': 2}).context)
+        self.assertIsNone(self.guest_client.get(url).context)
+
+    def test_cache_of_profile_and_group(self):
+        '''Новый пост сразу виден в профиле и группе.'''
+        urls = [
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+        ]
+        for url in urls:
+            self.guest_client.get(url)
+        with run_on_commit():
+            Post.objects.create(
+                author=self.user, text='Свежий пост', group=self.group
+            )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), 'Свежий пост')
+
+    def test_follow_refreshes_follower_profile(self):
+        '''Подписка сразу видна в профиле подписчика.'''
+        url = reverse('posts:profile', kwargs={'username': self.user2})
+        self.assertContains(self.guest_client.get(url), 'подписок: 0')
+        with run_on_commit():
+            Follow.objects.create(author=self.user, user=self.user2)
+        self.assertContains(self.guest_client.get(url), 'подписок: 1')
+        with run_on_commit():
+            Follow.objects.all().delete()
+        self.assertContains(self.guest_client.get(url), 'подписок: 0')
 
     def test_follow_unfollow(self):
         '''
@@ -224,3 +270,57 @@ class ViewsTests(TestCase):
         self.assertEqual(context, list(Post.objects.filter(author=self.user)))
         self.assertNotEqual(context,
                             list(Post.objects.filter(author=self.user2)))
+
+
+class QueryCountTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='auth', first_name='Имя', last_name='Фамилия'
+        )
+        cls.reader = User.objects.create_user(username='reader')
+        cls.autoriz_client = Client()
+        cls.autoriz_client.force_login(cls.reader)
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(author=cls.user, user=cls.reader)
+        cls.post = Post.objects.create(
+            author=cls.user, text='Тестовый пост', group=cls.group
+        )
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.autoriz_client.get(url)
+        return len(queries)
+
+    def test_feed_queries_do_not_depend_on_page_size(self):
+        """Число запросов ленты не зависит от числа постов на странице."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:follow_index'),
+        ]
+        few = {url: self.count_queries(url) for url in urls}
+        for i in range(9):
+            author = User.objects.create_user(username=f'author-{i}')
+            Follow.objects.create(author=author, user=self.reader)
+            Post.objects.create(author=author, text='Пост', group=self.group)
+            Post.objects.create(author=self.user, text='Пост')
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), few[url])
+
+    def test_detail_queries_do_not_depend_on_comments(self):
+        """Число запросов страницы поста не зависит от комментариев."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        few = self.count_queries(url)
+        for i in range(5):
+            author = User.objects.create_user(username=f'commenter-{i}')
+            Comment.objects.create(post=self.post, author=author, text='Ок')
+        self.assertEqual(self.count_queries(url), few)
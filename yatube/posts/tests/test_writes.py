@@ -0,0 +1,163 @@
+import threading
+from concurrent.futures import Future
+from functools import partial
+from unittest import mock
+
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from .. import feed_cache, writes
+from ..models import Comment, Follow, Post, User
+
+
+class WriteQueueTests(TransactionTestCase):
+    # Тесты потока писателя включают очередь сами: под pytest её
+    # выключает conftest.
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.reader = User.objects.create_user(username='reader')
+        self.post = Post.objects.create(author=self.user, text='Пост')
+
+    def commit(self, *operations):
+        batch = [(Future(), partial(*operation), [DEFAULT_DB_ALIAS])
+                 for operation in operations]
+        with mock.patch.object(
+            connection, 'commit', wraps=connection.commit
+        ) as commit:
+            writes.WriteQueue()._commit(batch)
+        return [future for future, *_ in batch], commit.call_count
+
+    def test_batch_is_one_transaction(self):
+        """Накопленные записи коммитятся одной транзакцией."""
+        futures, commits = self.commit(
+            *[(writes.create_comment, self.post.id, self.reader.id, str(i))
+              for i in range(5)],
+            (writes.follow, self.reader.id, self.user.id),
+        )
+        self.assertEqual(commits, 1)
+        self.assertEqual(
+            [future.result().text for future in futures[:5]],
+            ['0', '1', '2', '3', '4'],
+        )
+        self.assertEqual(Comment.objects.filter(post=self.post).count(), 5)
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, author=self.user
+        ).exists())
+
+    def test_failed_write_does_not_roll_back_batch(self):
+        """Ошибка одной записи достаётся только её запросу."""
+        with self.assertLogs('posts.writes', 'WARNING'):
+            futures, _ = self.commit(
+                (writes.create_comment, self.post.id, self.reader.id, 'до'),
+                (writes.create_comment, self.post.id + 1, self.reader.id, 'х'),
+                (writes.create_comment, self.post.id, self.reader.id, 'ок'),
+            )
+        self.assertIsInstance(futures[1].exception(), IntegrityError)
+        self.assertEqual(
+            set(Comment.objects.values_list('text', flat=True)),
+            {'до', 'ок'},
+        )
+
+    def test_unfollow(self):
+        Follow.objects.create(user=self.reader, author=self.user)
+        self.commit((writes.unfollow, self.reader.id, self.user.id))
+        self.assertFalse(Follow.objects.exists())
+
+    @override_settings(WRITE_QUEUE_BATCH=50)
+    def test_failed_batch_keeps_thread(self):
+        """Сбой вне записей достаётся группе, поток пишет дальше."""
+        queue = writes.WriteQueue()
+        with mock.patch.object(
+            queue, '_commit', side_effect=[RuntimeError, None]
+        ) as commit, self.assertLogs('posts.writes', 'ERROR'):
+            with self.assertRaises(RuntimeError):
+                queue.submit(writes.follow, self.reader.id, self.user.id)
+        self.assertTrue(queue._thread.is_alive())
+        commit.side_effect = None
+        queue.submit(writes.follow, self.reader.id, self.user.id)
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, author=self.user
+        ).exists())
+
+    @override_settings(WRITE_QUEUE_BATCH=50)
+    def test_dead_thread_is_restarted(self):
+        queue = writes.WriteQueue()
+        queue._start()
+        dead = threading.Thread(target=lambda: None)
+        dead.start()
+        dead.join()
+        queue._thread = dead
+        queue.submit(writes.follow, self.reader.id, self.user.id)
+        self.assertIsNot(queue._thread, dead)
+        self.assertTrue(Follow.objects.exists())
+
+    @override_settings(WRITE_QUEUE_BATCH=50, WRITE_QUEUE_TIMEOUT=0.01)
+    def test_timeout_keeps_redirect(self):
+        """Не дождавшись коммита, view всё равно отвечает редиректом."""
+        queue = writes.WriteQueue()
+        release = threading.Event()
+        commit = queue._commit
+
+        def slow_commit(batch):
+            release.wait()
+            commit(batch)
+
+        client = Client()
+        client.force_login(self.reader)
+        with mock.patch.object(writes, 'submit', queue.submit), \
+                mock.patch.object(queue, '_commit', slow_commit), \
+                self.assertLogs('posts.writes', 'WARNING'):
+            response = client.post(
+                reverse('posts:add_comment',
+                        kwargs={'post_id': self.post.id}),
+                {'text': 'Комментарий'},
+            )
+        self.assertRedirects(
+            response, f'/posts/{self.post.id}/',
+            fetch_redirect_response=False,
+        )
+        release.set()
+        # Следующая запись коммитится не раньше отложенной
+        queue.submit(writes.unfollow, self.reader.id, self.user.id)
+        self.assertTrue(Comment.objects.filter(text='Комментарий').exists())
+
+    @override_settings(WRITE_QUEUE_BATCH=50)
+    def test_feeds_are_bumped_after_commit(self):
+        """Поколения лент меняются уже после коммита записи."""
+        bump = feed_cache.bump
+        in_transaction = []
+
+        def spy(*namespaces):
+            in_transaction.append(connection.in_atomic_block)
+            bump(*namespaces)
+
+        with mock.patch.object(feed_cache, 'bump', spy):
+            Post.objects.create(author=self.user, text='Ещё пост')
+            writes.submit(writes.follow, self.reader.id, self.user.id)
+            writes.submit(writes.unfollow, self.reader.id, self.user.id)
+        self.assertEqual(in_transaction, [False] * 3)
+
+    @override_settings(WRITE_QUEUE_BATCH=0)
+    def test_views_keep_redirects(self):
+        """Через очередь view отвечают так же, как раньше."""
+        client = Client()
+        client.force_login(self.reader)
+        response = client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+            {'text': 'Комментарий'},
+        )
+        comment = Comment.objects.get()
+        self.assertRedirects(
+            response,
+            f'/posts/{self.post.id}/#comment-{comment.id}',
+            fetch_redirect_response=False,
+        )
+        response = client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.user.username}
+        ))
+        self.assertTrue(response.context['following'])
+        response = client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.user.username}
+        ))
+        self.assertFalse(response.context['following'])
@@ -1,66 +1,158 @@
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, render, redirect
-from django.views.decorators.cache import cache_page
+from django.urls import reverse
 
-from .forms import CommentForm, PostForm
-from .models import Comment, Follow, Group, Post, User
+from core.routers import writes_primary
+
+from . import shards, writes
+from .cards import post_cards
+from .comments import comments_page, page_cursor
+from .counters import user_stats
+from .feed_cache import cache_feed, cached_count
+from .feeds import follow_feed
+from .forms import CommentForm, PostForm, SearchForm
+from .models import Follow, Group, Post, User
+from .paginators import CursorPaginator
+from .search import SearchResults
+from .thumbnails import attach_variants
 
 
 POSTS_PER_PAGE = 10
+FOLLOW_COUNT_TIMEOUT = 60
+
+
+def page_obj(request, contents, count=None):
+    return CursorPaginator(contents, POSTS_PER_PAGE, count=count).get_page(
+        request.GET.get('page'),
+        request.GET.get('cursor'),
+    )
 
 
-def page_obj(request, contents):
-    return Paginator(contents,
-                     POSTS_PER_PAGE).get_page(request.GET.get('page'))
+def feed_context(request, contents, count=None, **card_options):
+    page = page_obj(request, contents, count)
+    return {
+        'page_obj': page,
+        'cards': post_cards(page.object_list, **card_options),
+    }
 
 
-@cache_page(15)
+@cache_feed('index')
 def index(request):
-    return render(request, 'posts/index.html', {
-        'page_obj': page_obj(request, Post.objects.all()),
-    })
+    posts = Post.objects.for_feed()
+    return render(
+        request,
+        'posts/index.html',
+        feed_context(
+            request, shards.feed(posts), cached_count('index', posts)
+        ),
+    )
 
 
+@cache_feed('group:{slug}')
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
     return render(request, 'posts/group_list.html', {
         'group': group,
-        'page_obj': page_obj(request, group.posts.all()),
+        **feed_context(
+            request, shards.feed(group.posts.for_feed()), group.posts_count,
+            show_group=False,
+        ),
     })
 
 
+@cache_feed('profile:{username}')
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
     following = request.user.is_authenticated and Follow.objects.filter(
         author=author,
         user=request.user
     ).exists()
-    return render(request, 'posts/profile.html', {
+    return render(request, 'posts/profile.html', profile_context(
+        request, author, following
+    ))
+
+
+def profile_context(request, author, following):
+    stats = user_stats(author)
+    return {
         'author': author,
+        'stats': stats,
         'following': following,
-        'page_obj': page_obj(request, author.posts.all()),
-    })
+        **feed_context(
+            request, author.posts.for_feed(), stats.posts_count,
+            show_author=False,
+        ),
+    }
 
 
 def post_detail(request, post_id):
     post = get_object_or_404(
-        Post.objects.select_related(
-            'author',
-            'group'
-        ), id=post_id
+        Post.objects.using(shards.for_post(post_id)).for_detail(), id=post_id
+    )
+    attach_variants([post])
+    comments, next_cursor = comments_page(
+        post.id, request.GET.get('comments')
     )
-    comments = Comment.objects.filter(post=post)
     form = CommentForm()
     context = {
         'post': post,
+        'author_stats': user_stats(post.author),
         'form': form,
         'comments': comments,
+        'next_cursor': next_cursor,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    # Следующая порция комментариев без страницы поста вокруг
+    post = get_object_or_404(
+        Post.objects.using(shards.for_post(post_id)).only('id'), id=post_id
+    )
+    comments, next_cursor = comments_page(
+        post.id, request.GET.get('comments')
+    )
+    return render(request, 'posts/includes/comments.html', {
+        'post': post,
+        'comments': comments,
+        'next_cursor': next_cursor,
+    })
+
+
+def search(request):
+    form = SearchForm(request.GET or None)
+    context = {'form': form}
+    if form.is_valid():
+        data = form.cleaned_data
+        author_id = None
+        if data['author']:
+            # Неизвестный автор - пустая выдача, а не поиск без фильтра
+            author_id = User.objects.filter(
+                username=data['author']
+            ).values_list('id', flat=True).first() or 0
+        results = SearchResults(
+            data['q'],
+            group_id=data['group'] and data['group'].pk,
+            author_id=author_id,
+        )
+        page = Paginator(results, POSTS_PER_PAGE).get_page(
+            request.GET.get('page')
+        )
+        query = request.GET.copy()
+        query.pop('page', None)
+        context.update({
+            'page_obj': page,
+            'results': zip(page.object_list, post_cards(page.object_list)),
+            'query': query.urlencode(),
+        })
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
+@writes_primary
 def post_create(request):
     post_form = PostForm(
         request.POST or None,
@@ -75,8 +167,11 @@ def post_create(request):
 
 
 @login_required
+@writes_primary
 def post_edit(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(
+        Post.objects.using(shards.for_post(post_id)), id=post_id
+    )
     if request.user != post.author:
         return redirect('posts:post_detail', post_id)
     post_form = PostForm(
@@ -94,60 +189,63 @@ def post_edit(request, post_id):
 
 
 @login_required
+@writes_primary
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    using = shards.for_post(post_id)
+    post = get_object_or_404(Post.objects.using(using), id=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
-        comment = form.save(commit=False)
-        comment.author = request.user
-        comment.post = post
-        comment.save()
+        comment = writes.submit(
+            writes.create_comment, post.id, request.user.id,
+            form.cleaned_data['text'], using=using,
+        )
+        if comment is None:
+            # Запись ещё в очереди: якоря на комментарий пока нет
+            return redirect('posts:post_detail', post_id=post_id)
+        # Открываем порцию комментариев, в которой виден новый
+        url = reverse('posts:post_detail', kwargs={'post_id': post_id})
+        cursor = page_cursor(comment)
+        if cursor:
+            url += f'?comments={cursor}'
+        return redirect(f'{url}#comment-{comment.id}')
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
-    post = Post.objects.filter(author__following__user=request.user)
-    return render(request, 'posts/follow.html', {
-        'page_obj': page_obj(request, post),
-    })
+    posts = follow_feed(request.user)
+    count = cached_count(
+        f'follow:{request.user.pk}', posts, FOLLOW_COUNT_TIMEOUT
+    )
+    return render(
+        request,
+        'posts/follow.html',
+        feed_context(request, posts, count),
+    )
 
 
 @login_required
+@writes_primary
 def profile_follow(request, username):
     # Подписаться на автора
     author_object = get_object_or_404(User, username=username)
-    context = {
-        'following': Follow.objects.filter(
-            author=author_object,
-            user=request.user
-        ),
-        'author': author_object,
-        'page_obj': page_obj(request, author_object.posts.all()),
-    }
-    if request.user == author_object:
-        return render(request, 'posts/profile.html', context)
-    Follow.objects.get_or_create(
-        author=author_object,
-        user=request.user
-    )
-    return render(request, 'posts/profile.html', context)
+    if request.user != author_object:
+        writes.submit(writes.follow, request.user.id, author_object.id)
+    return render(request, 'posts/profile.html', profile_context(
+        request,
+        author_object,
+        Follow.objects.filter(author=author_object, user=request.user),
+    ))
 
 
 @login_required
+@writes_primary
 def profile_unfollow(request, username):
     # Дизлайк, отписка
     author_object = get_object_or_404(User, username=username)
-    context = {
-        'following': Follow.objects.filter(
-            author=author_object,
-            user=request.user
-        ),
-        'author': author_object,
-        'page_obj': page_obj(request, author_object.posts.all()),
-    }
-    Follow.objects.filter(
-        author=author_object,
-        user=request.user
-    ).delete()
-    return render(request, 'posts/profile.html', context)
+    writes.submit(writes.unfollow, request.user.id, author_object.id)
+    return render(request, 'posts/profile.html', profile_context(
+        request,
+        author_object,
+        Follow.objects.filter(author=author_object, user=request.user),
+    ))
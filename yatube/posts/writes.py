@@ -0,0 +1,162 @@
+"""Очередь мелких записей: комментарии и подписки.
+
+SQLite пускает одного писателя за раз, и каждый запрос, который сам
+берёт блокировку записи, ждёт остальных. Здесь записи процесса делает
+один поток: всё, что накопилось в очереди, он выполняет в одной
+транзакции (group commit), а запрос ждёт коммита своей записи - после
+возврата из submit запись уже видна его же чтениям.
+"""
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError
+from contextlib import ExitStack, contextmanager
+from functools import partial
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from core.routers import note_write
+
+from .models import Comment, Follow
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _atomic(aliases):
+    with ExitStack() as stack:
+        for alias in aliases:
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+
+
+def _aliases(using):
+    # Счётчики всегда в default, комментарий - ещё и в шарде поста
+    return list(dict.fromkeys((DEFAULT_DB_ALIAS, using or DEFAULT_DB_ALIAS)))
+
+
+class WriteQueue:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+        self._thread = None
+
+    def _inline(self, aliases):
+        # Незакоммиченные данные открытой транзакции видны только ей
+        return not settings.WRITE_QUEUE_BATCH or any(
+            connections[alias].in_atomic_block for alias in aliases
+        )
+
+    def _start(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # После fork поток писателя остался в родителе
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = None
+            if self._thread is None or not self._thread.is_alive():
+                # Записи, накопленные упавшим потоком, дождутся нового
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._queue,),
+                    name='write-queue', daemon=True,
+                )
+                self._thread.start()
+            return self._queue
+
+    def submit(self, func, *args, using=None, **kwargs):
+        """Выполняет func в потоке писателя и возвращает её результат
+        после коммита транзакции, в которую она попала.
+
+        using - база записи, кроме default. Если коммита нет дольше
+        WRITE_QUEUE_TIMEOUT, возвращает None: запись остаётся в очереди.
+        """
+        note_write()
+        write = partial(func, *args, **kwargs)
+        aliases = _aliases(using)
+        if self._inline(aliases):
+            with _atomic(aliases):
+                return write()
+        future = Future()
+        self._start().put((future, write, aliases))
+        try:
+            return future.result(timeout=settings.WRITE_QUEUE_TIMEOUT)
+        except TimeoutError:
+            logger.warning('Запись %s не дождалась коммита', func.__name__)
+            return None
+
+    def _run(self, writes):
+        while True:
+            batch = [writes.get()]
+            try:
+                while len(batch) < settings.WRITE_QUEUE_BATCH:
+                    try:
+                        batch.append(writes.get_nowait())
+                    except queue.Empty:
+                        break
+                for conn in connections.all():
+                    conn.close_if_unusable_or_obsolete()
+                self._commit(batch)
+            except Exception as error:
+                # Поток должен пережить сбой: иначе очередь встанет
+                logger.exception('Группа из %s не записалась', len(batch))
+                for future, *_ in batch:
+                    if not future.done():
+                        future.set_exception(error)
+
+    def _commit(self, batch):
+        try:
+            outcomes = self._apply(batch)
+        except Exception:
+            # SQLite проверяет внешние ключи при коммите, и одна плохая
+            # запись роняет всю группу: тогда пишем по одной.
+            logger.warning('Группа из %s не записалась, пишем по одной',
+                           len(batch), exc_info=True)
+            outcomes = []
+            for write in batch:
+                try:
+                    outcomes.extend(self._apply([write]))
+                except Exception as error:
+                    outcomes.append((write[0], None, error))
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _apply(self, batch):
+        outcomes = []
+        # Транзакции только в тех базах, куда пишет группа
+        aliases = list(dict.fromkeys(
+            alias for *_, write_aliases in batch for alias in write_aliases
+        ))
+        with _atomic(aliases):
+            for future, write, write_aliases in batch:
+                # Своя точка сохранения: ошибка одной записи
+                # не откатывает остальные.
+                try:
+                    with _atomic(write_aliases):
+                        outcomes.append((future, write(), None))
+                except Exception as error:
+                    outcomes.append((future, None, error))
+        return outcomes
+
+
+_writes = WriteQueue()
+submit = _writes.submit
+
+
+def create_comment(post_id, author_id, text):
+    return Comment.objects.create(
+        post_id=post_id, author_id=author_id, text=text
+    )
+
+
+def follow(user_id, author_id):
+    return Follow.objects.get_or_create(user_id=user_id, author_id=author_id)
+
+
+def unfollow(user_id, author_id):
+    return Follow.objects.filter(user_id=user_id, author_id=author_id).delete()
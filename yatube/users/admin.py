@@ -1 +1,19 @@
-# Register your models here.
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.admin import UserAdmin
+
+from core.admin import PrefixSearchMixin
+from posts.admin import BackgroundDeletionMixin
+
+User = get_user_model()
+
+
+class PrefixSearchUserAdmin(BackgroundDeletionMixin, PrefixSearchMixin,
+                            UserAdmin):
+    # По нему ищут и автокомплиты связей с пользователем
+    search_fields = ('^username',)
+    show_full_result_count = False
+
+
+admin.site.unregister(User)
+admin.site.register(User, PrefixSearchUserAdmin)
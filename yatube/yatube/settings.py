@@ -38,11 +38,64 @@ ALLOWED_HOSTS = [
     'testserver'
 ]
 
+# Кэш двухуровневый, см. core.cache: LRU в памяти процесса перед общим
+# для всех рабочих процессов хранилищем 'shared' - файлом SQLite. На
+# нескольких машинах 'shared' - сервер: memcached.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': 'default',
+        'OPTIONS': {
+            'L2': 'shared',
+            'MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 60,
+            'INVALIDATION_INTERVAL': 1,
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
 }
+# Страницы лент живут в кэше до записи в ленту, см. posts.feed_cache
+FEED_CACHE_TIMEOUT = 60 * 60
+# Лента подписок: посты авторов, у которых подписчиков больше
+# FEED_FANOUT_LIMIT, не раздаются по лентам, а подмешиваются при чтении.
+FEED_FANOUT_LIMIT = 1000
+FEED_BACKFILL_SIZE = 200
+# Миниатюры картинок постов делаются после сохранения в пуле из стольких
+# потоков, 0 - сразу в том же потоке.
+THUMBNAIL_WORKERS = 2
+# Хранилище sorl-thumbnail с чтением миниатюр целой страницы разом
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+# Загрузки больше этого пишутся во временный файл, а не в память
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+# Картинки постов: предел по заголовку в пикселях и наибольшая сторона,
+# до которой оригинал уменьшается в фоне.
+POST_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+POST_IMAGE_MAX_SIDE = 2560
+# Медиа отдаёт core.media.serve. Файлы с хэшем в имени кэшируются
+# клиентами на MEDIA_MAX_AGE секунд. MEDIA_SENDFILE - 'x-sendfile'
+# (Apache, lighttpd) или 'x-accel-redirect' (nginx, внутренний location
+# с префиксом MEDIA_ACCEL_REDIRECT_PREFIX): тогда файл передаёт фронтовой
+# сервер, а не рабочий процесс WSGI.
+MEDIA_MAX_AGE = 60 * 60 * 24 * 365
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+# Пользователи, посты и группы удаляются в фоне порциями по столько
+# строк, каждая порция - в своей короткой транзакции.
+DELETION_BATCH_SIZE = 500
+# False - удалять сразу после коммита в том же потоке, без фонового
+DELETION_IN_BACKGROUND = True
+# Комментарии и подписки пишет один поток процесса: до стольких записей
+# в одной транзакции (0 - писать прямо в запросе). Запрос ждёт коммита
+# своей записи не дольше WRITE_QUEUE_TIMEOUT секунд.
+WRITE_QUEUE_BATCH = 50
+WRITE_QUEUE_TIMEOUT = 10
+# Заголовок Server-Timing с замерами core.timing в ответах; строка
+# в лог core.timing пишется и без него.
+SERVER_TIMING_HEADER = True
 # Application definition
 
 INSTALLED_APPS = [
@@ -61,7 +114,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.timing.TimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.routers.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -75,7 +130,7 @@ ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.templates.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -100,8 +155,35 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Соединение переживает запрос: PRAGMA и кэш страниц SQLite
+        # не пропадают на каждом запросе.
+        'CONN_MAX_AGE': 60,
     }
 }
+# Псевдонимы реплик из DATABASES - копий default. Чтения моделей из
+# REPLICA_READ_APPS в запросах на чтение идут на случайную из них;
+# после записи пользователь REPLICA_STICKY_SECONDS секунд читает default.
+DATABASE_REPLICAS = []
+REPLICA_READ_APPS = ['posts']
+REPLICA_STICKY_SECONDS = 10
+# Псевдонимы баз из DATABASES, по которым посты и комментарии
+# раскладываются по автору, см. posts.shards. Пусто - всё в default.
+POST_SHARDS = []
+DATABASE_ROUTERS = [
+    'posts.shards.ShardRouter',
+    'core.routers.PrimaryReplicaRouter',
+]
+# Применяются к каждому новому соединению с SQLite, см. core.sqlite.
+# WAL: читатели не ждут писателя; busy_timeout - сколько миллисекунд
+# ждать блокировку вместо «database is locked»; cache_size < 0 - в КиБ.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'memory',
+}
 
 
 # Password validation